@@ -1,9 +1,10 @@
+import asyncio
 import os
 from contextlib import asynccontextmanager
-from decimal import Decimal
+from datetime import date, datetime, timedelta, timezone
 
 from dotenv import load_dotenv
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -16,22 +17,30 @@ from telegram.ext import (
     filters,
 )
 
+import food_spool
+import stats
+import user_cache
+from partitions import run_maintenance
+from records import Profile
 from users_db import (
     DatabaseNotConfigured,
+    close_pool,
     database_config_error,
-    ensure_user,
-    get_food_logs,
-    get_profile,
-    get_user,
     init_db,
     log_database_environment_diagnostics,
-    update_user,
 )
+from users_db_async import close_pool as close_async_pool
+from users_db_async import get_daily_totals, get_history, update_user
+from services import ai_gateway
 from services.access import has_pro
 from services.ai import generate_text
 from handlers.menu import main_menu, pro_menu
+from handlers.user_context import user_context
 from handlers.voice import smart_reply
 from handlers.promo import apply_promo_code
+from handlers.find import find_callback, find_command
+from handlers.export import export_command
+from handlers.reports import month_command, week_command
 from handlers.payments import buy_pro, pre_checkout_query, successful_payment
 from handlers.media import food_action_callback, handle_pending_food_text, handle_photo, handle_voice
 from handlers.onboarding import (
@@ -60,14 +69,17 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 WAIT_PROMO = "WAIT_PROMO"
+HISTORY_ITEMS = 20
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DB_MAINTENANCE_INTERVAL = 6 * 60 * 60
+FOOD_SPOOL_REPLAY_INTERVAL = float(os.getenv("FOOD_SPOOL_REPLAY_INTERVAL", "15"))
+STATS_REFRESH_INTERVAL = float(os.getenv("STATS_REFRESH_INTERVAL", "300"))
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    ensure_user(user_id, update.effective_user)
-    profile = get_profile(user_id)
+    profile = (await user_context(update, context))["profile"]
 
-    if not profile or not profile.get("onboarding_completed"):
+    if not profile or not profile.onboarding_completed:
         await update.message.reply_text(
             "Привет. Я помогу считать еду по фото, голосу и тексту.\n"
             "Сначала заполним профиль для твоей дневной нормы."
@@ -83,8 +95,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_user(update.effective_user.id, update.effective_user)
-    await update.message.reply_text(today_text(update.effective_user.id))
+    ctx = await user_context(update, context)
+    await update.message.reply_text(await today_text(update.effective_user.id, ctx["profile"]))
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -93,6 +105,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/profile — профиль и дневная норма\n"
         "/today — итоги за сегодня\n"
         "/history — история: Free сегодня, PRO 30 дней\n"
+        "/week, /month — средние, серии и лучшие дни, PRO\n"
+        "/find — поиск по дневнику, например /find гречка\n"
+        "/export — выгрузка дневника в CSV (/export json — в JSON), PRO\n"
         "/pay — оплата PRO\n"
         "/help — помощь\n\n"
         "После фото доступны кнопки: сохранить, исправить, изменить порцию, не сохранять, сегодня."
@@ -113,17 +128,25 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 
 
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_user(update.effective_user.id, update.effective_user)
-    await update.message.reply_text(today_text(update.effective_user.id))
+    ctx = await user_context(update, context)
+    await update.message.reply_text(await today_text(update.effective_user.id, ctx["profile"]))
 
 
 async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    ensure_user(user_id, update.effective_user)
-    user = get_user(user_id)
-    days = 30 if has_pro(user) else 1
-    title = "История за 30 дней" if days == 30 else "История Free: только сегодня"
-    await update.message.reply_text(history_text(user_id, days=days, title=title))
+    ctx = await user_context(update, context)
+    text, markup = await history_page(update.effective_user.id, ctx)
+    await update.message.reply_text(text, reply_markup=markup)
+
+
+async def history_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # food:hist:<older|newer>:<log_date as a day ordinal>:<eaten_at in µs since the epoch>:<id>
+    query = update.callback_query
+    await query.answer()
+    _, _, direction, day, eaten_us, log_id = query.data.split(":")
+    cursor = (date.fromordinal(int(day)), _EPOCH + timedelta(microseconds=int(eaten_us)), int(log_id))
+    ctx = await user_context(update, context)
+    text, markup = await history_page(update.effective_user.id, ctx, cursor, direction)
+    await query.edit_message_text(text, reply_markup=markup)
 
 
 async def pay_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -132,15 +155,15 @@ async def pay_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    ensure_user(user_id, update.effective_user)
+    await user_context(update, context)
     text = update.message.text
 
     if "Голосовой" in text:
-        update_user(user_id, "mode", "voice")
+        await update_user(user_id, "mode", "voice")
         await update.message.reply_text("🎙 Голосовой режим включён.", reply_markup=main_menu())
 
     elif "Текстовый" in text:
-        update_user(user_id, "mode", "text")
+        await update_user(user_id, "mode", "text")
         await update.message.reply_text("💬 Текстовый режим включён.", reply_markup=main_menu())
 
 
@@ -159,7 +182,7 @@ async def ask_promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    ensure_user(user_id, update.effective_user)
+    await user_context(update, context)
 
     if await handle_pending_food_text(update, context):
         return
@@ -167,69 +190,133 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get(WAIT_PROMO):
         context.user_data[WAIT_PROMO] = False
         code = (update.message.text or "").strip()
-        ok, msg = apply_promo_code(user_id, code)
+        ok, msg = await apply_promo_code(user_id, code)
         await update.message.reply_text(msg, reply_markup=main_menu())
         return
 
     user_text = update.message.text or ""
-    answer = generate_text(user_id, user_text)
+    answer = await generate_text(user_id, user_text)
     await smart_reply(update, context, answer)
 
 
-def today_text(user_id: int) -> str:
-    profile = get_profile(user_id)
-    logs = get_food_logs(user_id, days=1)
-    return _logs_summary("📊 Сегодня", logs, profile)
+async def today_text(user_id: int, profile: Profile | None) -> str:
+    totals = await get_daily_totals(user_id)
+    return "\n".join(_totals_lines("📊 Сегодня", totals, profile))
 
 
-def history_text(user_id: int, days: int, title: str) -> str:
-    logs = get_food_logs(user_id, days=days)
-    return _logs_summary(title, logs, get_profile(user_id), include_items=True)
+async def history_page(
+    user_id: int, ctx: dict, cursor: tuple[date, datetime, int] | None = None, direction: str | None = None
+) -> tuple[str, InlineKeyboardMarkup | None]:
+    days = 30 if has_pro(ctx["user"]) else 1
+    title = "История за 30 дней" if days == 30 else "История Free: только сегодня"
+    history = await get_history(user_id, days=days, limit=HISTORY_ITEMS, cursor=cursor, direction=direction)
+    text = _logs_summary(title, history["totals"], history["items"], ctx["profile"])
 
+    buttons = []
+    if history["items"] and history["has_newer"]:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=_history_callback_data("newer", history["items"][0])))
+    if history["items"] and history["has_older"]:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=_history_callback_data("older", history["items"][-1])))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
 
-def _logs_summary(title: str, logs: list[dict], profile: dict | None, include_items: bool = True) -> str:
-    totals = {
-        "calories": sum(_num(row.get("calories")) for row in logs),
-        "protein": sum(_num(row.get("protein")) for row in logs),
-        "fat": sum(_num(row.get("fat")) for row in logs),
-        "carbs": sum(_num(row.get("carbs")) for row in logs),
-    }
-    lines = [title, ""]
-    lines.append(f"Ккал: {totals['calories']:.0f}" + _target(profile, "daily_calories"))
-    lines.append(f"Белки: {totals['protein']:.0f} г" + _target(profile, "daily_protein"))
-    lines.append(f"Жиры: {totals['fat']:.0f} г" + _target(profile, "daily_fat"))
-    lines.append(f"Углеводы: {totals['carbs']:.0f} г" + _target(profile, "daily_carbs"))
+
+def _history_callback_data(direction: str, item: dict) -> str:
+    eaten_us = (item["eaten_at"] - _EPOCH) // timedelta(microseconds=1)
+    return f"food:hist:{direction}:{item['log_date'].toordinal()}:{eaten_us}:{item['id']}"
+
+
+def _logs_summary(title: str, totals: dict, logs: list[dict], profile: Profile | None, include_items: bool = True) -> str:
+    lines = _totals_lines(title, totals, profile)
 
     if include_items:
         lines.append("")
         if not logs:
             lines.append("Записей пока нет.")
         else:
-            for row in logs[:20]:
+            for row in logs:
                 lines.append(
-                    f"• {row.get('log_date')}: {row.get('dish_name')} — "
-                    f"{_num(row.get('calories')):.0f} ккал, Б{_num(row.get('protein')):.0f}/Ж{_num(row.get('fat')):.0f}/У{_num(row.get('carbs')):.0f}"
+                    f"• {row['log_date']}: {row['dish_name']} — "
+                    f"{row['calories']:.0f} ккал, Б{row['protein']:.0f}/Ж{row['fat']:.0f}/У{row['carbs']:.0f}"
                 )
     return "\n".join(lines)
 
 
-def _num(value) -> float:
-    if isinstance(value, Decimal):
-        return float(value)
-    return float(value or 0)
+def _totals_lines(title: str, totals: dict, profile: Profile | None) -> list[str]:
+    return [
+        title,
+        "",
+        f"Ккал: {totals['calories']:.0f}" + _target(profile, "daily_calories"),
+        f"Белки: {totals['protein']:.0f} г" + _target(profile, "daily_protein"),
+        f"Жиры: {totals['fat']:.0f} г" + _target(profile, "daily_fat"),
+        f"Углеводы: {totals['carbs']:.0f} г" + _target(profile, "daily_carbs"),
+    ]
 
 
-def _target(profile: dict | None, key: str) -> str:
-    if not profile or profile.get(key) is None:
+def _target(profile: Profile | None, key: str) -> str:
+    value = getattr(profile, key) if profile else None
+    if value is None:
         return ""
-    return f" / {float(profile[key]):.0f}"
+    return f" / {value:.0f}"
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def _db_maintenance_loop() -> None:
+    # Creates upcoming food_logs partitions and applies retention. Idempotent,
+    # so every replica can run it.
+    while True:
+        try:
+            print(f"DB maintenance: {await asyncio.to_thread(run_maintenance)}")
+        except Exception as exc:
+            print(f"DB maintenance failed: {exc}")
+        await asyncio.sleep(DB_MAINTENANCE_INTERVAL)
+
+
+async def _food_spool_loop() -> None:
+    # Replays meals saved while Postgres was unreachable (see food_spool).
+    while True:
+        try:
+            if food_spool.stats()["pending"]:
+                print(f"Food spool: replayed {await asyncio.to_thread(food_spool.replay)}")
+        except Exception as exc:
+            print(f"Food spool replay failed: {exc}")
+        await asyncio.sleep(FOOD_SPOOL_REPLAY_INTERVAL)
+
+
+async def _stats_refresh_loop() -> None:
+    # Folds new rows into the /admin/stats rollups. Replicas take turns on an
+    # advisory lock, so running it everywhere is safe.
+    while True:
+        try:
+            await asyncio.to_thread(stats.refresh)
+        except Exception as exc:
+            print(f"Stats refresh failed: {exc}")
+        await asyncio.sleep(STATS_REFRESH_INTERVAL)
+
+
+async def _on_startup(application: Application) -> None:
+    if database_config_error() is None:
+        _background_tasks.add(asyncio.create_task(_db_maintenance_loop()))
+        _background_tasks.add(asyncio.create_task(_food_spool_loop()))
+        _background_tasks.add(asyncio.create_task(_stats_refresh_loop()))
+
+
+async def _on_shutdown(application: Application) -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await close_async_pool()
+    close_pool()
+    await ai_gateway.client.close()
 
 
 def build_application() -> Application:
     if not BOT_TOKEN:
         raise RuntimeError("BOT_TOKEN is required")
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = ApplicationBuilder().token(BOT_TOKEN).post_init(_on_startup).post_shutdown(_on_shutdown).build()
     app.add_error_handler(error_handler)
 
     onboarding = ConversationHandler(
@@ -251,9 +338,15 @@ def build_application() -> Application:
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("today", today_command))
     app.add_handler(CommandHandler("history", history_command))
+    app.add_handler(CommandHandler("week", week_command))
+    app.add_handler(CommandHandler("month", month_command))
+    app.add_handler(CommandHandler("find", find_command))
+    app.add_handler(CommandHandler("export", export_command))
     app.add_handler(CommandHandler("pay", pay_command))
 
+    app.add_handler(CallbackQueryHandler(history_callback, pattern="^food:hist:"))
     app.add_handler(CallbackQueryHandler(food_action_callback, pattern="^food:"))
+    app.add_handler(CallbackQueryHandler(find_callback, pattern="^find:"))
     app.add_handler(MessageHandler(filters.VOICE, handle_voice))
     app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
 
@@ -274,7 +367,7 @@ def run_polling(application: Application) -> None:
 
 
 def create_fastapi_app(application: Application):
-    from fastapi import FastAPI, Request
+    from fastapi import FastAPI, Header, HTTPException, Request
     webhook_path = os.getenv("WEBHOOK_PATH", "/webhook")
     public_url = os.getenv("PUBLIC_URL")
     if not public_url:
@@ -286,17 +379,33 @@ def create_fastapi_app(application: Application):
         await application.initialize()
         await application.bot.set_webhook(webhook_url)
         await application.start()
+        await _on_startup(application)
         yield
         await application.stop()
         await application.bot.delete_webhook()
         await application.shutdown()
+        await _on_shutdown(application)
 
     api = FastAPI(lifespan=lifespan)
 
     @api.get("/health")
     async def health():
         db_error = database_config_error()
-        return {"status": "ok" if not db_error else "degraded", "database_configured": db_error is None, "database_error": db_error}
+        return {
+            "status": "ok" if not db_error else "degraded",
+            "database_configured": db_error is None,
+            "database_error": db_error,
+            "user_cache": user_cache.contexts.stats(),
+            "food_spool": food_spool.stats(),
+        }
+
+    @api.get("/admin/stats")
+    async def admin_stats(days: int = 30, authorization: str | None = Header(default=None)):
+        if not stats.authorized(authorization):
+            raise HTTPException(status_code=401, detail="unauthorized")
+        if database_config_error() is not None:
+            raise HTTPException(status_code=503, detail="database is not configured")
+        return await stats.load_stats(days)
 
     @api.post(webhook_path)
     async def telegram_webhook(request: Request):
@@ -320,14 +429,17 @@ def main():
     application = build_application()
     mode = os.getenv("BOT_MODE", "polling").lower()
 
-    if mode == "webhook":
-        import uvicorn
+    try:
+        if mode == "webhook":
+            import uvicorn
 
-        port = int(os.getenv("PORT", "8080"))
-        uvicorn.run(create_fastapi_app(application), host="0.0.0.0", port=port)
-        return
+            port = int(os.getenv("PORT", "8080"))
+            uvicorn.run(create_fastapi_app(application), host="0.0.0.0", port=port)
+            return
 
-    run_polling(application)
+        run_polling(application)
+    finally:
+        close_pool()
 
 
 if __name__ == "__main__":
@@ -1,9 +1,6 @@
-import os
-from openai import OpenAI
+from services.ai_gateway import call, client
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def coach_chat(user_message: str) -> str:
+async def coach_chat(user_message: str) -> str:
     """
     Чат с коучем по питанию / дисциплине
     """
@@ -16,7 +13,9 @@ def coach_chat(user_message: str) -> str:
     """
 
     try:
-        response = client.chat.completions.create(
+        response = await call(
+            "chat",
+            client.chat.completions.create,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
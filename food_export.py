@@ -0,0 +1,80 @@
+import argparse
+import gzip
+import json
+import sys
+from typing import BinaryIO
+
+from users_db import _INTERNAL_ID_SUBQUERY, get_read_conn
+
+# A user's food diary as gzip-compressed CSV or JSON lines. Rows are streamed
+# from Postgres (COPY for CSV, a server-side cursor for JSON) and compressed
+# chunk by chunk into a file object, so memory use does not grow with history.
+
+FORMATS = ("csv", "jsonl")
+
+_COLUMNS = ("id", "eaten_at", "log_date", "dish_name", "calories", "protein", "fat", "carbs", "source")
+
+_EXPORT_SQL = f"""
+    SELECT {", ".join(_COLUMNS)}
+    FROM food_logs
+    WHERE user_id = {_INTERNAL_ID_SUBQUERY}
+    ORDER BY eaten_at, id
+"""
+
+_JSON_BATCH_SIZE = 1000
+
+
+def filename(user_id: int, fmt: str) -> str:
+    return f"food_diary_{user_id}.{fmt}.gz"
+
+
+def export_food_logs(user_id: int, out: BinaryIO, fmt: str = "csv") -> int:
+    """Write the user's meals to out as gzip-compressed fmt; returns the row count."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6) as gz, get_read_conn(user_id) as conn:
+        if fmt == "csv":
+            return _copy_csv(conn, user_id, gz)
+        return _write_jsonl(conn, user_id, gz)
+
+
+def _copy_csv(conn, user_id: int, gz: gzip.GzipFile) -> int:
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY ({_EXPORT_SQL}) TO STDOUT WITH (FORMAT csv, HEADER)", {"telegram_id": user_id}) as copy:
+            for block in copy:
+                gz.write(block)
+        return max(cur.rowcount, 0)
+
+
+def _write_jsonl(conn, user_id: int, gz: gzip.GzipFile) -> int:
+    count = 0
+    # Named cursors only live inside a transaction; pool connections are autocommit.
+    with conn.transaction(), conn.cursor(name=f"food_export_{user_id}") as cur:
+        cur.itersize = _JSON_BATCH_SIZE
+        cur.execute(_EXPORT_SQL, {"telegram_id": user_id})
+        for row in cur:
+            row = {**row, **{key: float(row[key] or 0) for key in ("calories", "protein", "fat", "carbs")}}
+            gz.write(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+            count += 1
+    return count
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Export a user's food diary as gzip-compressed CSV or JSON lines.")
+    parser.add_argument("telegram_id", type=int)
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--output", help="file to write, '-' for stdout (default: food_diary_<id>.<format>.gz)")
+    args = parser.parse_args(argv)
+
+    if args.output == "-":
+        count = export_food_logs(args.telegram_id, sys.stdout.buffer, args.format)
+        output = "stdout"
+    else:
+        output = args.output or filename(args.telegram_id, args.format)
+        with open(output, "wb") as out:
+            count = export_food_logs(args.telegram_id, out, args.format)
+    print(f"exported {count} rows to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import re
+from typing import Any
+
+# Pulls the dish name and calories/macros out of a free-text vision or LLM
+# answer. Handles the phrasings seen in stored answers: "Ккал: ~350",
+# "350–400 ккал" (the midpoint is used), "1 200 ккал", "Б: 20 г",
+# "БЖУ: 20/15/40" and "15 г белка". A value that is not found is 0.
+
+_NUMBER = r"\d{1,3}(?:[  ]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?"
+_AMOUNT = rf"(?P<low>{_NUMBER})(?:\s*(?:-|–|—|до)\s*(?P<high>{_NUMBER}))?"
+_APPROX = r"(?:(?:~|≈|около|примерно|приблизительно|порядка)\s*)?"
+_GRAMS = r"(?:г|гр|грамм\w*|g|grams?)\b"
+
+# field -> (labels written before the value, units written after it)
+_FIELDS = {
+    "calories": (r"калорийн\w*|калори\w*|энергетическ\w*\s+ценност\w*|ккал|kcal|calories", r"ккал|kcal|калор|кал\b"),
+    "protein": (r"белк\w*|белок|протеин\w*|protein\w*|\bб\b", r"белк|белок|бел\b|protein"),
+    "fat": (r"жир\w*|fats?\b|\bж\b", r"жир|fat"),
+    "carbs": (r"углевод\w*|carb\w*|\bу\b", r"углевод|угл\b|carb"),
+}
+
+
+def _patterns(labels: str, units: str) -> tuple[re.Pattern, ...]:
+    return (
+        # "Белки: ~20 г", "Калорийность (оценочно) — 350–400 ккал". The amount
+        # must end the value: a unit or no word after it, so the 2 in
+        # "Калорийность: 2 порции по 150 ккал" is left to the next pattern.
+        re.compile(
+            rf"(?:{labels})\s*(?:\([^)\n]*\))?\s*[:=—–-]?\s*{_APPROX}{_AMOUNT}"
+            rf"(?=[ \t]*(?:{_GRAMS}|{units})|(?![ \t]*[^\W\d_]))"
+        ),
+        # "~350 ккал", "15 г белка"
+        re.compile(rf"{_AMOUNT}\s*(?:{_GRAMS})?\.?\s*(?:{units})"),
+        # Anything else on the same line after the label, as the old parser did.
+        re.compile(rf"(?:{labels})[^\d\n]{{0,40}}{_AMOUNT}"),
+    )
+
+
+_PATTERNS = {field: _patterns(labels, units) for field, (labels, units) in _FIELDS.items()}
+
+# "БЖУ: 20/15/40", "б/ж/у — 20 г / 15 г / 40 г"
+_MACROS_RE = re.compile(
+    rf"\bб\s*/?\s*ж\s*/?\s*у\b[^\d\n]{{0,20}}(?P<protein>{_NUMBER})\s*(?:г\s*)?/\s*(?P<fat>{_NUMBER})\s*(?:г\s*)?/\s*(?P<carbs>{_NUMBER})"
+)
+
+
+def parse_food_ai_response(text: str) -> dict[str, Any]:
+    lower = text.lower()
+    lines = [line.strip(" -•\t") for line in text.splitlines() if line.strip()]
+    dish_name = lines[0] if lines else ""
+    for prefix in ("что на фото:", "название:", "блюдо:", "1)"):
+        if dish_name.lower().startswith(prefix):
+            dish_name = dish_name[len(prefix):].strip()
+
+    # The compact form goes first: read field by field, "ж" in "б/ж/у: 20/15/40"
+    # would pick up the protein value.
+    macros = _MACROS_RE.search(lower)
+    parsed = {}
+    for field, patterns in _PATTERNS.items():
+        if macros and field in ("protein", "fat", "carbs"):
+            parsed[field] = _to_float(macros.group(field))
+        else:
+            parsed[field] = _find_amount(lower, patterns)
+
+    return {"dish_name": dish_name[:200] or "Еда с фото", **parsed}
+
+
+def _find_amount(text: str, patterns: tuple[re.Pattern, ...]) -> float:
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            low = _to_float(match.group("low"))
+            high = match.group("high")
+            return (low + _to_float(high)) / 2 if high else low
+    return 0.0
+
+
+def _to_float(number: str) -> float:
+    return float(number.replace(" ", "").replace(" ", "").replace(",", "."))
@@ -0,0 +1,140 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import psycopg
+
+import users_db
+
+# Meals the user confirmed while Postgres was unreachable. Each one is fsynced
+# to a local SQLite journal before the user is told it was saved, and replayed
+# into food_logs by replay() once the database answers again. Replay is
+# at-least-once: a batch whose COMMIT reached the server but whose reply was
+# lost is sent again. Each meal carries a client_key generated here, so
+# add_food_logs skips a meal that is already stored instead of counting it twice.
+
+MAX_ATTEMPTS = 5
+
+_lock = threading.Lock()
+_db: sqlite3.Connection | None = None
+
+
+def _path() -> str:
+    return os.getenv("FOOD_SPOOL_PATH", "food_spool.sqlite3")
+
+
+def _conn() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        db = sqlite3.connect(_path(), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=FULL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS food_spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                entry TEXT NOT NULL,
+                spooled_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+            """
+        )
+        _db = db
+    return _db
+
+
+def append(
+    user_id: int, dish_name: str, calories: float, protein: float, fat: float, carbs: float, raw_ai_response: str, source: str
+) -> int:
+    """Journal a meal that add_food_log could not write; returns its spool id."""
+    entry = {
+        "user_id": user_id,
+        "dish_name": dish_name,
+        "calories": calories,
+        "protein": protein,
+        "fat": fat,
+        "carbs": carbs,
+        "raw_ai_response": raw_ai_response,
+        "source": source,
+        # Replayed rows keep the time the user confirmed them, not the replay time.
+        "eaten_at": datetime.now(timezone.utc).isoformat(),
+        "client_key": str(uuid.uuid4()),
+    }
+    with _lock:
+        cur = _conn().execute(
+            "INSERT INTO food_spool (entry, spooled_at) VALUES (?, ?)", (json.dumps(entry), time.time())
+        )
+    return int(cur.lastrowid)
+
+
+def _entry(raw: str) -> dict:
+    entry = json.loads(raw)
+    entry["eaten_at"] = datetime.fromisoformat(entry["eaten_at"])
+    return entry
+
+
+def replay(batch_size: int = 100) -> int:
+    """Write spooled meals to Postgres, oldest first; returns how many were stored.
+
+    Stops at the first connection problem and leaves the rest for the next run.
+    A batch Postgres rejects is retried row by row, so one bad row cannot block
+    the others; a row that keeps failing is parked after MAX_ATTEMPTS.
+    """
+    replayed = 0
+    while True:
+        with _lock:
+            rows = _conn().execute(
+                "SELECT id, entry FROM food_spool WHERE attempts < ? ORDER BY id LIMIT ?", (MAX_ATTEMPTS, batch_size)
+            ).fetchall()
+        if not rows:
+            return replayed
+        try:
+            users_db.add_food_logs([_entry(entry) for _, entry in rows])
+            done = [spool_id for spool_id, _ in rows]
+        except psycopg.OperationalError:
+            return replayed
+        except psycopg.Error:
+            done = _replay_one_by_one(rows)
+        with _lock:
+            _conn().executemany("DELETE FROM food_spool WHERE id = ?", [(spool_id,) for spool_id in done])
+        replayed += len(done)
+        if len(rows) < batch_size:
+            return replayed
+
+
+def _replay_one_by_one(rows: list[tuple[int, str]]) -> list[int]:
+    done = []
+    for spool_id, entry in rows:
+        try:
+            users_db.add_food_logs([_entry(entry)])
+        except psycopg.OperationalError:
+            break
+        except psycopg.Error as exc:
+            with _lock:
+                _conn().execute(
+                    "UPDATE food_spool SET attempts = attempts + 1, last_error = ? WHERE id = ?", (str(exc), spool_id)
+                )
+            continue
+        done.append(spool_id)
+    return done
+
+
+def stats() -> dict:
+    with _lock:
+        row = _conn().execute(
+            # Parked rows are counted apart and do not age the backlog.
+            "SELECT COUNT(*) FILTER (WHERE attempts < ?), COUNT(*) FILTER (WHERE attempts >= ?),"
+            " MIN(spooled_at) FILTER (WHERE attempts < ?) FROM food_spool",
+            (MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS),
+        ).fetchone()
+    pending, parked, oldest = row
+    return {
+        "pending": pending,
+        "parked": parked,
+        "oldest_age_seconds": round(time.time() - oldest, 1) if oldest is not None else None,
+    }
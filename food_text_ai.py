@@ -1,11 +1,6 @@
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+from services.ai_gateway import call, client
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def analyze_text_food(user_text):
+async def analyze_text_food(user_text):
 
     prompt = f"""
 Пользователь описал съеденную еду: "{user_text}"
@@ -26,7 +21,9 @@ def analyze_text_food(user_text):
 Без лишнего текста.
 """
 
-    response = client.responses.create(
+    response = await call(
+        "chat",
+        client.responses.create,
         model="gpt-4.1-mini",
         input=prompt
     )
@@ -0,0 +1,34 @@
+import asyncio
+import tempfile
+
+from telegram import Update
+from telegram.constants import ChatAction
+from telegram.ext import ContextTypes
+
+from food_export import export_food_logs, filename
+from services.access import has_pro
+from handlers.user_context import user_context
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    ctx = await user_context(update, context)
+    if not has_pro(ctx["user"]):
+        await update.message.reply_text("Экспорт дневника доступен в PRO. Открой /pay.")
+        return
+
+    fmt = "jsonl" if context.args and context.args[0].lower() in ("json", "jsonl") else "csv"
+    await context.bot.send_chat_action(update.effective_chat.id, ChatAction.UPLOAD_DOCUMENT)
+
+    # The export is compressed into a temp file on disk, never held as rows in memory.
+    with tempfile.TemporaryFile() as out:
+        count = await asyncio.to_thread(export_food_logs, user_id, out, fmt)
+        if not count:
+            await update.message.reply_text("В дневнике пока нет записей.")
+            return
+        out.seek(0)
+        await update.message.reply_document(
+            document=out,
+            filename=filename(user_id, fmt),
+            caption=f"Дневник питания: {count} записей.",
+        )
@@ -0,0 +1,55 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+
+from users_db_async import find_food_logs
+from handlers.user_context import user_context
+
+FIND_QUERY_KEY = "find_query"
+FIND_PAGE_SIZE = 10
+FIND_MAX_QUERY = 100
+
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await user_context(update, context)
+    text = " ".join(context.args or []).strip()[:FIND_MAX_QUERY]
+    if len(text) < 2:
+        await update.message.reply_text("Что искать? Например: /find гречка")
+        return
+
+    context.user_data[FIND_QUERY_KEY] = text
+    message, markup = await _find_page(update.effective_user.id, text, 0)
+    await update.message.reply_text(message, reply_markup=markup)
+
+
+async def find_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    text = context.user_data.get(FIND_QUERY_KEY)
+    if not text:
+        await query.edit_message_text("Поиск устарел. Повтори /find.")
+        return
+
+    page = int(query.data.rsplit(":", 1)[-1])
+    message, markup = await _find_page(update.effective_user.id, text, page)
+    await query.edit_message_text(message, reply_markup=markup)
+
+
+async def _find_page(user_id: int, text: str, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    page = max(page, 0)
+    found = await find_food_logs(user_id, text, limit=FIND_PAGE_SIZE, offset=page * FIND_PAGE_SIZE)
+    if not found["items"] and page == 0:
+        return f"🔎 «{text}»: ничего не нашёл.", None
+
+    lines = [f"🔎 «{text}», страница {page + 1}", ""]
+    for row in found["items"]:
+        lines.append(
+            f"• {row['log_date']}: {row['dish_name']} — "
+            f"{row['calories']:.0f} ккал, Б{row['protein']:.0f}/Ж{row['fat']:.0f}/У{row['carbs']:.0f}"
+        )
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"find:page:{page - 1}"))
+    if found["has_more"]:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"find:page:{page + 1}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
@@ -1,16 +1,20 @@
-import re
-from decimal import Decimal
+import asyncio
 from typing import Any
 
+import psycopg
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ChatAction
 from telegram.ext import ContextTypes
 
-from users_db import add_food_log, consume_photo_quota, ensure_user, get_food_logs, get_profile, get_user
+import food_spool
+from food_parser import parse_food_ai_response
+from records import Profile
+from users_db_async import add_food_log, consume_photo_quota, get_daily_totals
 from services.access import has_pro
 from services.ai import generate_text
 from services.stt import transcribe_ogg
 from services.vision import analyze_food_photo
+from handlers.user_context import user_context
 from handlers.voice import smart_reply
 
 PENDING_FOOD_KEY = "pending_food"
@@ -19,7 +23,7 @@ PHOTO_FREE_LIMIT = 3
 
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    ensure_user(user_id, update.effective_user)
+    await user_context(update, context)
 
     await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
 
@@ -31,22 +35,21 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     file = await context.bot.get_file(voice.file_id)
     ogg_bytes = await file.download_as_bytearray()
 
-    text = transcribe_ogg(bytes(ogg_bytes))
+    text = await transcribe_ogg(bytes(ogg_bytes))
     if not text:
         await update.message.reply_text("Не разобрал голос. Скажи короче и чётче.")
         return
 
-    answer = generate_text(user_id, text)
+    answer = await generate_text(user_id, text)
     await smart_reply(update, context, answer)
 
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    ensure_user(user_id, update.effective_user)
-    user = get_user(user_id)
+    user = (await user_context(update, context))["user"]
 
     if not has_pro(user):
-        allowed, used = consume_photo_quota(user_id, PHOTO_FREE_LIMIT)
+        allowed, used = await consume_photo_quota(user_id, PHOTO_FREE_LIMIT)
         if not allowed:
             await update.message.reply_text(
                 "Лимит Free: 3 фото в день.\n"
@@ -64,7 +67,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     file = await context.bot.get_file(photo.file_id)
     img_bytes = await file.download_as_bytearray()
 
-    vision = analyze_food_photo(bytes(img_bytes))
+    vision = await analyze_food_photo(bytes(img_bytes))
     parsed = parse_food_ai_response(vision)
     context.user_data[PENDING_FOOD_KEY] = {**parsed, "raw_ai_response": vision, "source": "photo"}
 
@@ -85,7 +88,7 @@ async def food_action_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     if action == "food:save":
-        log_id = add_food_log(
+        meal = (
             update.effective_user.id,
             pending["dish_name"],
             pending["calories"],
@@ -95,6 +98,15 @@ async def food_action_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             pending["raw_ai_response"],
             pending["source"],
         )
+        try:
+            log_id = await add_food_log(*meal)
+        except psycopg.OperationalError as exc:
+            # The database is unreachable: journal the meal locally instead of losing it.
+            print(f"add_food_log failed, spooling: {exc}")
+            await asyncio.to_thread(food_spool.append, *meal)
+            context.user_data.pop(PENDING_FOOD_KEY, None)
+            await query.edit_message_text("✅ Сохранил. База сейчас недоступна, запись появится в дневнике через пару минут.")
+            return
         context.user_data.pop(PENDING_FOOD_KEY, None)
         await query.edit_message_text(f"✅ Сохранил в дневник. Запись #{log_id}.")
         return
@@ -105,7 +117,8 @@ async def food_action_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     if action == "food:today":
-        await query.message.reply_text(_today_text(update.effective_user.id))
+        profile = (await user_context(update, context))["profile"]
+        await query.message.reply_text(await _today_text(update.effective_user.id, profile))
         return
 
     if action == "food:edit":
@@ -171,28 +184,6 @@ def food_action_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-def parse_food_ai_response(text: str) -> dict[str, Any]:
-    lower = text.lower()
-    lines = [line.strip(" -•\t") for line in text.splitlines() if line.strip()]
-    dish_name = lines[0]
-    for prefix in ("что на фото:", "название:", "блюдо:", "1)"):
-        if dish_name.lower().startswith(prefix):
-            dish_name = dish_name[len(prefix):].strip()
-
-    calories = _find_number(lower, [r"(\d+(?:[\.,]\d+)?)\s*(?:ккал|калор)", r"калории\D+(\d+(?:[\.,]\d+)?)"])
-    protein = _find_number(lower, [r"белк\w*\D+(\d+(?:[\.,]\d+)?)", r"(\d+(?:[\.,]\d+)?)\s*г?\s*бел"])
-    fat = _find_number(lower, [r"жир\w*\D+(\d+(?:[\.,]\d+)?)", r"(\d+(?:[\.,]\d+)?)\s*г?\s*жир"])
-    carbs = _find_number(lower, [r"углевод\w*\D+(\d+(?:[\.,]\d+)?)", r"(\d+(?:[\.,]\d+)?)\s*г?\s*угл"])
-
-    return {
-        "dish_name": dish_name[:200] or "Еда с фото",
-        "calories": calories,
-        "protein": protein,
-        "fat": fat,
-        "carbs": carbs,
-    }
-
-
 def parse_manual_food_line(text: str) -> dict[str, Any] | None:
     parts = [p.strip() for p in text.split(";")]
     if len(parts) != 5 or not parts[0]:
@@ -209,14 +200,6 @@ def parse_manual_food_line(text: str) -> dict[str, Any] | None:
         return None
 
 
-def _find_number(text: str, patterns: list[str]) -> float:
-    for pattern in patterns:
-        match = re.search(pattern, text, flags=re.IGNORECASE)
-        if match:
-            return float(match.group(1).replace(",", "."))
-    return 0.0
-
-
 def _format_food_result(parsed: dict, raw: str) -> str:
     return (
         "🍽 Распознал еду:\n"
@@ -230,15 +213,8 @@ def _format_food_result(parsed: dict, raw: str) -> str:
     )
 
 
-def _today_text(user_id: int) -> str:
-    profile = get_profile(user_id)
-    logs = get_food_logs(user_id, days=1)
-    totals = {
-        "calories": sum(_num(row.get("calories")) for row in logs),
-        "protein": sum(_num(row.get("protein")) for row in logs),
-        "fat": sum(_num(row.get("fat")) for row in logs),
-        "carbs": sum(_num(row.get("carbs")) for row in logs),
-    }
+async def _today_text(user_id: int, profile: Profile | None) -> str:
+    totals = await get_daily_totals(user_id)
     return (
         "📊 Сегодня\n\n"
         f"Ккал: {totals['calories']:.0f}{_target(profile, 'daily_calories')}\n"
@@ -248,13 +224,8 @@ def _today_text(user_id: int) -> str:
     )
 
 
-def _num(value) -> float:
-    if isinstance(value, Decimal):
-        return float(value)
-    return float(value or 0)
-
-
-def _target(profile: dict | None, key: str) -> str:
-    if not profile or profile.get(key) is None:
+def _target(profile: Profile | None, key: str) -> str:
+    value = getattr(profile, key) if profile else None
+    if value is None:
         return ""
-    return f" / {float(profile[key]):.0f}"
+    return f" / {value:.0f}"
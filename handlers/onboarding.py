@@ -1,8 +1,10 @@
 from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import ContextTypes, ConversationHandler
 
+from records import Profile
 from targets import calculate_targets
-from users_db import ensure_user, get_profile, save_profile
+from handlers.user_context import user_context
+from users_db_async import save_profile
 
 NAME, AGE, SEX, HEIGHT, WEIGHT, GOAL, ACTIVITY, RESTRICTIONS = range(8)
 
@@ -35,7 +37,7 @@ def _keyboard(items: list[str]) -> ReplyKeyboardMarkup:
 
 
 async def start_onboarding(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_user(update.effective_user.id, update.effective_user)
+    await user_context(update, context)
     context.user_data["onboarding"] = {}
     await update.message.reply_text(
         "Соберём профиль, чтобы считать дневную норму.\n\nКак тебя зовут?",
@@ -45,9 +47,8 @@ async def start_onboarding(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_user(update.effective_user.id, update.effective_user)
-    profile = get_profile(update.effective_user.id)
-    if not profile or not profile.get("onboarding_completed"):
+    profile = (await user_context(update, context))["profile"]
+    if not profile or not profile.onboarding_completed:
         await update.message.reply_text("Профиль ещё не заполнен. Запускаю onboarding.")
         return await start_onboarding(update, context)
 
@@ -158,10 +159,10 @@ async def set_restrictions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "daily_fat": round(targets["fat_g"], 0),
         "daily_carbs": round(targets["carbs_g"], 0),
     }
-    save_profile(update.effective_user.id, profile)
+    await save_profile(update.effective_user.id, profile)
     context.user_data.pop("onboarding", None)
     await update.message.reply_text(
-        "Профиль готов.\n\n" + _format_profile(profile) + "\n\nТеперь пришли фото еды или напиши, что ел.",
+        "Профиль готов.\n\n" + _format_profile(Profile.from_row(profile)) + "\n\nТеперь пришли фото еды или напиши, что ел.",
         reply_markup=ReplyKeyboardRemove(),
     )
     return ConversationHandler.END
@@ -173,19 +174,19 @@ async def cancel_onboarding(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
-def _format_profile(profile: dict) -> str:
+def _format_profile(profile: Profile) -> str:
     goals = {"lose": "похудение", "maintain": "поддержание", "gain": "набор", "health": "здоровье"}
     sexes = {"male": "мужской", "female": "женский"}
     return (
-        f"👤 Профиль: {profile.get('name')}\n"
-        f"Возраст: {profile.get('age')}\n"
-        f"Пол: {sexes.get(profile.get('sex'), profile.get('sex'))}\n"
-        f"Рост/вес: {profile.get('height_cm')} см / {profile.get('weight_kg')} кг\n"
-        f"Цель: {goals.get(profile.get('goal'), profile.get('goal'))}\n"
-        f"Ограничения: {profile.get('food_restrictions') or 'нет'}\n\n"
+        f"👤 Профиль: {profile.name}\n"
+        f"Возраст: {profile.age}\n"
+        f"Пол: {sexes.get(profile.sex, profile.sex)}\n"
+        f"Рост/вес: {profile.height_cm} см / {profile.weight_kg} кг\n"
+        f"Цель: {goals.get(profile.goal, profile.goal)}\n"
+        f"Ограничения: {profile.food_restrictions or 'нет'}\n\n"
         f"🎯 Норма на день:\n"
-        f"Ккал: {profile.get('daily_calories')}\n"
-        f"Белки: {profile.get('daily_protein')} г\n"
-        f"Жиры: {profile.get('daily_fat')} г\n"
-        f"Углеводы: {profile.get('daily_carbs')} г"
+        f"Ккал: {profile.daily_calories}\n"
+        f"Белки: {profile.daily_protein} г\n"
+        f"Жиры: {profile.daily_fat} г\n"
+        f"Углеводы: {profile.daily_carbs} г"
     )
@@ -2,7 +2,8 @@ import os
 from telegram import LabeledPrice, Update
 from telegram.ext import ContextTypes
 
-from users_db import activate_subscription, ensure_user, record_payment
+from handlers.user_context import user_context
+from users_db_async import activate_paid_subscription
 
 
 def _provider_token() -> str | None:
@@ -19,7 +20,7 @@ def _currency() -> str:
 
 
 async def buy_pro(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_user(update.effective_user.id, update.effective_user)
+    await user_context(update, context)
     provider_token = _provider_token()
     if not provider_token:
         await update.message.reply_text("Оплата временно недоступна: не настроен PAYMENT_PROVIDER_TOKEN.")
@@ -47,9 +48,11 @@ async def pre_checkout_query(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def successful_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    ensure_user(user_id, update.effective_user)
+    await user_context(update, context)
 
-    payment_id = record_payment(user_id, update.message.successful_payment)
-    end = activate_subscription(user_id, days=30, payment_id=payment_id)
+    result = await activate_paid_subscription(user_id, update.message.successful_payment, days=30)
+    if result["duplicate"]:
+        await update.message.reply_text(f"Этот платёж уже учтён. PRO активен до {result['ends_at'].date()}.")
+        return
 
-    await update.message.reply_text(f"🔥 PRO активирован на 30 дней. Доступ до {end.date()}.")
+    await update.message.reply_text(f"🔥 PRO активирован на 30 дней. Доступ до {result['ends_at'].date()}.")
@@ -1,30 +1,20 @@
-from users_db import activate_subscription, ensure_user, get_user, update_user
+from users_db_async import redeem_promo_code
 
-PROMO_CODES = {
-    "KING30": 30,
-    "KING365": 365,
+PROMO_ERRORS = {
+    "used": "Этот промокод уже использован.",
+    "unknown": "Промокод недействителен.",
+    "expired": "Срок действия промокода истёк.",
+    "exhausted": "Лимит активаций промокода исчерпан.",
 }
 
 
-def apply_promo_code(user_id: int, code: str):
-    ensure_user(user_id)
-    user = get_user(user_id)
-
+async def apply_promo_code(user_id: int, code: str):
     code = (code or "").upper().strip()
     if not code:
         return False, "Промокод пустой."
 
-    used = user.get("used_promos", [])
-    if code in used:
-        return False, "Этот промокод уже использован."
-
-    if code not in PROMO_CODES:
-        return False, "Промокод недействителен."
-
-    days = PROMO_CODES[code]
-    end = activate_subscription(user_id, days=days)
-
-    used.append(code)
-    update_user(user_id, "used_promos", used)
+    result = await redeem_promo_code(user_id, code)
+    if result["status"] != "ok":
+        return False, PROMO_ERRORS[result["status"]]
 
-    return True, f"🔥 PRO активирован на {days} дней. Доступ до {end.date()}."
+    return True, f"🔥 PRO активирован на {result['days']} дней. Доступ до {result['ends_at'].date()}."
@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from records import Profile
+from users_db_async import get_daily_series
+from services.access import has_pro
+from handlers.user_context import user_context
+
+# A day "on target" has calories within this share of daily_calories.
+ADHERENCE_TOLERANCE = 0.1
+
+
+async def week_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _report(update, context, 7, "📈 Неделя")
+
+
+async def month_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _report(update, context, 30, "📈 30 дней")
+
+
+async def _report(update: Update, context: ContextTypes.DEFAULT_TYPE, days: int, title: str) -> None:
+    ctx = await user_context(update, context)
+    if not has_pro(ctx["user"]):
+        await update.message.reply_text("Отчёты за неделю и месяц доступны в PRO. Открой /pay.")
+        return
+    # The window ends on the database's date, the one meals are filed under.
+    series = await get_daily_series(update.effective_user.id, days)
+    await update.message.reply_text(report_text(title, series["days"], ctx["profile"], days, series["today"]))
+
+
+def report_text(title: str, series: list[dict], profile: Profile | None, days: int, today: date) -> str:
+    start = today - timedelta(days=days - 1)
+    lines = [f"{title} ({start:%d.%m}–{today:%d.%m})", ""]
+    logged = [day for day in series if day["entries"]]
+    if not logged:
+        lines.append("Записей за этот период нет.")
+        return "\n".join(lines)
+
+    average = {key: sum(day[key] for day in logged) / len(logged) for key in ("calories", "protein", "fat", "carbs")}
+    calories_target = profile.daily_calories if profile else None
+    protein_target = profile.daily_protein if profile else None
+    lines += [
+        f"Дней с записями: {len(logged)} из {days}",
+        f"Среднее в день: {average['calories']:.0f} ккал" + _versus(average["calories"], calories_target),
+        f"Белки: {average['protein']:.0f} г" + _versus(average["protein"], protein_target),
+        f"Жиры: {average['fat']:.0f} г, углеводы: {average['carbs']:.0f} г",
+        "",
+    ]
+
+    if not calories_target:
+        heaviest = max(logged, key=lambda day: day["calories"])
+        lightest = min(logged, key=lambda day: day["calories"])
+        lines += [
+            f"Самый сытный день: {heaviest['log_date']:%d.%m} — {heaviest['calories']:.0f} ккал",
+            f"Самый лёгкий день: {lightest['log_date']:%d.%m} — {lightest['calories']:.0f} ккал",
+            "",
+            "Заполни /profile, чтобы видеть дневную норму и серии.",
+        ]
+        return "\n".join(lines)
+
+    on_target = {day["log_date"] for day in logged if _on_target(day["calories"], calories_target)}
+    current, best = _streaks(on_target, start, today)
+    best_day = min(logged, key=lambda day: abs(day["calories"] - calories_target))
+    worst_day = max(logged, key=lambda day: abs(day["calories"] - calories_target))
+    lines += [
+        f"В норме (±{ADHERENCE_TOLERANCE:.0%}): {len(on_target)} дн.",
+        f"Серия сейчас: {current} дн., лучшая: {best} дн.",
+        f"Лучший день: {best_day['log_date']:%d.%m} — {best_day['calories']:.0f} ккал",
+        f"Худший день: {worst_day['log_date']:%d.%m} — {worst_day['calories']:.0f} ккал",
+    ]
+    return "\n".join(lines)
+
+
+def _versus(value: float, target: float | None) -> str:
+    if not target:
+        return ""
+    return f" / {target:.0f} ({value / target:.0%})"
+
+
+def _on_target(calories: float, target: float) -> bool:
+    return abs(calories - target) <= target * ADHERENCE_TOLERANCE
+
+
+def _streaks(on_target: set[date], start: date, today: date) -> tuple[int, int]:
+    """(current, best) runs of consecutive on-target days within [start, today].
+
+    Today is still in progress, so a current run may end yesterday.
+    """
+    best = run = 0
+    day = start
+    while day <= today:
+        run = run + 1 if day in on_target else 0
+        best = max(best, run)
+        day += timedelta(days=1)
+    current = 0
+    day = today if today in on_target else today - timedelta(days=1)
+    while day >= start and day in on_target:
+        current += 1
+        day -= timedelta(days=1)
+    return current, best
@@ -0,0 +1,16 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from users_db_async import load_user_context
+
+# PTB builds one CallbackContext per update and hands the same object to every
+# handler that runs for it, so the loaded user lives exactly as long as the update.
+_CONTEXT_ATTR = "_user_context"
+
+
+async def user_context(update: Update, context: ContextTypes.DEFAULT_TYPE) -> dict:
+    cached = getattr(context, _CONTEXT_ATTR, None)
+    if cached is None:
+        cached = await load_user_context(update.effective_user.id, update.effective_user)
+        setattr(context, _CONTEXT_ATTR, cached)
+    return cached
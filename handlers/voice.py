@@ -1,14 +1,12 @@
 from telegram.constants import ChatAction
-from users_db import get_user, ensure_user
 from services.access import has_pro
+from handlers.user_context import user_context
 from services.ai import generate_voice_bytes
 
 async def smart_reply(update, context, gpt_text: str):
-    user_id = update.effective_user.id
-    ensure_user(user_id)
-    user = get_user(user_id)
+    user = (await user_context(update, context))["user"]
 
-    mode = user.get("mode", "text")
+    mode = user.mode
 
     # Если выбрали voice, но нет PRO/триала
     if mode == "voice" and not has_pro(user):
@@ -22,7 +20,7 @@ async def smart_reply(update, context, gpt_text: str):
         await context.bot.send_chat_action(update.effective_chat.id, ChatAction.RECORD_VOICE)
 
         # голос коротко + потом текст полностью
-        audio = generate_voice_bytes(gpt_text)
+        audio = await generate_voice_bytes(gpt_text)
 
         await context.bot.send_voice(
             chat_id=update.effective_chat.id,
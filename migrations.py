@@ -0,0 +1,530 @@
+import argparse
+import time
+from typing import NamedTuple
+
+from psycopg import Connection, errors, sql
+
+from users_db import _REBUILD_DAILY_TOTALS_SQL, _extensions, get_conn
+
+# Ordered schema history. Append new entries with the next version number and
+# never edit one that has shipped. Statements should stay idempotent (IF NOT
+# EXISTS and friends): version 1 also runs against databases created by the
+# old boot-time DDL that predates this table.
+
+# Arbitrary constant shared by every replica; pg_advisory_lock makes them
+# apply migrations one at a time instead of queueing on table locks.
+MIGRATION_LOCK_KEY = 7_413_550_021
+
+
+class Index(NamedTuple):
+    """An index built with CREATE INDEX CONCURRENTLY, so writes continue during the build.
+
+    spec is everything after "ON <table>". On a partitioned table the parent
+    index is created ON ONLY the table and each partition's index is built
+    concurrently and attached, which Postgres cannot do in one statement.
+    An index whose extensions (requires) are not available is skipped.
+    """
+
+    name: str
+    table: str
+    spec: str
+    unique: bool = False
+    requires: tuple[str, ...] = ()
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: tuple[str | Index, ...]
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction. A migration with
+    # transaction=False runs its statements one at a time in autocommit; each
+    # must be safe to run again if the migration is interrupted.
+    transaction: bool = True
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(
+        1,
+        "initial schema",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id BIGSERIAL PRIMARY KEY,
+                telegram_id BIGINT UNIQUE NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                user_type TEXT NOT NULL DEFAULT 'free',
+                trial_start TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                trial_used BOOLEAN NOT NULL DEFAULT FALSE,
+                subscription_end TIMESTAMPTZ,
+                mode TEXT NOT NULL DEFAULT 'text',
+                used_promos TEXT[] NOT NULL DEFAULT ARRAY[]::TEXT[],
+                photo_limit_date DATE,
+                photo_count_today INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS photo_limit_date DATE",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS photo_count_today INTEGER NOT NULL DEFAULT 0",
+            """
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                name TEXT,
+                age INTEGER,
+                sex TEXT,
+                height_cm NUMERIC(6,2),
+                weight_kg NUMERIC(6,2),
+                goal TEXT,
+                activity_factor NUMERIC(4,2),
+                food_restrictions TEXT,
+                daily_calories NUMERIC(8,2),
+                daily_protein NUMERIC(8,2),
+                daily_fat NUMERIC(8,2),
+                daily_carbs NUMERIC(8,2),
+                onboarding_completed BOOLEAN NOT NULL DEFAULT FALSE,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS food_logs (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                eaten_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                log_date DATE NOT NULL DEFAULT CURRENT_DATE,
+                dish_name TEXT NOT NULL,
+                calories NUMERIC(8,2) NOT NULL DEFAULT 0,
+                protein NUMERIC(8,2) NOT NULL DEFAULT 0,
+                fat NUMERIC(8,2) NOT NULL DEFAULT 0,
+                carbs NUMERIC(8,2) NOT NULL DEFAULT 0,
+                raw_ai_response TEXT,
+                source TEXT NOT NULL CHECK (source IN ('photo', 'text', 'voice')),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_food_logs_user_date ON food_logs(user_id, log_date DESC)",
+            """
+            CREATE TABLE IF NOT EXISTS payments (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                telegram_payment_charge_id TEXT,
+                provider_payment_charge_id TEXT,
+                currency TEXT NOT NULL,
+                total_amount INTEGER NOT NULL,
+                payload TEXT,
+                status TEXT NOT NULL DEFAULT 'successful',
+                raw_payment JSONB,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                payment_id BIGINT REFERENCES payments(id) ON DELETE SET NULL,
+                starts_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                ends_at TIMESTAMPTZ NOT NULL,
+                status TEXT NOT NULL DEFAULT 'active',
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "food_log_transcripts side table",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS food_log_transcripts (
+                food_log_id BIGINT PRIMARY KEY REFERENCES food_logs(id) ON DELETE CASCADE,
+                body BYTEA NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            # Bodies are zlib-compressed already; stop TOAST from trying again.
+            "ALTER TABLE food_log_transcripts ALTER COLUMN body SET STORAGE EXTERNAL",
+        ),
+    ),
+    Migration(
+        3,
+        "food_daily_totals rollup",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS food_daily_totals (
+                user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                log_date DATE NOT NULL,
+                calories NUMERIC(12,2) NOT NULL DEFAULT 0,
+                protein NUMERIC(12,2) NOT NULL DEFAULT 0,
+                fat NUMERIC(12,2) NOT NULL DEFAULT 0,
+                carbs NUMERIC(12,2) NOT NULL DEFAULT 0,
+                entries INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, log_date)
+            )
+            """,
+            _REBUILD_DAILY_TOTALS_SQL.format(scope="TRUE") + " ON CONFLICT (user_id, log_date) DO NOTHING",
+        ),
+    ),
+    Migration(
+        4,
+        "partition food_logs by month",
+        (
+            # The existing table is attached as one partition covering all
+            # history up to next month, so no rows are copied. Monthly
+            # partitions after that are created by partitions.ensure_partitions().
+            # The primary key has to include log_date, which also means the
+            # transcripts table can no longer carry a foreign key to food_logs;
+            # partitions.purge_transcripts() cleans it up instead.
+            """
+            DO $$
+            DECLARE
+                boundary DATE := (date_trunc('month', CURRENT_DATE) + INTERVAL '1 month')::date;
+            BEGIN
+                IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'food_logs'::regclass) THEN
+                    RETURN;
+                END IF;
+                ALTER TABLE food_log_transcripts DROP CONSTRAINT IF EXISTS food_log_transcripts_food_log_id_fkey;
+                ALTER TABLE food_logs RENAME TO food_logs_legacy;
+                ALTER TABLE food_logs_legacy DROP CONSTRAINT food_logs_pkey;
+                ALTER INDEX IF EXISTS idx_food_logs_user_date RENAME TO food_logs_legacy_user_date_idx;
+                CREATE TABLE food_logs (
+                    LIKE food_logs_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                    PRIMARY KEY (id, log_date),
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                ) PARTITION BY RANGE (log_date);
+                ALTER SEQUENCE food_logs_id_seq OWNED BY food_logs.id;
+                EXECUTE format(
+                    'ALTER TABLE food_logs ATTACH PARTITION food_logs_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+                    boundary
+                );
+                CREATE INDEX idx_food_logs_user_date ON food_logs (user_id, log_date DESC);
+            END
+            $$
+            """,
+        ),
+    ),
+    Migration(
+        5,
+        "indexes for hot queries",
+        (
+            # get_history / get_food_logs: one user's meals in a date window,
+            # answered from the index alone. Supersedes idx_food_logs_user_date.
+            Index(
+                "idx_food_logs_user_date_eaten", "food_logs",
+                "(user_id, log_date DESC, eaten_at DESC, id DESC) INCLUDE (dish_name, calories, protein, fat, carbs)",
+            ),
+            # Brief ACCESS EXCLUSIVE lock on food_logs: no data is read.
+            "DROP INDEX IF EXISTS idx_food_logs_user_date",
+            # count_photo_logs_today
+            Index("idx_food_logs_user_photo_date", "food_logs", "(user_id, log_date) WHERE source = 'photo'"),
+            Index("idx_payments_user", "payments", "(user_id, created_at DESC)"),
+            Index("idx_subscriptions_user", "subscriptions", "(user_id, ends_at DESC)"),
+            # Backs ON DELETE SET NULL from payments.
+            Index("idx_subscriptions_payment", "subscriptions", "(payment_id) WHERE payment_id IS NOT NULL"),
+        ),
+        transaction=False,
+    ),
+    Migration(
+        6,
+        "promo_codes table",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS promo_codes (
+                code TEXT PRIMARY KEY,
+                days INTEGER NOT NULL CHECK (days > 0),
+                max_uses INTEGER CHECK (max_uses >= 0),
+                uses INTEGER NOT NULL DEFAULT 0,
+                expires_at TIMESTAMPTZ,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            # The codes that used to be hard-coded in handlers/promo.py.
+            "INSERT INTO promo_codes (code, days) VALUES ('KING30', 30), ('KING365', 365) ON CONFLICT (code) DO NOTHING",
+        ),
+    ),
+    Migration(
+        7,
+        "unique telegram_payment_charge_id",
+        (
+            # Earlier replays were stored twice. Keep the first row of each
+            # charge; later copies keep the id in raw_payment only.
+            """
+            UPDATE payments SET telegram_payment_charge_id = NULL, status = 'duplicate'
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, row_number() OVER (PARTITION BY telegram_payment_charge_id ORDER BY id) AS n
+                    FROM payments
+                    WHERE telegram_payment_charge_id IS NOT NULL
+                ) ranked
+                WHERE n > 1
+            )
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS payments_telegram_payment_charge_id_key
+            ON payments (telegram_payment_charge_id)
+            """,
+        ),
+    ),
+    Migration(
+        8,
+        "trigram index for /find",
+        (
+            # pg_trgm and btree_gin ship with contrib, which some Postgres
+            # builds leave out; /find falls back to a plain ILIKE there.
+            Index(
+                "idx_food_logs_user_dish_trgm", "food_logs", "USING gin (user_id, dish_name gin_trgm_ops)",
+                requires=("pg_trgm", "btree_gin"),
+            ),
+        ),
+        transaction=False,
+    ),
+    Migration(
+        9,
+        "maintenance_checkpoints",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+                job TEXT PRIMARY KEY,
+                position BIGINT NOT NULL,
+                stats JSONB NOT NULL DEFAULT '{}',
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+        ),
+    ),
+    Migration(
+        10,
+        "global daily stats rollups",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day DATE PRIMARY KEY,
+                active_users INTEGER NOT NULL DEFAULT 0,
+                new_users INTEGER NOT NULL DEFAULT 0,
+                conversions INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS stats_daily_meals (
+                day DATE NOT NULL,
+                source TEXT NOT NULL,
+                meals INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, source)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS stats_daily_revenue (
+                day DATE NOT NULL,
+                currency TEXT NOT NULL,
+                payments INTEGER NOT NULL DEFAULT 0,
+                amount BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, currency)
+            )
+            """,
+            # Daily active users are counted from the per-user rollup by day.
+            "CREATE INDEX IF NOT EXISTS idx_food_daily_totals_date ON food_daily_totals (log_date)",
+        ),
+    ),
+    Migration(
+        11,
+        "idempotency key for replayed meals",
+        (
+            # Set only by food_spool, whose replay is at-least-once; a replayed
+            # meal conflicts on its key and is skipped. A unique index on a
+            # partitioned table must include the partition key; the spooled
+            # eaten_at pins log_date, so every replay of a meal has the same one.
+            "ALTER TABLE food_logs ADD COLUMN IF NOT EXISTS client_key UUID",
+            Index("idx_food_logs_client_key", "food_logs", "(client_key, log_date) WHERE client_key IS NOT NULL", unique=True),
+        ),
+        transaction=False,
+    ),
+)
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
+
+
+def current_version() -> int:
+    """Highest applied version, or 0 for a database that was never migrated."""
+    with get_conn() as conn:
+        try:
+            row = conn.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations").fetchone()
+        except errors.UndefinedTable:
+            return 0
+    return int(row["version"])
+
+
+def migrate() -> list[Migration]:
+    """Apply pending migrations and return them.
+
+    On an up-to-date schema this is a single indexed read with no locks.
+    """
+    if current_version() >= latest_version():
+        return []
+
+    applied = []
+    with get_conn() as conn:
+        # Polled rather than waited for in one statement: a session blocked in
+        # pg_advisory_lock keeps a snapshot open, and CREATE INDEX CONCURRENTLY
+        # on the replica holding the lock would wait for it in turn.
+        while not conn.execute("SELECT pg_try_advisory_lock(%s) AS locked", (MIGRATION_LOCK_KEY,)).fetchone()["locked"]:
+            time.sleep(1)
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+                """
+            )
+            # Re-read under the lock: another replica may have finished first.
+            done = {row["version"] for row in conn.execute("SELECT version FROM schema_migrations").fetchall()}
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                if not migration.transaction:
+                    for statement in migration.statements:
+                        if isinstance(statement, Index):
+                            _create_index(conn, statement)
+                        else:
+                            conn.execute(statement)
+                    conn.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (migration.version, migration.name),
+                    )
+                    applied.append(migration)
+                    continue
+                # One transaction per migration. BEGIN/COMMIT are queued as
+                # plain statements so the whole migration is a single round
+                # trip; conn.transaction() would sync on each of them.
+                with conn.pipeline(), conn.cursor() as cur:
+                    cur.execute("BEGIN")
+                    for statement in migration.statements:
+                        cur.execute(statement)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (migration.version, migration.name),
+                    )
+                    cur.execute("COMMIT")
+                applied.append(migration)
+        finally:
+            # Leaves a migration that failed half-way.
+            conn.rollback()
+            conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            # A migration may have installed extensions; /find checks again.
+            _extensions.clear()
+    return applied
+
+
+_PARTITIONS_SQL = """
+    SELECT c.relname FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %(table)s::regclass
+    ORDER BY c.relname
+"""
+
+_ATTACHED_INDEXES_SQL = """
+    SELECT c.relname FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(%(index)s)
+"""
+
+_MISSING_EXTENSIONS_SQL = """
+    SELECT name FROM unnest(%(names)s::text[]) AS name
+    WHERE name NOT IN (SELECT name FROM pg_available_extensions)
+"""
+
+
+def _create_index(conn: Connection, index: Index) -> None:
+    """Build index without blocking writes to its table; resumes an interrupted build."""
+    if index.requires:
+        missing = [row["name"] for row in conn.execute(_MISSING_EXTENSIONS_SQL, {"names": list(index.requires)})]
+        if missing:
+            print(f"{', '.join(missing)} not available, skipping {index.name}")
+            return
+        for extension in index.requires:
+            conn.execute(sql.SQL("CREATE EXTENSION IF NOT EXISTS {}").format(sql.Identifier(extension)))
+
+    partitions = [row["relname"] for row in conn.execute(_PARTITIONS_SQL, {"table": index.table})]
+    if not partitions:
+        _create_index_concurrently(conn, index.name, index.table, index)
+        return
+
+    # The parent starts out invalid and becomes valid once every partition
+    # has an attached index. Partitions created later get one automatically.
+    conn.execute(
+        sql.SQL("CREATE {unique}INDEX IF NOT EXISTS {name} ON ONLY {table} {spec}").format(
+            unique=sql.SQL("UNIQUE " if index.unique else ""),
+            name=sql.Identifier(index.name),
+            table=sql.Identifier(index.table),
+            spec=sql.SQL(index.spec),
+        )
+    )
+    attached = {row["relname"] for row in conn.execute(_ATTACHED_INDEXES_SQL, {"index": index.name})}
+    for partition in partitions:
+        child = f"{partition}_{index.name}"[:63]
+        if child in attached:
+            continue
+        _create_index_concurrently(conn, child, partition, index)
+        conn.execute(
+            sql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(sql.Identifier(index.name), sql.Identifier(child))
+        )
+
+
+def _create_index_concurrently(conn: Connection, name: str, table: str, index: Index) -> None:
+    # An interrupted concurrent build leaves an invalid index that IF NOT
+    # EXISTS would keep; drop it and build again.
+    row = conn.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,)).fetchone()
+    if row and not row["indisvalid"]:
+        conn.execute(sql.SQL("DROP INDEX CONCURRENTLY {}").format(sql.Identifier(name)))
+    conn.execute(
+        sql.SQL("CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {spec}").format(
+            unique=sql.SQL("UNIQUE " if index.unique else ""),
+            name=sql.Identifier(name),
+            table=sql.Identifier(table),
+            spec=sql.SQL(index.spec),
+        )
+    )
+
+
+def list_migrations() -> list[dict]:
+    applied: dict[int, dict] = {}
+    if current_version():
+        with get_conn() as conn:
+            rows = conn.execute("SELECT version, applied_at FROM schema_migrations").fetchall()
+        applied = {row["version"]: row for row in rows}
+    return [
+        {
+            "version": migration.version,
+            "name": migration.name,
+            "applied_at": applied[migration.version]["applied_at"] if migration.version in applied else None,
+        }
+        for migration in MIGRATIONS
+    ]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Apply or list database schema migrations.")
+    parser.add_argument("command", choices=("apply", "list"))
+    args = parser.parse_args(argv)
+
+    if args.command == "apply":
+        applied = migrate()
+        for migration in applied:
+            print(f"applied {migration.version:>4}  {migration.name}")
+        if not applied:
+            print(f"schema is up to date (version {latest_version()})")
+        return
+
+    for item in list_migrations():
+        status = item["applied_at"].isoformat() if item["applied_at"] else "pending"
+        print(f"{item['version']:>4}  {status:<32}  {item['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import re
+from datetime import date
+
+from psycopg import sql
+
+from users_db import _env_int, get_conn
+
+# food_logs is range-partitioned by log_date, one partition per month named
+# food_logs_yYYYYmMM. Rows from before partitioning live in food_logs_legacy,
+# which covers everything up to the month after the migration ran.
+
+_BOUND_RE = re.compile(r"FROM \((?:'(?P<start>[\d-]+)'|MINVALUE)\) TO \((?:'(?P<end>[\d-]+)'|MAXVALUE)\)")
+
+_PARTITIONS_SQL = """
+    SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'food_logs'::regclass
+"""
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def list_partitions() -> list[dict]:
+    """Attached food_logs partitions with their [start, end) bounds, oldest first."""
+    with get_conn() as conn:
+        rows = conn.execute(_PARTITIONS_SQL).fetchall()
+    partitions = []
+    for row in rows:
+        match = _BOUND_RE.search(row["bound"])
+        if not match:
+            continue
+        start, end = match.group("start"), match.group("end")
+        partitions.append(
+            {
+                "name": row["name"],
+                "start": date.fromisoformat(start) if start else None,
+                "end": date.fromisoformat(end) if end else None,
+            }
+        )
+    return sorted(partitions, key=lambda p: p["start"] or date.min)
+
+
+def ensure_partitions(months_ahead: int | None = None, today: date | None = None) -> list[str]:
+    """Create monthly partitions so that inserts are covered months_ahead into the future."""
+    if months_ahead is None:
+        months_ahead = _env_int("FOOD_LOG_PARTITIONS_AHEAD", 3)
+    today = today or date.today()
+    until = _add_months(_month_start(today), months_ahead + 1)
+    partitions = list_partitions()
+    ends = [p["end"] for p in partitions if p["end"]]
+    month = max(ends) if ends else _month_start(today)
+
+    created = []
+    with get_conn() as conn, conn.pipeline():
+        while month < until:
+            name = f"food_logs_y{month.year:04d}m{month.month:02d}"
+            conn.execute(
+                sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF food_logs FOR VALUES FROM ({}) TO ({})").format(
+                    sql.Identifier(name), sql.Literal(month), sql.Literal(_add_months(month, 1))
+                )
+            )
+            created.append(name)
+            month = _add_months(month, 1)
+    return created
+
+
+def purge_transcripts(older_than_months: int | None = None, batch_size: int = 1000, today: date | None = None) -> int:
+    """Delete AI transcripts of meals in partitions that ended before the cutoff.
+
+    Works partition by partition in small batches; meals and totals are kept.
+    Each batch is a DELETE joining the transcripts to a whole partition, so
+    every expired partition is scanned again on every run, purged or not.
+    Disabled by default (TRANSCRIPT_RETENTION_MONTHS=0): reparse_food_logs.py
+    needs the transcripts to repair old meals.
+    """
+    if older_than_months is None:
+        older_than_months = _env_int("TRANSCRIPT_RETENTION_MONTHS", 0)
+    if older_than_months <= 0:
+        return 0
+    cutoff = _add_months(_month_start(today or date.today()), -older_than_months)
+
+    deleted = 0
+    for partition in list_partitions():
+        if not partition["end"] or partition["end"] > cutoff:
+            continue
+        statement = sql.SQL(
+            """
+            DELETE FROM food_log_transcripts
+            WHERE food_log_id IN (
+                SELECT t.food_log_id
+                FROM food_log_transcripts t
+                JOIN {} f ON f.id = t.food_log_id
+                LIMIT %s
+            )
+            """
+        ).format(sql.Identifier(partition["name"]))
+        while True:
+            with get_conn() as conn:
+                count = conn.execute(statement, (batch_size,)).rowcount
+            deleted += count
+            if count < batch_size:
+                break
+    return deleted
+
+
+def detach_expired(older_than_months: int | None = None, today: date | None = None) -> list[str]:
+    """Detach partitions that ended before the cutoff.
+
+    Detached partitions stay in the database as plain tables, ready to be
+    dumped and dropped; their transcripts are purged first. Disabled by
+    default (FOOD_LOG_RETENTION_MONTHS=0).
+    """
+    if older_than_months is None:
+        older_than_months = _env_int("FOOD_LOG_RETENTION_MONTHS", 0)
+    if older_than_months <= 0:
+        return []
+    purge_transcripts(older_than_months, today=today)
+    cutoff = _add_months(_month_start(today or date.today()), -older_than_months)
+
+    detached = []
+    for partition in list_partitions():
+        if not partition["end"] or partition["end"] > cutoff:
+            continue
+        # DETACH ... CONCURRENTLY cannot run inside a transaction block;
+        # pool connections are in autocommit mode.
+        with get_conn() as conn:
+            conn.execute(
+                sql.SQL("ALTER TABLE food_logs DETACH PARTITION {} CONCURRENTLY").format(sql.Identifier(partition["name"]))
+            )
+        detached.append(partition["name"])
+    return detached
+
+
+def run_maintenance() -> dict:
+    return {
+        "created": ensure_partitions(),
+        "transcripts_purged": purge_transcripts(),
+        "detached": detach_expired(),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Maintain monthly food_logs partitions.")
+    parser.add_argument("command", choices=("list", "maintain"))
+    args = parser.parse_args(argv)
+
+    if args.command == "maintain":
+        print(run_maintenance())
+        return
+
+    for partition in list_partitions():
+        print(f"{partition['name']:<24} {partition['start'] or 'MINVALUE'} .. {partition['end'] or 'MAXVALUE'}")
+
+
+if __name__ == "__main__":
+    main()
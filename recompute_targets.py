@@ -0,0 +1,95 @@
+import argparse
+import time
+
+import numpy as np
+
+from targets import calculate_targets_batch
+from users_db import get_conn
+
+# Rewrites user_profiles.daily_* after a change to the formulas in targets.py.
+# Profiles are read in keyset chunks by user_id, recomputed with the vectorized
+# calculate_targets_batch and written back with one UPDATE per chunk; only rows
+# whose targets actually change are touched. Safe to stop and re-run.
+
+_SELECT_PROFILES_SQL = """
+    SELECT user_id, age, sex, height_cm, weight_kg, activity_factor, goal,
+           daily_calories, daily_protein, daily_fat, daily_carbs
+    FROM user_profiles
+    WHERE user_id > %(after)s
+      AND age IS NOT NULL AND height_cm IS NOT NULL AND weight_kg IS NOT NULL AND activity_factor IS NOT NULL
+    ORDER BY user_id
+    LIMIT %(limit)s
+"""
+
+_UPDATE_TARGETS_SQL = """
+    UPDATE user_profiles p
+    SET daily_calories = t.calories, daily_protein = t.protein, daily_fat = t.fat, daily_carbs = t.carbs,
+        updated_at = NOW()
+    FROM unnest(%(user_ids)s::bigint[], %(calories)s::numeric[], %(protein)s::numeric[], %(fat)s::numeric[], %(carbs)s::numeric[])
+        AS t(user_id, calories, protein, fat, carbs)
+    WHERE p.user_id = t.user_id
+      AND (p.daily_calories, p.daily_protein, p.daily_fat, p.daily_carbs)
+          IS DISTINCT FROM (t.calories, t.protein, t.fat, t.carbs)
+"""
+
+_TARGET_COLUMNS = (
+    ("daily_calories", "calories"),
+    ("daily_protein", "protein_g"),
+    ("daily_fat", "fat_g"),
+    ("daily_carbs", "carbs_g"),
+)
+
+
+def recompute_targets(chunk_size: int = 10_000, dry_run: bool = False) -> dict:
+    """Recompute stored targets for every complete profile: {"scanned", "changed"}."""
+    scanned = changed = 0
+    after = 0
+    while True:
+        with get_conn() as conn:
+            rows = conn.execute(_SELECT_PROFILES_SQL, {"after": after, "limit": chunk_size}).fetchall()
+        if not rows:
+            break
+        after = rows[-1]["user_id"]
+        scanned += len(rows)
+
+        targets = calculate_targets_batch(
+            *([row[key] for row in rows] for key in ("age", "sex", "height_cm", "weight_kg", "activity_factor", "goal"))
+        )
+        # Rounded to whole units, as onboarding stores them.
+        new = np.column_stack([np.round(targets[key]) for _, key in _TARGET_COLUMNS])
+        old = np.array([[row[column] for column, _ in _TARGET_COLUMNS] for row in rows], dtype=np.float64)
+        mask = (new != old).any(axis=1)
+        changed += int(mask.sum())
+
+        if mask.any() and not dry_run:
+            new = new[mask]
+            with get_conn() as conn:
+                conn.execute(
+                    _UPDATE_TARGETS_SQL,
+                    {
+                        "user_ids": [row["user_id"] for row, hit in zip(rows, mask) if hit],
+                        "calories": new[:, 0].tolist(),
+                        "protein": new[:, 1].tolist(),
+                        "fat": new[:, 2].tolist(),
+                        "carbs": new[:, 3].tolist(),
+                    },
+                )
+        if len(rows) < chunk_size:
+            break
+    return {"scanned": scanned, "changed": changed}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Recompute user_profiles.daily_* targets in bulk.")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--dry-run", action="store_true", help="only count profiles whose targets would change")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    result = recompute_targets(args.chunk_size, args.dry_run)
+    elapsed = time.perf_counter() - started
+    print(f"{result} in {elapsed:.1f}s ({result['scanned'] / max(elapsed, 1e-9):,.0f} profiles/s)")
+
+
+if __name__ == "__main__":
+    main()
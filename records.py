@@ -0,0 +1,125 @@
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any
+
+TRIAL_DAYS = 3
+
+# Compact, read-only views of a users / user_profiles row. They are built once
+# when a row is loaded (and then shared through user_cache), so conversions
+# happen there: timestamps stay tz-aware datetimes, NUMERIC columns become
+# floats and the entitlement deadlines are worked out up front. Writes still go
+# through users_db; never mutate a record, it may be a shared cache entry.
+
+
+@dataclass(frozen=True, slots=True)
+class User:
+    id: int
+    telegram_id: int
+    username: str | None = None
+    first_name: str | None = None
+    last_name: str | None = None
+    user_type: str = "free"
+    trial_start: datetime | None = None
+    trial_used: bool = False
+    subscription_end: datetime | None = None
+    mode: str = "text"
+    used_promos: tuple[str, ...] = ()
+    photo_limit_date: date | None = None
+    photo_count_today: int = 0
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    # Entitlement deadlines as POSIX seconds (0 when absent), so a check is a
+    # single float comparison instead of building an aware datetime.
+    trial_deadline: float = 0.0
+    subscription_deadline: float = 0.0
+
+    @classmethod
+    def from_row(cls, row: dict) -> "User":
+        trial_start = _dt(row.get("trial_start"))
+        trial_used = bool(row.get("trial_used"))
+        subscription_end = _dt(row.get("subscription_end"))
+        return cls(
+            id=int(row["id"]),
+            telegram_id=int(row["telegram_id"]),
+            username=row.get("username"),
+            first_name=row.get("first_name"),
+            last_name=row.get("last_name"),
+            user_type=row.get("user_type") or "free",
+            trial_start=trial_start,
+            trial_used=trial_used,
+            subscription_end=subscription_end,
+            mode=row.get("mode") or "text",
+            used_promos=tuple(row.get("used_promos") or ()),
+            photo_limit_date=row.get("photo_limit_date"),
+            photo_count_today=int(row.get("photo_count_today") or 0),
+            created_at=_dt(row.get("created_at")),
+            updated_at=_dt(row.get("updated_at")),
+            trial_deadline=(trial_start + timedelta(days=TRIAL_DAYS)).timestamp() if trial_start and not trial_used else 0.0,
+            subscription_deadline=subscription_end.timestamp() if subscription_end else 0.0,
+        )
+
+    @property
+    def trial_active(self) -> bool:
+        return time.time() < self.trial_deadline
+
+    @property
+    def subscription_active(self) -> bool:
+        return time.time() < self.subscription_deadline
+
+
+@dataclass(frozen=True, slots=True)
+class Profile:
+    user_id: int | None = None
+    name: str | None = None
+    age: int | None = None
+    sex: str | None = None
+    height_cm: float | None = None
+    weight_kg: float | None = None
+    goal: str | None = None
+    activity_factor: float | None = None
+    food_restrictions: str | None = None
+    daily_calories: float | None = None
+    daily_protein: float | None = None
+    daily_fat: float | None = None
+    daily_carbs: float | None = None
+    onboarding_completed: bool = False
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+    @classmethod
+    def from_row(cls, row: dict | None) -> "Profile | None":
+        """Build from a user_profiles row, its to_jsonb() form or an onboarding dict."""
+        if not row:
+            return None
+        return cls(
+            user_id=row.get("user_id"),
+            name=row.get("name"),
+            age=None if row.get("age") is None else int(row["age"]),
+            sex=row.get("sex"),
+            height_cm=_float(row.get("height_cm")),
+            weight_kg=_float(row.get("weight_kg")),
+            goal=row.get("goal"),
+            activity_factor=_float(row.get("activity_factor")),
+            food_restrictions=row.get("food_restrictions"),
+            daily_calories=_float(row.get("daily_calories")),
+            daily_protein=_float(row.get("daily_protein")),
+            daily_fat=_float(row.get("daily_fat")),
+            daily_carbs=_float(row.get("daily_carbs")),
+            onboarding_completed=bool(row.get("onboarding_completed")),
+            created_at=_dt(row.get("created_at")),
+            updated_at=_dt(row.get("updated_at")),
+        )
+
+
+def _float(value: Any) -> float | None:
+    return None if value is None else float(value)
+
+
+def _dt(value: Any) -> datetime | None:
+    # Profiles arrive through to_jsonb(), which renders timestamps as ISO text.
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -0,0 +1,179 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from psycopg.rows import tuple_row
+from psycopg.types.json import Jsonb
+
+from food_parser import parse_food_ai_response
+from users_db import get_conn, get_read_conn
+
+# Re-runs food_parser over the stored AI answers of meals that were saved with
+# zero calories or macros, and fills in only the fields that are still zero.
+# Rows stream through a server-side cursor (from the replica when configured)
+# in id order; parsing runs in a process pool; every batch is written back
+# together with its checkpoint in one transaction, so an interrupted run
+# resumes after the last committed batch.
+
+JOB = "reparse_food_logs"
+MACROS = ("calories", "protein", "fat", "carbs")
+
+_STREAM_SQL = """
+    SELECT f.id, f.log_date, f.calories, f.protein, f.fat, f.carbs, t.body, f.raw_ai_response
+    FROM food_logs f
+    LEFT JOIN food_log_transcripts t ON t.food_log_id = f.id
+    WHERE f.id > %(after)s
+      AND (f.calories = 0 OR f.protein = 0 OR f.fat = 0 OR f.carbs = 0)
+      AND (t.body IS NOT NULL OR f.raw_ai_response IS NOT NULL)
+    ORDER BY f.id
+"""
+
+# A field is only written while it is still zero, and food_daily_totals gets
+# the same deltas, so a meal edited since it was read is left alone.
+_APPLY_FIXES_SQL = """
+    WITH fixes AS (
+        SELECT * FROM unnest(
+            %(ids)s::bigint[], %(log_dates)s::date[],
+            %(calories)s::numeric[], %(protein)s::numeric[], %(fat)s::numeric[], %(carbs)s::numeric[]
+        ) AS t(id, log_date, calories, protein, fat, carbs)
+    ),
+    deltas AS (
+        SELECT f.id, f.log_date, f.user_id,
+            CASE WHEN f.calories = 0 THEN x.calories ELSE 0 END AS calories,
+            CASE WHEN f.protein = 0 THEN x.protein ELSE 0 END AS protein,
+            CASE WHEN f.fat = 0 THEN x.fat ELSE 0 END AS fat,
+            CASE WHEN f.carbs = 0 THEN x.carbs ELSE 0 END AS carbs
+        FROM food_logs f
+        JOIN fixes x ON x.id = f.id AND x.log_date = f.log_date
+        FOR UPDATE OF f
+    ),
+    updated AS (
+        UPDATE food_logs f
+        SET calories = f.calories + d.calories, protein = f.protein + d.protein,
+            fat = f.fat + d.fat, carbs = f.carbs + d.carbs
+        FROM deltas d
+        WHERE f.id = d.id AND f.log_date = d.log_date
+    )
+    UPDATE food_daily_totals t
+    SET calories = t.calories + s.calories, protein = t.protein + s.protein,
+        fat = t.fat + s.fat, carbs = t.carbs + s.carbs
+    FROM (
+        SELECT user_id, log_date, SUM(calories) AS calories, SUM(protein) AS protein, SUM(fat) AS fat, SUM(carbs) AS carbs
+        FROM deltas
+        GROUP BY user_id, log_date
+    ) s
+    WHERE t.user_id = s.user_id AND t.log_date = s.log_date
+"""
+
+_LOAD_CHECKPOINT_SQL = "SELECT position, stats FROM maintenance_checkpoints WHERE job = %(job)s"
+
+_SAVE_CHECKPOINT_SQL = """
+    INSERT INTO maintenance_checkpoints (job, position, stats)
+    VALUES (%(job)s, %(position)s, %(stats)s)
+    ON CONFLICT (job) DO UPDATE SET position = EXCLUDED.position, stats = EXCLUDED.stats, updated_at = NOW()
+"""
+
+
+def _reparse(rows: list[tuple]) -> list[tuple]:
+    # Runs in a worker process: (id, log_date, *new macros) for rows that gain a value.
+    fixes = []
+    for log_id, log_date, *stored, body, raw in rows:
+        text = zlib.decompress(body).decode("utf-8") if body is not None else raw
+        parsed = parse_food_ai_response(text or "")
+        values = tuple(parsed[field] if not old else 0.0 for field, old in zip(MACROS, stored))
+        if any(values):
+            fixes.append((log_id, log_date, *values))
+    return fixes
+
+
+def _load_checkpoint() -> tuple[int, Counter]:
+    with get_conn() as conn:
+        row = conn.execute(_LOAD_CHECKPOINT_SQL, {"job": JOB}).fetchone()
+    if not row:
+        return 0, Counter()
+    return int(row["position"]), Counter(row["stats"])
+
+
+def _apply(fixes: list[tuple], position: int, stats: Counter) -> None:
+    with get_conn() as conn, conn.pipeline(), conn.cursor() as cur:
+        cur.execute("BEGIN")
+        if fixes:
+            columns = [list(column) for column in zip(*fixes)]
+            cur.execute(
+                _APPLY_FIXES_SQL,
+                {"ids": columns[0], "log_dates": columns[1], **dict(zip(MACROS, columns[2:]))},
+            )
+        cur.execute(_SAVE_CHECKPOINT_SQL, {"job": JOB, "position": position, "stats": Jsonb(dict(stats))})
+        cur.execute("COMMIT")
+
+
+def reparse_food_logs(batch_size: int = 2000, workers: int | None = None, dry_run: bool = False, restart: bool = False) -> dict:
+    """Fill zero macros from re-parsed AI answers; returns cumulative stats.
+
+    Stats count scanned and fixed rows, how many values each field gained and
+    the total added. A dry run parses everything but writes nothing, not even
+    the checkpoint.
+    """
+    after, stats = (0, Counter()) if restart else _load_checkpoint()
+    workers = workers or os.cpu_count() or 1
+    started, scanned, last_report = time.perf_counter(), 0, 0.0
+
+    # Workers are spawned, not forked: the parent already runs pool threads.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool, get_read_conn() as conn:
+        # Named cursors need a transaction; pool connections are autocommit.
+        with conn.transaction(), conn.cursor(name=JOB, row_factory=tuple_row) as cur:
+            cur.itersize = batch_size
+            cur.execute(_STREAM_SQL, {"after": after})
+            # Batches are committed in id order, so the checkpoint never skips
+            # a row; at most 2 * workers batches are held in memory.
+            pending = deque()
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if rows:
+                    pending.append((rows[-1][0], len(rows), pool.submit(_reparse, rows)))
+                while pending and (not rows or len(pending) > 2 * workers):
+                    position, count, future = pending.popleft()
+                    fixes = future.result()
+                    scanned += count
+                    stats["scanned"] += count
+                    stats["fixed_rows"] += len(fixes)
+                    for fix in fixes:
+                        for field, value in zip(MACROS, fix[2:]):
+                            if value:
+                                stats[field] += 1
+                                stats[f"{field}_added"] += value
+                    if not dry_run:
+                        _apply(fixes, position, stats)
+                    elapsed = time.perf_counter() - started
+                    if elapsed - last_report >= 10:
+                        last_report = elapsed
+                        print(f"id {position}: {scanned:,} rows, {scanned / elapsed:,.0f} rows/s", file=sys.stderr)
+                if not rows:
+                    break
+
+    elapsed = time.perf_counter() - started
+    return {**stats, "rows_per_second": round(scanned / elapsed) if elapsed else 0}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Re-parse stored AI answers and fill in zero calories/macros.")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, help="parser processes (default: CPU count)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint and start from the first row")
+    args = parser.parse_args(argv)
+
+    result = reparse_food_logs(args.batch_size, args.workers, args.dry_run, args.restart)
+    print(f"scanned {result.get('scanned', 0):,} rows, fixed {result.get('fixed_rows', 0):,} ({result['rows_per_second']:,} rows/s)")
+    for field in MACROS:
+        print(f"  {field:<8} +{result.get(field, 0):,} values, +{result.get(f'{field}_added', 0):,.0f} total")
+
+
+if __name__ == "__main__":
+    main()
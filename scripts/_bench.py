@@ -0,0 +1,95 @@
+import random
+import statistics
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable
+
+import user_cache
+import users_db
+
+# Shared helpers for the scripts/bench_*.py benchmarks. Run them from the
+# repository root against a scratch database (they create and delete their
+# own users), e.g.: DATABASE_URL=... python -m scripts.bench_history
+
+BENCH_TELEGRAM_ID = 990_000_000
+
+DISHES = (
+    "Гречка с курицей", "Овсянка на молоке", "Борщ со сметаной", "Омлет с сыром", "Плов с говядиной",
+    "Салат цезарь", "Творог с ягодами", "Паста карбонара", "Куриный суп", "Сырники со сметаной",
+    "Рис с лососем", "Пельмени", "Шакшука", "Греческий салат", "Котлета с пюре",
+)
+
+_SEED_MEALS_SQL = """
+    INSERT INTO food_logs (user_id, eaten_at, log_date, dish_name, calories, protein, fat, carbs, source, created_at)
+    SELECT u.id, m.eaten_at, (m.eaten_at AT TIME ZONE 'UTC')::date,
+        (%(dishes)s::text[])[1 + g %% cardinality(%(dishes)s::text[])] || ' #' || g,
+        200 + g %% 500, 5 + g %% 40, 3 + g %% 30, 10 + g %% 80,
+        (ARRAY['photo', 'text', 'voice'])[1 + g %% 3], m.eaten_at
+    FROM generate_series(1, %(meals)s) AS g
+    CROSS JOIN LATERAL (
+        SELECT date_trunc('day', NOW()) - ((g - 1) %% %(days)s) * INTERVAL '1 day' + (g %% 900) * INTERVAL '1 minute' AS eaten_at
+    ) m
+    JOIN users u ON u.telegram_id = %(telegram_id)s
+    RETURNING id
+"""
+
+_DELETE_USER_SQL = """
+    WITH logs AS (
+        DELETE FROM food_logs WHERE user_id = (SELECT id FROM users WHERE telegram_id = %(telegram_id)s) RETURNING id
+    ),
+    transcripts AS (
+        DELETE FROM food_log_transcripts WHERE food_log_id IN (SELECT id FROM logs)
+    )
+    DELETE FROM users WHERE telegram_id = %(telegram_id)s
+"""
+
+
+@contextmanager
+def seeded_user(telegram_id: int = BENCH_TELEGRAM_ID, meals: int = 6000, days: int = 30, transcript_size: int = 0):
+    """A user with `meals` meals spread over the last `days` days (and their daily totals)."""
+    delete_user(telegram_id)
+    users_db.ensure_user(telegram_id)
+    with users_db.get_conn() as conn:
+        ids = [row["id"] for row in conn.execute(
+            _SEED_MEALS_SQL, {"telegram_id": telegram_id, "meals": meals, "days": days, "dishes": list(DISHES)}
+        )]
+        if transcript_size:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO food_log_transcripts (food_log_id, body) VALUES (%s, %s)",
+                    [(log_id, zlib.compress(transcript(transcript_size).encode())) for log_id in ids],
+                )
+    users_db.rebuild_daily_totals(telegram_id)
+    try:
+        yield telegram_id
+    finally:
+        delete_user(telegram_id)
+
+
+def delete_user(telegram_id: int) -> None:
+    with users_db.get_conn() as conn:
+        conn.execute(_DELETE_USER_SQL, {"telegram_id": telegram_id})
+    user_cache.contexts.invalidate(telegram_id)
+
+
+def transcript(size: int) -> str:
+    """An AI answer of about `size` characters that compresses like a real one."""
+    lines = [
+        f"{random.choice(DISHES)}\nПорция: около {random.randint(150, 450)} г\n"
+        f"Ккал: ~{random.randint(200, 900)}\nБЖУ: {random.randint(5, 50)}/{random.randint(3, 40)}/{random.randint(10, 90)}\n"
+    ]
+    while sum(map(len, lines)) < size:
+        lines.append(f"Оценка по фото, погрешность {random.randint(10, 30)}%. Ингредиент {random.randint(1, 99)}: {random.randint(5, 200)} г. ")
+    return "".join(lines)[:size]
+
+
+def measure(fn: Callable[[], object], repeat: int = 20) -> float:
+    """Median wall time of fn() in seconds, after one warm-up call."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
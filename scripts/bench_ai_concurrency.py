@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+# Concurrent analyze_food_photo calls against a local fake OpenAI server that
+# answers after a fixed latency (user-024). With the async client, N photos
+# take about one latency as long as N is within AI_MAX_CONCURRENCY; beyond
+# that the gateway queues them in waves. No network or API key needed.
+
+ANSWER = "Борщ\nКкал: ~350\nБЖУ: 20/15/40"
+
+
+def fake_openai(latency: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        await request.body()
+        await asyncio.sleep(latency)
+        return {
+            "id": "bench", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": ANSWER}}],
+        }
+
+    return app
+
+
+def serve(app: FastAPI) -> str:
+    """Run app on a free local port in a daemon thread; returns its base URL."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def run(counts: list[int]) -> None:
+    from services.vision import analyze_food_photo
+
+    for count in counts:
+        started = time.perf_counter()
+        answers = await asyncio.gather(*(analyze_food_photo(b"\xff\xd8 bench photo") for _ in range(count)))
+        elapsed = time.perf_counter() - started
+        assert all(answer == ANSWER for answer in answers)
+        print(f"  {count:4} concurrent photos  {elapsed:6.2f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time concurrent photo analyses against a fake OpenAI server.")
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds the fake server takes per request")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    # The gateway builds its client from these at import, so set them first.
+    os.environ["OPENAI_BASE_URL"] = serve(fake_openai(args.latency))
+    os.environ["OPENAI_API_KEY"] = "bench"
+    print(f"fake OpenAI latency {args.latency:.1f} s, AI_MAX_CONCURRENCY={os.getenv('AI_MAX_CONCURRENCY', '16')}")
+    asyncio.run(run(args.counts))
+
+
+if __name__ == "__main__":
+    main()
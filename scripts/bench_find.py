@@ -0,0 +1,44 @@
+import argparse
+
+import user_cache
+import users_db
+from scripts._bench import measure, seeded_user
+
+# /find on a user with many meals (user-017), for each branch this database
+# can run: the plain ILIKE fallback always, the trigram search only where
+# pg_trgm is installed.
+
+QUERIES = ("гречка", "сырники", "карбонара", "греча")
+
+
+def installed() -> bool:
+    with users_db.get_conn() as conn:
+        return conn.execute(users_db._HAS_TRGM_SQL).fetchone()["installed"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time /find pages for the trigram and plain branches.")
+    parser.add_argument("--meals", type=int, default=6000)
+    args = parser.parse_args()
+
+    branches = {"plain": False}
+    if installed():
+        branches["trigram"] = True
+    else:
+        print("pg_trgm is not installed; timing the plain branch only")
+
+    with seeded_user(meals=args.meals, days=365) as telegram_id:
+        with users_db.get_conn() as conn:
+            conn.execute("ANALYZE food_logs")
+        print(f"{args.meals:,} meals in 365 days, first page of 10")
+        for name, trigram in branches.items():
+            users_db._extensions["pg_trgm"] = (trigram, user_cache.now())
+            for query in QUERIES:
+                page = users_db.find_food_logs(telegram_id, query)
+                elapsed = measure(lambda: users_db.find_food_logs(telegram_id, query))
+                print(f"  {name:<8} {query!r:<12} {elapsed * 1000:7.2f} ms  {len(page['items'])} items")
+        users_db._extensions.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import tracemalloc
+
+import users_db
+from scripts._bench import measure, seeded_user
+
+# /history before and after user-006: the old handler fetched every meal of the
+# window as a full row (with its AI answer) and summed and trimmed in Python;
+# get_history() sums the food_daily_totals rollup and returns only the page.
+
+_FULL_ROWS_SQL = f"""
+    SELECT f.*, t.body AS raw_ai_response
+    FROM food_logs f
+    LEFT JOIN food_log_transcripts t ON t.food_log_id = f.id
+    WHERE f.user_id = {users_db._INTERNAL_ID_SUBQUERY} AND f.log_date >= %(start_date)s
+    ORDER BY f.eaten_at DESC, f.id DESC
+"""
+
+
+def full_rows(telegram_id: int, days: int) -> dict:
+    with users_db.get_conn() as conn:
+        logs = conn.execute(_FULL_ROWS_SQL, {"telegram_id": telegram_id, "start_date": users_db._start_date(days)}).fetchall()
+    totals = {key: sum(float(row[key]) for row in logs) for key in ("calories", "protein", "fat", "carbs")}
+    return {"totals": totals, "items": logs[:20]}
+
+
+def peak_memory(fn) -> int:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the full-row /history path with get_history().")
+    parser.add_argument("--meals", type=int, default=6000)
+    parser.add_argument("--transcript-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    with seeded_user(meals=args.meals, days=30, transcript_size=args.transcript_size) as telegram_id:
+        paths = {
+            "full rows + Python": lambda: full_rows(telegram_id, 30),
+            "get_history": lambda: users_db.get_history(telegram_id, 30, limit=20),
+        }
+        print(f"{args.meals:,} meals in 30 days, {args.transcript_size:,}-character transcripts")
+        for name, fn in paths.items():
+            print(f"  {name:<20} {measure(fn) * 1000:8.1f} ms  peak {peak_memory(fn) / 2**20:6.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import users_db
+from scripts._bench import BENCH_TELEGRAM_ID, delete_user
+
+# activate_paid_subscription under redelivery (user-013): every charge is
+# delivered several times from concurrent threads, as Telegram retries do.
+# Each charge must extend PRO exactly once; reports deliveries per second.
+
+_SUMMARY_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM subscriptions s JOIN users u ON u.id = s.user_id WHERE u.telegram_id = %(telegram_id)s) AS subscriptions,
+        (SELECT COUNT(*) FROM payments p JOIN users u ON u.id = p.user_id WHERE u.telegram_id = %(telegram_id)s) AS payments,
+        (SELECT subscription_end - NOW() FROM users WHERE telegram_id = %(telegram_id)s) AS remaining
+"""
+
+
+def _payment(telegram_id: int, charge: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        telegram_payment_charge_id=f"bench-{telegram_id}-{charge}",
+        provider_payment_charge_id=None,
+        currency="XTR",
+        total_amount=500,
+        invoice_payload="pro_30",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deliver each payment several times concurrently and check PRO is extended once per charge.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--charges", type=int, default=5, help="distinct charges per user")
+    parser.add_argument("--deliveries", type=int, default=4, help="deliveries of each charge")
+    parser.add_argument("--threads", type=int, default=10)
+    args = parser.parse_args()
+
+    users = [BENCH_TELEGRAM_ID + n for n in range(args.users)]
+    for telegram_id in users:
+        delete_user(telegram_id)
+    jobs = [
+        (telegram_id, _payment(telegram_id, charge))
+        for _ in range(args.deliveries)
+        for telegram_id in users
+        for charge in range(args.charges)
+    ]
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            results = list(pool.map(lambda job: users_db.activate_paid_subscription(*job, days=30), jobs))
+        elapsed = time.perf_counter() - started
+
+        duplicates = sum(result["duplicate"] for result in results)
+        print(f"{len(jobs):,} deliveries from {args.threads} threads in {elapsed:.2f} s ({len(jobs) / elapsed:,.0f}/s), {duplicates:,} acknowledged as replays")
+        with users_db.get_conn() as conn:
+            for telegram_id in users:
+                row = conn.execute(_SUMMARY_SQL, {"telegram_id": telegram_id}).fetchone()
+                days = round(row["remaining"].total_seconds() / 86400)
+                ok = row["subscriptions"] == row["payments"] == args.charges and days == 30 * args.charges
+                if not ok:
+                    print(f"  user {telegram_id}: {row['payments']} payments, {row['subscriptions']} subscriptions, {days} days of PRO")
+        expected = len(users) * args.charges
+        print(f"expected {expected} payments and {30 * args.charges} days of PRO per user; mismatches are listed above")
+    finally:
+        for telegram_id in users:
+            delete_user(telegram_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import timeit
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+# The OpenAI client in bot's imports needs a key to construct; nothing is sent.
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+import bot  # noqa: E402
+from records import Profile, User  # noqa: E402
+from services.access import has_pro  # noqa: E402
+
+# Typed records (user-011) against the dict rows they replaced: the access
+# check every handler runs, building the records once per load, and rendering
+# a /history page. The "dict" variants are the pre-records code, kept here
+# verbatim so the comparison can be re-run. No database is needed.
+
+NOW = datetime.now(timezone.utc)
+
+USER_ROW = {
+    "id": 1, "telegram_id": 424242, "username": "bench", "first_name": "Bench", "last_name": None,
+    "user_type": "pro", "trial_start": NOW - timedelta(days=10), "trial_used": True,
+    "subscription_end": NOW + timedelta(days=20), "mode": "text", "used_promos": ["KING30"],
+    "photo_limit_date": date.today(), "photo_count_today": 1, "created_at": NOW, "updated_at": NOW,
+}
+PROFILE_ROW = {
+    "user_id": 1, "name": "Bench", "age": 30, "sex": "male", "height_cm": Decimal("180.0"), "weight_kg": Decimal("80.0"),
+    "goal": "maintain", "activity_factor": Decimal("1.55"), "daily_calories": Decimal("2600"), "daily_protein": Decimal("160"),
+    "daily_fat": Decimal("80"), "daily_carbs": Decimal("300"), "onboarding_completed": True, "updated_at": NOW,
+}
+ITEMS = [
+    {"id": i, "log_date": date.today(), "eaten_at": NOW, "dish_name": "Гречка с курицей",
+     "calories": Decimal("412.50"), "protein": Decimal("31.20"), "fat": Decimal("9.80"), "carbs": Decimal("48.00")}
+    for i in range(20)
+]
+TOTALS = {"calories": 2100.0, "protein": 130.0, "fat": 70.0, "carbs": 240.0, "entries": 5}
+
+
+def _dict_parse_dt(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _dict_normalize_user(user):
+    result = dict(user)
+    for key in ("trial_start", "subscription_end", "created_at", "updated_at"):
+        if result.get(key) is not None and isinstance(result[key], datetime):
+            result[key] = result[key].isoformat()
+    result["used_promos"] = result.get("used_promos") or []
+    return result
+
+
+def _dict_has_pro(user):
+    if not user:
+        return False
+    end = _dict_parse_dt(user.get("subscription_end"))
+    return bool(end and datetime.now(timezone.utc) < end)
+
+
+def _dict_num(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return float(value or 0)
+
+
+def _dict_target(profile, key):
+    if not profile or profile.get(key) is None:
+        return ""
+    return f" / {float(profile[key]):.0f}"
+
+
+def _dict_history(totals, logs, profile):
+    lines = [
+        "История за 30 дней", "",
+        f"Ккал: {totals['calories']:.0f}" + _dict_target(profile, "daily_calories"),
+        f"Белки: {totals['protein']:.0f} г" + _dict_target(profile, "daily_protein"),
+        f"Жиры: {totals['fat']:.0f} г" + _dict_target(profile, "daily_fat"),
+        f"Углеводы: {totals['carbs']:.0f} г" + _dict_target(profile, "daily_carbs"),
+        "",
+    ]
+    for row in logs:
+        lines.append(
+            f"• {row.get('log_date')}: {row.get('dish_name')} — "
+            f"{_dict_num(row.get('calories')):.0f} ккал, Б{_dict_num(row.get('protein')):.0f}/Ж{_dict_num(row.get('fat')):.0f}/У{_dict_num(row.get('carbs')):.0f}"
+        )
+    return "\n".join(lines)
+
+
+def _per_call(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def main() -> None:
+    dict_user = _dict_normalize_user(USER_ROW)
+    user = User.from_row(USER_ROW)
+    profile = Profile.from_row(PROFILE_ROW)
+    float_items = [{**item, **{key: float(item[key]) for key in ("calories", "protein", "fat", "carbs")}} for item in ITEMS]
+
+    cases = {
+        "has_pro": (lambda: _dict_has_pro(dict_user), lambda: has_pro(user), 200_000),
+        "build on load": (
+            lambda: _dict_normalize_user(USER_ROW),
+            lambda: (User.from_row(USER_ROW), Profile.from_row(PROFILE_ROW)),
+            50_000,
+        ),
+        "/history, 20 items": (
+            lambda: _dict_history(TOTALS, ITEMS, PROFILE_ROW),
+            lambda: bot._logs_summary("История за 30 дней", TOTALS, float_items, profile),
+            10_000,
+        ),
+    }
+    print(f"{'':<20} {'dict rows':>12} {'records':>12}")
+    for name, (old, new, number) in cases.items():
+        print(f"{name:<20} {_per_call(old, number) * 1e6:>9.2f} µs {_per_call(new, number) * 1e6:>9.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
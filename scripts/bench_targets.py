@@ -0,0 +1,110 @@
+import argparse
+import time
+
+import numpy as np
+
+from targets import calculate_targets, calculate_targets_batch
+
+# calculate_targets in a Python loop vs calculate_targets_batch (user-020),
+# over random profiles held in memory; no database needed. With --db N, also
+# seeds N profiles into DATABASE_URL and times recompute_targets over them
+# (a dry run, a full rewrite and a no-op re-run), then deletes them again.
+# The rewrite covers every profile in that database: scratch databases only.
+
+SEXES = np.array(["male", "female"], dtype=object)
+GOALS = np.array(["lose", "maintain", "gain", "health"], dtype=object)
+ACTIVITIES = np.array([1.2, 1.375, 1.55, 1.725])
+
+DB_TELEGRAM_ID = 992_000_000
+
+# Stored targets are zero, so the first real run rewrites every seeded row.
+_SEED_PROFILES_SQL = """
+    WITH seeded AS (
+        INSERT INTO users (telegram_id)
+        SELECT %(first)s + g FROM generate_series(1, %(count)s) AS g
+        ON CONFLICT (telegram_id) DO NOTHING
+        RETURNING id, telegram_id
+    )
+    INSERT INTO user_profiles (
+        user_id, age, sex, height_cm, weight_kg, goal, activity_factor,
+        daily_calories, daily_protein, daily_fat, daily_carbs, onboarding_completed
+    )
+    SELECT id, 16 + g %% 64, (ARRAY['male', 'female'])[1 + g %% 2], 150 + g %% 50, 45 + g %% 85,
+        (ARRAY['lose', 'maintain', 'gain', 'health'])[1 + g %% 4], (ARRAY[1.2, 1.375, 1.55, 1.725])[1 + g %% 4],
+        0, 0, 0, 0, TRUE
+    FROM seeded, LATERAL (SELECT telegram_id - %(first)s AS g) n
+"""
+
+_DELETE_PROFILES_SQL = "DELETE FROM users WHERE telegram_id > %(first)s AND telegram_id <= %(first)s + %(count)s"
+
+
+def random_profiles(count: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        "age": rng.integers(16, 80, count),
+        "sex": SEXES[rng.integers(0, len(SEXES), count)],
+        "height_cm": rng.uniform(150, 200, count).round(1),
+        "weight_kg": rng.uniform(45, 130, count).round(1),
+        "activity_factor": ACTIVITIES[rng.integers(0, len(ACTIVITIES), count)],
+        "goal": GOALS[rng.integers(0, len(GOALS), count)],
+    }
+
+
+def scalar(columns: dict) -> list[dict]:
+    keys = list(columns)
+    rows = [dict(zip(keys, values)) for values in zip(*(columns[key].tolist() for key in keys))]
+    return [calculate_targets(row, row["goal"]) for row in rows]
+
+
+def batch(columns: dict) -> dict:
+    return calculate_targets_batch(*columns.values())
+
+
+def timed(fn, *args) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time scalar vs vectorized target computation.")
+    parser.add_argument("--profiles", type=int, default=1_000_000)
+    parser.add_argument("--db", type=int, default=0, metavar="N", help="also seed N profiles and time recompute_targets against DATABASE_URL")
+    args = parser.parse_args()
+
+    columns = random_profiles(args.profiles)
+    scalar_time, scalar_result = timed(scalar, columns)
+    batch_time, batch_result = timed(batch, columns)
+    same = all(
+        np.array_equal(batch_result[key], np.array([row[key] for row in scalar_result]))
+        for key in ("calories", "protein_g", "fat_g", "carbs_g")
+    )
+    print(f"{args.profiles:,} profiles in memory")
+    print(f"  calculate_targets loop   {scalar_time:7.2f} s")
+    print(f"  calculate_targets_batch  {batch_time:7.2f} s  ({scalar_time / batch_time:.0f}x), identical: {same}")
+
+    if args.db:
+        bench_database(args.db)
+
+
+def bench_database(count: int) -> None:
+    from recompute_targets import recompute_targets
+    from users_db import get_conn
+
+    params = {"first": DB_TELEGRAM_ID, "count": count}
+    with get_conn() as conn:
+        conn.execute(_DELETE_PROFILES_SQL, params)
+        conn.execute(_SEED_PROFILES_SQL, params)
+        conn.execute("ANALYZE user_profiles")
+    try:
+        print(f"{count:,} seeded profiles in Postgres (plus any already there)")
+        for name, dry_run in (("dry run", True), ("full rewrite", False), ("no-op re-run", False)):
+            elapsed, result = timed(recompute_targets, 10_000, dry_run)
+            print(f"  recompute_targets {name:<13} {elapsed:7.2f} s  {result}")
+    finally:
+        with get_conn() as conn:
+            conn.execute(_DELETE_PROFILES_SQL, params)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from users_db import is_subscription_active
+from records import User
 
 
-def has_pro(user) -> bool:
-    return is_subscription_active(user)
+def has_pro(user: User | None) -> bool:
+    return user is not None and user.subscription_active
@@ -1,10 +1,4 @@
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
-
-load_dotenv()
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from services.ai_gateway import call, client
 
 SYSTEM_PROMPT = """
 Ты — помощник по питанию в стиле Павла Кузнецова: шеф, цифры, по делу.
@@ -22,7 +16,7 @@ MAX_HISTORY = 12  # 6 пар user/assistant
 VOICE_NAME = "alloy"  # один приятный голос (фикс)
 
 
-def generate_text(user_id: int, user_text: str) -> str:
+async def generate_text(user_id: int, user_text: str) -> str:
     if user_id not in USER_MEMORY:
         USER_MEMORY[user_id] = []
 
@@ -32,7 +26,9 @@ def generate_text(user_id: int, user_text: str) -> str:
     messages.extend(history)
     messages.append({"role": "user", "content": user_text})
 
-    resp = client.chat.completions.create(
+    resp = await call(
+        "chat",
+        client.chat.completions.create,
         model="gpt-4o-mini",
         messages=messages,
         temperature=0.6,
@@ -47,10 +43,12 @@ def generate_text(user_id: int, user_text: str) -> str:
     return answer
 
 
-def generate_voice_bytes(text: str) -> bytes:
-    speech = client.audio.speech.create(
+async def generate_voice_bytes(text: str) -> bytes:
+    speech = await call(
+        "speech",
+        client.audio.speech.create,
         model="gpt-4o-mini-tts",
         voice=VOICE_NAME,
         input=(text or "")[:260],  # коротко в голосе
     )
-    return speech.read()
+    return await speech.aread()
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import random
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+# Every OpenAI request goes through call(): one client and one connection pool
+# for the process, a timeout per kind of operation, retries with jittered
+# exponential backoff on 429/5xx/network errors, and a semaphore that caps
+# requests in flight so a burst queues here instead of turning into 429s.
+
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "16"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# Seconds per attempt.
+TIMEOUTS = {
+    "chat": 30.0,
+    "vision": 60.0,
+    "transcribe": 60.0,
+    "speech": 30.0,
+}
+
+_RETRYABLE = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    # Retries are ours, so they can release the semaphore while backing off.
+    max_retries=0,
+    # The SDK's default client (its timeouts and redirect handling), with the
+    # pool sized to the semaphore.
+    http_client=openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=AI_MAX_CONCURRENCY, max_keepalive_connections=AI_MAX_CONCURRENCY),
+    ),
+)
+
+_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+T = TypeVar("T")
+
+
+async def call(operation: str, create: Callable[..., Awaitable[T]], **kwargs) -> T:
+    """Run a client method, e.g. call("chat", client.chat.completions.create, model=..., messages=...)."""
+    timeout = TIMEOUTS[operation]
+    for attempt in range(AI_MAX_RETRIES + 1):
+        try:
+            async with _semaphore:
+                return await create(timeout=timeout, **kwargs)
+        except _RETRYABLE as exc:
+            if attempt == AI_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_retry_delay(attempt, exc))
+
+
+def _retry_delay(attempt: int, exc: Exception) -> float:
+    # Full jitter, so clients that failed together do not retry together.
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(delay, min(float(retry_after), RETRY_MAX_DELAY)) if retry_after else delay
+    except ValueError:
+        return delay
@@ -1,10 +1,6 @@
-import os
 import base64
-from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from services.ai_gateway import call, client
 
 VISION_SYSTEM = """
 Распознай еду на фото.
@@ -16,11 +12,13 @@ VISION_SYSTEM = """
 Если не еда — так и скажи.
 """
 
-def analyze_food_photo(image_bytes: bytes) -> str:
+async def analyze_food_photo(image_bytes: bytes) -> str:
     b64 = base64.b64encode(image_bytes).decode("utf-8")
     data_url = f"data:image/jpeg;base64,{b64}"
 
-    resp = client.chat.completions.create(
+    resp = await call(
+        "vision",
+        client.chat.completions.create,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": VISION_SYSTEM},
@@ -0,0 +1,177 @@
+import hmac
+import os
+
+from users_db import get_conn
+from users_db_async import get_read_conn
+
+# Operator stats for GET /admin/stats. The route only reads the small stats_*
+# rollup tables; refresh() brings them up to date from the rows added to
+# food_logs, users and payments since its last run, tracked as id watermarks
+# in maintenance_checkpoints. Rows younger than REFRESH_LAG are left for the
+# next run, so a transaction that committed late with a lower id is not
+# skipped. Active users are recounted for every day a batch touches, from the
+# food_daily_totals rollup.
+
+REFRESH_LAG = "2 minutes"
+REFRESH_BATCH = 50_000
+
+# Shared by every replica; refreshes run one at a time so no batch is counted twice.
+STATS_LOCK_KEY = 7_413_550_022
+
+_INCREMENT_SQL = """
+    WITH after AS (
+        SELECT COALESCE((SELECT position FROM maintenance_checkpoints WHERE job = '{job}'), 0) AS id
+    ),
+    candidates AS (
+        SELECT id, created_at, {columns} FROM {table}
+        WHERE id > (SELECT id FROM after)
+        ORDER BY id
+        LIMIT %(limit)s
+    ),
+    batch AS (
+        SELECT * FROM candidates
+        WHERE id < COALESCE(
+            (SELECT MIN(id) FROM candidates WHERE created_at >= NOW() - %(lag)s::interval), 9223372036854775807
+        )
+    ),
+    {rollups},
+    checkpoint AS (
+        INSERT INTO maintenance_checkpoints (job, position)
+        SELECT '{job}', COALESCE(MAX(id), (SELECT id FROM after)) FROM batch
+        ON CONFLICT (job) DO UPDATE SET position = EXCLUDED.position, updated_at = NOW()
+    )
+    SELECT COUNT(*) AS rows FROM batch
+"""
+
+_INCREMENTS = {
+    "stats:food_logs": _INCREMENT_SQL.format(
+        job="stats:food_logs",
+        table="food_logs",
+        columns="log_date, source",
+        rollups="""
+    meals AS (
+        INSERT INTO stats_daily_meals AS s (day, source, meals)
+        SELECT log_date, source, COUNT(*) FROM batch GROUP BY 1, 2
+        ON CONFLICT (day, source) DO UPDATE SET meals = s.meals + EXCLUDED.meals
+    ),
+    active AS (
+        INSERT INTO stats_daily AS s (day, active_users)
+        SELECT d.day, (SELECT COUNT(*) FROM food_daily_totals t WHERE t.log_date = d.day)
+        FROM (SELECT DISTINCT log_date AS day FROM batch) d
+        ON CONFLICT (day) DO UPDATE SET active_users = EXCLUDED.active_users, updated_at = NOW()
+    )""",
+    ),
+    "stats:users": _INCREMENT_SQL.format(
+        job="stats:users",
+        table="users",
+        columns="created_at::date AS day",
+        rollups="""
+    signups AS (
+        INSERT INTO stats_daily AS s (day, new_users)
+        SELECT day, COUNT(*) FROM batch GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET new_users = s.new_users + EXCLUDED.new_users, updated_at = NOW()
+    )""",
+    ),
+    "stats:payments": _INCREMENT_SQL.format(
+        job="stats:payments",
+        table="payments",
+        columns="created_at::date AS day, user_id, currency, total_amount, status",
+        rollups="""
+    revenue AS (
+        INSERT INTO stats_daily_revenue AS s (day, currency, payments, amount)
+        SELECT day, currency, COUNT(*), SUM(total_amount) FROM batch WHERE status = 'successful' GROUP BY 1, 2
+        ON CONFLICT (day, currency) DO UPDATE SET payments = s.payments + EXCLUDED.payments, amount = s.amount + EXCLUDED.amount
+    ),
+    conversions AS (
+        -- A conversion is a user's first successful payment.
+        INSERT INTO stats_daily AS s (day, conversions)
+        SELECT day, COUNT(DISTINCT user_id) FROM batch b
+        WHERE status = 'successful' AND NOT EXISTS (
+            SELECT 1 FROM payments p WHERE p.user_id = b.user_id AND p.status = 'successful' AND p.id < b.id
+        )
+        GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET conversions = s.conversions + EXCLUDED.conversions, updated_at = NOW()
+    )""",
+    ),
+}
+
+# refreshed_at is the oldest stats:* watermark time, read in the same snapshot
+# as the rollups (on the replica, if configured), so it describes the numbers
+# returned rather than the primary: behind a lagging replica it is older, never
+# newer. Treat it as a lower bound on freshness. Rows created up to about
+# REFRESH_LAG before it are counted; newer ones may or may not be.
+_LOAD_STATS_SQL = """
+    SELECT
+        (
+            SELECT COALESCE(json_agg(d ORDER BY d.day), '[]'::json)
+            FROM (
+                SELECT g.day::date AS day,
+                    COALESCE(s.active_users, 0) AS active_users,
+                    COALESCE(s.new_users, 0) AS new_users,
+                    COALESCE(s.conversions, 0) AS conversions,
+                    COALESCE((SELECT json_object_agg(m.source, m.meals) FROM stats_daily_meals m WHERE m.day = g.day), '{}'::json) AS meals,
+                    COALESCE((SELECT json_object_agg(r.currency, r.amount) FROM stats_daily_revenue r WHERE r.day = g.day), '{}'::json) AS revenue
+                FROM generate_series(CURRENT_DATE - (%(days)s::int - 1), CURRENT_DATE, INTERVAL '1 day') AS g(day)
+                LEFT JOIN stats_daily s ON s.day = g.day
+            ) d
+        ) AS days,
+        (SELECT MIN(updated_at) FROM maintenance_checkpoints WHERE job LIKE 'stats:%%') AS refreshed_at
+"""
+
+
+def refresh(batch_size: int = REFRESH_BATCH) -> dict:
+    """Fold new food_logs, users and payments rows into the stats rollups; returns rows per source."""
+    counts = {}
+    for job, statement in _INCREMENTS.items():
+        counts[job] = 0
+        while True:
+            with get_conn() as conn, conn.transaction():
+                conn.execute("SELECT pg_advisory_xact_lock(%s)", (STATS_LOCK_KEY,))
+                rows = conn.execute(statement, {"limit": batch_size, "lag": REFRESH_LAG}).fetchone()["rows"]
+            counts[job] += rows
+            if rows < batch_size:
+                break
+    return counts
+
+
+def authorized(authorization: str | None) -> bool:
+    """Bearer token check against ADMIN_TOKEN; without the variable nobody is authorized."""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token or not authorization:
+        return False
+    return hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+
+
+async def load_stats(days: int = 30) -> dict:
+    """The /admin/stats payload for the last days days, read from the rollups on the replica."""
+    days = min(max(days, 1), 366)
+    async with get_read_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_LOAD_STATS_SQL, {"days": days})
+            row = await cur.fetchone()
+    series = row["days"]
+
+    meals: dict[str, int] = {}
+    revenue: dict[str, int] = {}
+    for day in series:
+        day["meals_total"] = sum(day["meals"].values())
+        for source, count in day["meals"].items():
+            meals[source] = meals.get(source, 0) + count
+        for currency, amount in day["revenue"].items():
+            revenue[currency] = revenue.get(currency, 0) + amount
+    new_users = sum(day["new_users"] for day in series)
+    conversions = sum(day["conversions"] for day in series)
+    return {
+        "days": days,
+        "refreshed_at": row["refreshed_at"],
+        "summary": {
+            "average_dau": round(sum(day["active_users"] for day in series) / days, 1),
+            "meals": sum(meals.values()),
+            "meals_by_source": meals,
+            "new_users": new_users,
+            "conversions": conversions,
+            "conversion_rate": round(conversions / new_users, 4) if new_users else None,
+            "revenue": revenue,
+        },
+        "daily": series,
+    }
@@ -1,3 +1,19 @@
+import numpy as np
+
+# Mifflin–St Jeor constant by sex; anything but "male" uses the female one.
+SEX_OFFSETS = {"male": 5, "female": -161}
+
+# goal -> (calorie factor on TDEE, protein g/kg, fat g/kg); unknown goals maintain.
+GOAL_FACTORS = {
+    "lose": (0.82, 1.7, 0.8),
+    "gain": (1.12, 1.8, 0.9),
+    "health": (0.95, 1.6, 0.9),
+    "maintain": (1.0, 1.6, 0.9),
+}
+
+MIN_CALORIES = 1200
+
+
 def calculate_targets(profile: dict, goal: str) -> dict:
     age = int(profile["age"])
     sex = profile["sex"]              # male/female
@@ -6,31 +22,15 @@ def calculate_targets(profile: dict, goal: str) -> dict:
     act = float(profile["activity_factor"])
 
     # Mifflin–St Jeor
-    if sex == "male":
-        bmr = 10*w + 6.25*h - 5*age + 5
-    else:
-        bmr = 10*w + 6.25*h - 5*age - 161
-
+    bmr = 10*w + 6.25*h - 5*age + SEX_OFFSETS["male" if sex == "male" else "female"]
     tdee = bmr * act
 
-    if goal == "lose":
-        calories = tdee * 0.82
-        protein = 1.7 * w
-        fat = 0.8 * w
-    elif goal == "gain":
-        calories = tdee * 1.12
-        protein = 1.8 * w
-        fat = 0.9 * w
-    elif goal == "health":
-        calories = tdee * 0.95
-        protein = 1.6 * w
-        fat = 0.9 * w
-    else:  # maintain
-        calories = tdee
-        protein = 1.6 * w
-        fat = 0.9 * w
-
-    calories = max(1200, calories)
+    calorie_factor, protein_per_kg, fat_per_kg = GOAL_FACTORS.get(goal, GOAL_FACTORS["maintain"])
+    calories = tdee * calorie_factor
+    protein = protein_per_kg * w
+    fat = fat_per_kg * w
+
+    calories = max(MIN_CALORIES, calories)
     carbs = (calories - protein*4 - fat*9) / 4
     carbs = max(0, carbs)
 
@@ -39,4 +39,40 @@ def calculate_targets(profile: dict, goal: str) -> dict:
         "protein_g": float(protein),
         "fat_g": float(fat),
         "carbs_g": float(carbs)
-    }
\ No newline at end of file
+    }
+
+
+def calculate_targets_batch(age, sex, height_cm, weight_kg, activity_factor, goal) -> dict:
+    """calculate_targets over arrays, one element per profile.
+
+    Takes array-likes of equal length (sex and goal as strings) and returns a
+    dict of float64 arrays with the same keys. The arithmetic is done in the
+    same order as the scalar version, so results match it exactly.
+    """
+    age = np.asarray(age, dtype=np.int64)
+    h = np.asarray(height_cm, dtype=np.float64)
+    w = np.asarray(weight_kg, dtype=np.float64)
+    act = np.asarray(activity_factor, dtype=np.float64)
+    male = np.asarray(sex, dtype=object) == "male"
+
+    bmr = 10*w + 6.25*h - 5*age + np.where(male, SEX_OFFSETS["male"], SEX_OFFSETS["female"])
+    tdee = bmr * act
+
+    # Map each goal to its row of GOAL_FACTORS; unknown goals use "maintain".
+    names = list(GOAL_FACTORS)
+    factors = np.array([GOAL_FACTORS[name] for name in names])
+    index = np.full(len(w), names.index("maintain"))
+    goal = np.asarray(goal, dtype=object)
+    for i, name in enumerate(names):
+        index[goal == name] = i
+    calorie_factor, protein_per_kg, fat_per_kg = factors[index].T
+
+    calories = tdee * calorie_factor
+    protein = protein_per_kg * w
+    fat = fat_per_kg * w
+
+    calories = np.maximum(MIN_CALORIES, calories)
+    carbs = (calories - protein*4 - fat*9) / 4
+    carbs = np.maximum(0, carbs)
+
+    return {"calories": calories, "protein_g": protein, "fat_g": fat, "carbs_g": carbs}
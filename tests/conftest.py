@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+# The OpenAI clients are built at import time and refuse to start without a
+# key; tests never reach the API, so any value will do.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+
+@pytest.fixture(scope="session")
+def db():
+    """A migrated test database; tests that need one skip without DATABASE_URL.
+
+    Tests seed their own users with high telegram ids and delete them again,
+    but point DATABASE_URL at a scratch database, never at production.
+    """
+    if not os.getenv("DATABASE_URL"):
+        pytest.skip("DATABASE_URL is not set")
+    import migrations
+    import users_db
+
+    migrations.migrate()
+    yield users_db
+    users_db.close_pool()
@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from services import ai_gateway
+
+# call() against a fake client method: no network or API key needed.
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+# The real backoff, before no_backoff replaces it.
+retry_delay = ai_gateway._retry_delay
+
+
+def _status_error(cls: type, status: int, headers: dict | None = None) -> openai.APIStatusError:
+    return cls("fake", response=httpx.Response(status, headers=headers, request=REQUEST), body=None)
+
+
+class FakeCreate:
+    """Fails with each error in turn, then answers "ok"; records every attempt."""
+
+    def __init__(self, *errors: Exception, latency: float = 0.0):
+        self.errors = list(errors)
+        self.latency = latency
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+
+    async def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.errors:
+                raise self.errors.pop(0)
+            return "ok"
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ai_gateway, "_retry_delay", lambda attempt, exc: 0)
+
+
+def _run(create: FakeCreate, operation: str = "chat", **kwargs):
+    return asyncio.run(ai_gateway.call(operation, create, **kwargs))
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(openai.RateLimitError, 429),
+    _status_error(openai.InternalServerError, 503),
+    openai.APIConnectionError(request=REQUEST),
+])
+def test_retries_then_succeeds(error):
+    create = FakeCreate(*[error] * ai_gateway.AI_MAX_RETRIES)
+    assert _run(create, model="gpt-4o-mini") == "ok"
+    assert len(create.calls) == ai_gateway.AI_MAX_RETRIES + 1
+    assert all(call == {"timeout": ai_gateway.TIMEOUTS["chat"], "model": "gpt-4o-mini"} for call in create.calls)
+
+
+def test_retries_are_capped():
+    error = _status_error(openai.RateLimitError, 429)
+    create = FakeCreate(*[error] * (ai_gateway.AI_MAX_RETRIES + 5))
+    with pytest.raises(openai.RateLimitError):
+        _run(create)
+    assert len(create.calls) == ai_gateway.AI_MAX_RETRIES + 1
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(openai.BadRequestError, 400),
+    _status_error(openai.AuthenticationError, 401),
+    ValueError("not an API error"),
+])
+def test_other_errors_are_not_retried(error):
+    create = FakeCreate(error)
+    with pytest.raises(type(error)):
+        _run(create)
+    assert len(create.calls) == 1
+
+
+@pytest.mark.parametrize("operation", ai_gateway.TIMEOUTS)
+def test_timeout_per_operation(operation):
+    create = FakeCreate()
+    _run(create, operation)
+    assert create.calls == [{"timeout": ai_gateway.TIMEOUTS[operation]}]
+
+
+def test_concurrency_is_capped(monkeypatch):
+    create = FakeCreate(latency=0.01)
+    count = 3 * ai_gateway.AI_MAX_CONCURRENCY
+
+    async def burst():
+        # A semaphore for this event loop; the module's own may be bound to another.
+        monkeypatch.setattr(ai_gateway, "_semaphore", asyncio.Semaphore(ai_gateway.AI_MAX_CONCURRENCY))
+        return await asyncio.gather(*(ai_gateway.call("chat", create) for _ in range(count)))
+
+    assert asyncio.run(burst()) == ["ok"] * count
+    assert create.max_in_flight == ai_gateway.AI_MAX_CONCURRENCY
+
+
+def test_retry_after_is_honoured():
+    error = _status_error(openai.RateLimitError, 429, {"retry-after": "3"})
+    assert retry_delay(0, error) == 3.0
+    error = _status_error(openai.RateLimitError, 429, {"retry-after": "120"})
+    assert retry_delay(0, error) == ai_gateway.RETRY_MAX_DELAY
+    for attempt in range(10):
+        assert 0 <= retry_delay(attempt, openai.APIConnectionError(request=REQUEST)) <= ai_gateway.RETRY_MAX_DELAY
@@ -0,0 +1,72 @@
+import pytest
+
+import user_cache
+from scripts._bench import seeded_user
+
+# /find has a trigram branch (pg_trgm installed) and a plain ILIKE fallback.
+# Every substring match the fallback finds, the trigram branch finds too; only
+# the trigram branch finds misspelled names.
+
+QUERIES = ("гречка", "СЫРНИКИ", "суп")
+MISSPELLED = "гречкв"
+
+
+@pytest.fixture(scope="module")
+def telegram_id(db):
+    with seeded_user(meals=600, days=30) as telegram_id:
+        yield telegram_id
+
+
+def _installed(db) -> bool:
+    with db.get_conn() as conn:
+        return conn.execute(db._HAS_TRGM_SQL).fetchone()["installed"]
+
+
+def _find_all(db, telegram_id: int, text: str, monkeypatch, trigram: bool) -> list[dict]:
+    monkeypatch.setitem(db._extensions, "pg_trgm", (trigram, user_cache.now()))
+    items, offset = [], 0
+    while True:
+        page = db.find_food_logs(telegram_id, text, limit=100, offset=offset)
+        items += page["items"]
+        if not page["has_more"]:
+            return items
+        offset += 100
+
+
+@pytest.mark.parametrize("text", QUERIES)
+def test_plain(db, telegram_id, monkeypatch, text):
+    items = _find_all(db, telegram_id, text, monkeypatch, trigram=False)
+    assert items
+    assert all(text.lower() in item["dish_name"].lower() for item in items)
+    # Earliest match position first, then newest first.
+    position = lambda item: item["dish_name"].lower().find(text.lower())
+    assert items == sorted(items, key=lambda item: (position(item), -item["eaten_at"].timestamp(), -item["id"]))
+
+
+@pytest.mark.parametrize("text", QUERIES)
+def test_trigram_covers_plain(db, telegram_id, monkeypatch, text):
+    if not _installed(db):
+        pytest.skip("pg_trgm is not installed")
+    plain = _find_all(db, telegram_id, text, monkeypatch, trigram=False)
+    trigram = _find_all(db, telegram_id, text, monkeypatch, trigram=True)
+    # Trigram search may add near matches, but never loses a substring match
+    # and ranks every one of them above the near matches.
+    assert {item["id"] for item in plain} <= {item["id"] for item in trigram}
+    exact = [text.lower() in item["dish_name"].lower() for item in trigram]
+    assert exact == sorted(exact, reverse=True)
+
+
+def test_trigram_finds_misspelling(db, telegram_id, monkeypatch):
+    if not _installed(db):
+        pytest.skip("pg_trgm is not installed")
+    assert not _find_all(db, telegram_id, MISSPELLED, monkeypatch, trigram=False)
+    trigram = _find_all(db, telegram_id, MISSPELLED, monkeypatch, trigram=True)
+    assert any(item["dish_name"].startswith("Гречка") for item in trigram)
+
+
+def test_stale_answer_is_checked_again(db, telegram_id, monkeypatch):
+    installed = _installed(db)
+    checked_at = user_cache.now() - db.EXTENSION_RECHECK_SECONDS - 1
+    monkeypatch.setitem(db._extensions, "pg_trgm", (not installed, checked_at))
+    db.find_food_logs(telegram_id, "суп")
+    assert db._extensions["pg_trgm"][0] is installed
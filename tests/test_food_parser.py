@@ -0,0 +1,44 @@
+import pytest
+
+from food_parser import parse_food_ai_response
+
+# Each phrasing the parser claims to understand, plus answers in the format the
+# vision prompt asks for, which the parser in handlers/media.py already read.
+
+FIELDS = ("calories", "protein", "fat", "carbs")
+
+CASES = {
+    # Formats the old parser handled: they must keep parsing the same way.
+    "baseline": (
+        "Борщ с говядиной\nКалории: 350 ккал\nБелки: 20 г\nЖиры: 15 г\nУглеводы: 40 г",
+        (350, 20, 15, 40),
+    ),
+    "baseline inline units": ("Сырники\n~420 ккал, 18 г белка, 22 г жира, 38 г углеводов", (420, 18, 22, 38)),
+    "baseline decimals": ("Салат\nКалории: 120,5 ккал\nБелки: 3.5 г\nЖиры: 9,2 г\nУглеводы: 7 г", (120.5, 3.5, 9.2, 7)),
+    "baseline portions": ("Пельмени\nКалорийность: 2 порции по 150 ккал", (150, 0, 0, 0)),
+    "baseline loose": ("Омлет\nКалории на порцию примерно 250\nБелков около 14 грамм", (250, 14, 0, 0)),
+    # Phrasings added with the re-parser.
+    "value after label": ("Борщ\nКкал: ~350\nБЖУ: 20/15/40", (350, 20, 15, 40)),
+    "range": ("Паста\nКалорийность (оценочно) — 350–400 ккал\nБелки: 12-14 г", (375, 13, 0, 0)),
+    "thousands": ("Пицца целиком\n1 200 ккал\nЖиры: 1 050,5 г", (1200, 0, 1050.5, 0)),
+    "short labels": ("Гречка\nБ: 20 г\nЖ: 5 г\nУ: 60 г", (0, 20, 5, 60)),
+    "compact macros": ("Плов\nб/ж/у — 20 г / 15 г / 40 г\n~600 ккал", (600, 20, 15, 40)),
+    "english": ("Pancakes\nCalories: 350 kcal\nProtein: 20g\nFat: 15 g\nCarbs: 40 g", (350, 20, 15, 40)),
+    "missing": ("Непонятное блюдо", (0, 0, 0, 0)),
+}
+
+
+@pytest.mark.parametrize("text, expected", CASES.values(), ids=CASES.keys())
+def test_parse(text, expected):
+    parsed = parse_food_ai_response(text)
+    assert parsed["dish_name"] == text.splitlines()[0]
+    assert tuple(parsed[field] for field in FIELDS) == tuple(float(value) for value in expected)
+
+
+@pytest.mark.parametrize("text, dish_name", [
+    ("Что на фото: Борщ\nКкал: 350", "Борщ"),
+    ("1) Овсянка\nКкал: 300", "Овсянка"),
+    ("", "Еда с фото"),
+])
+def test_dish_name(text, dish_name):
+    assert parse_food_ai_response(text)["dish_name"] == dish_name
@@ -0,0 +1,69 @@
+import pytest
+
+import food_spool
+from scripts._bench import BENCH_TELEGRAM_ID, delete_user
+
+TELEGRAM_ID = BENCH_TELEGRAM_ID + 600
+
+_MEALS_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM food_logs WHERE user_id = u.id) AS meals,
+        (SELECT SUM(entries) FROM food_daily_totals WHERE user_id = u.id) AS entries,
+        (SELECT SUM(calories) FROM food_daily_totals WHERE user_id = u.id) AS calories
+    FROM users u WHERE u.telegram_id = %(telegram_id)s
+"""
+
+
+@pytest.fixture
+def spool(db, tmp_path, monkeypatch):
+    monkeypatch.setenv("FOOD_SPOOL_PATH", str(tmp_path / "food_spool.sqlite3"))
+    monkeypatch.setattr(food_spool, "_db", None)
+    delete_user(TELEGRAM_ID)
+    yield food_spool
+    food_spool._conn().close()
+    delete_user(TELEGRAM_ID)
+
+
+def _respool(spool) -> None:
+    # What a lost COMMIT reply leaves behind: rows already stored in Postgres
+    # are still in the journal and get replayed again.
+    spool._conn().execute("INSERT INTO food_spool (entry, spooled_at) SELECT entry, spooled_at FROM spool_copy")
+
+
+def test_replay_is_idempotent(db, spool):
+    spool.append(TELEGRAM_ID, "Гречка", 300, 10, 5, 50, "ответ", "text")
+    spool.append(TELEGRAM_ID, "Суп", 200, 8, 6, 20, None, "voice")
+    spool._conn().execute("CREATE TABLE spool_copy AS SELECT * FROM food_spool")
+
+    assert spool.replay() == 2
+    _respool(spool)
+    assert spool.replay() == 2
+    _respool(spool)
+    # The row-by-row path after a rejected batch must skip them as well.
+    assert len(spool._replay_one_by_one(spool._conn().execute("SELECT id, entry FROM food_spool").fetchall())) == 2
+
+    with db.get_conn() as conn:
+        row = conn.execute(_MEALS_SQL, {"telegram_id": TELEGRAM_ID}).fetchone()
+    assert (row["meals"], row["entries"], row["calories"]) == (2, 2, 500)
+
+
+def test_stats_age_pending_rows_only(tmp_path, monkeypatch):
+    monkeypatch.setenv("FOOD_SPOOL_PATH", str(tmp_path / "food_spool.sqlite3"))
+    monkeypatch.setattr(food_spool, "_db", None)
+    assert food_spool.stats() == {"pending": 0, "parked": 0, "oldest_age_seconds": None}
+
+    food_spool.append(TELEGRAM_ID, "Гречка", 300, 10, 5, 50, None, "text")
+    food_spool.append(TELEGRAM_ID, "Суп", 200, 8, 6, 20, None, "text")
+    conn = food_spool._conn()
+    # The first row was parked a day ago; the backlog is only the second one.
+    conn.execute(
+        "UPDATE food_spool SET attempts = ?, spooled_at = spooled_at - 86400 WHERE id = (SELECT MIN(id) FROM food_spool)",
+        (food_spool.MAX_ATTEMPTS,),
+    )
+    stats = food_spool.stats()
+    assert (stats["pending"], stats["parked"]) == (1, 1)
+    assert stats["oldest_age_seconds"] < 60
+
+    conn.execute("UPDATE food_spool SET attempts = ?", (food_spool.MAX_ATTEMPTS,))
+    assert food_spool.stats() == {"pending": 0, "parked": 2, "oldest_age_seconds": None}
+    conn.close()
@@ -0,0 +1,82 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg
+import pytest
+
+from scripts._bench import BENCH_TELEGRAM_ID, delete_user
+
+# Concurrent taps on a promo code: several taps per user and more users than
+# the code's max_uses. Each user redeems at most once, the code at most
+# max_uses times, and every tap is exactly one statement.
+
+CODE = "PYTEST_PROMO"
+MAX_USES = 5
+USERS = [BENCH_TELEGRAM_ID + 700 + n for n in range(12)]
+TAPS_PER_USER = 4
+
+_SUMMARY_SQL = """
+    SELECT u.telegram_id,
+        cardinality(array_positions(u.used_promos, %(code)s)) AS marked,
+        (SELECT COUNT(*) FROM subscriptions s WHERE s.user_id = u.id) AS subscriptions
+    FROM users u WHERE u.telegram_id = ANY(%(users)s)
+"""
+
+
+class CountingCursor(psycopg.Cursor):
+    executed: list[str] = []
+
+    def execute(self, query, *args, **kwargs):
+        CountingCursor.executed.append(query)
+        return super().execute(query, *args, **kwargs)
+
+
+@pytest.fixture
+def promo(db, monkeypatch):
+    get_conn = db.get_conn
+
+    @contextmanager
+    def counting_conn():
+        with get_conn() as conn:
+            conn.cursor_factory = CountingCursor
+            try:
+                yield conn
+            finally:
+                conn.cursor_factory = psycopg.Cursor
+
+    for telegram_id in USERS:
+        delete_user(telegram_id)
+        db.ensure_user(telegram_id)
+    with get_conn() as conn:
+        conn.execute("DELETE FROM promo_codes WHERE code = %s", (CODE,))
+        conn.execute("INSERT INTO promo_codes (code, days, max_uses) VALUES (%s, 7, %s)", (CODE, MAX_USES))
+    monkeypatch.setattr(db, "get_conn", counting_conn)
+    CountingCursor.executed.clear()
+    yield
+    monkeypatch.undo()
+    for telegram_id in USERS:
+        delete_user(telegram_id)
+    with get_conn() as conn:
+        conn.execute("DELETE FROM promo_codes WHERE code = %s", (CODE,))
+
+
+def test_concurrent_taps(db, promo):
+    taps = [telegram_id for _ in range(TAPS_PER_USER) for telegram_id in USERS]
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda telegram_id: (telegram_id, db.redeem_promo_code(telegram_id, CODE)), taps))
+
+    redeemed = Counter(telegram_id for telegram_id, result in results if result["status"] == "ok")
+    assert all(count == 1 for count in redeemed.values()), redeemed
+    assert len(redeemed) == MAX_USES
+    assert {result["status"] for _, result in results} <= {"ok", "used", "exhausted"}
+
+    statements = len(CountingCursor.executed)
+    with db.get_conn() as conn:
+        assert conn.execute("SELECT uses FROM promo_codes WHERE code = %s", (CODE,)).fetchone()["uses"] == MAX_USES
+        rows = conn.execute(_SUMMARY_SQL, {"code": CODE, "users": USERS}).fetchall()
+    for row in rows:
+        expected = 1 if row["telegram_id"] in redeemed else 0
+        assert (row["marked"] or 0, row["subscriptions"]) == (expected, expected), row
+
+    assert statements == len(taps)
@@ -0,0 +1,164 @@
+import pytest
+
+from scripts._bench import seeded_user
+
+# EXPLAIN (ANALYZE, BUFFERS) regression checks for the hot per-user queries:
+# each must be answered by its index (migration 5, or the food_daily_totals
+# primary key for /today) without a Sort or a Seq Scan anywhere in the plan,
+# and must touch no more shared buffers than its budget. Budgets are about
+# twice what the seeded data needs, so a plan that starts reading the whole
+# window, or the heap where the index used to suffice, fails.
+
+# Other users' rows, so the tested user is a small slice of each table as in
+# production and the planner has no reason to prefer a Seq Scan.
+FILLER_USERS = 3000
+FILLER_MEALS = 40
+
+_SEED_FILLER_SQL = """
+    WITH filler AS (
+        INSERT INTO users (telegram_id)
+        SELECT 991000000 + g FROM generate_series(1, %(count)s) AS g
+        ON CONFLICT (telegram_id) DO NOTHING
+        RETURNING id
+    ),
+    profiles AS (
+        INSERT INTO user_profiles (user_id, name, age, sex, height_cm, weight_kg, goal, activity_factor, onboarding_completed)
+        SELECT id, 'Филлер', 30, 'female', 165, 60, 'maintain', 1.375, TRUE FROM filler
+    )
+    INSERT INTO food_logs (user_id, eaten_at, log_date, dish_name, calories, protein, fat, carbs, source)
+    SELECT f.id, NOW() - g * INTERVAL '1 day', (NOW() - g * INTERVAL '1 day')::date, 'Каша', 300, 10, 8, 40,
+        (ARRAY['photo', 'text', 'voice'])[1 + g %% 3]
+    FROM filler f CROSS JOIN generate_series(0, %(meals)s - 1) AS g
+"""
+
+_SEED_FILLER_TOTALS_SQL = """
+    INSERT INTO food_daily_totals (user_id, log_date, calories, protein, fat, carbs, entries)
+    SELECT user_id, log_date, SUM(calories), SUM(protein), SUM(fat), SUM(carbs), COUNT(*)
+    FROM food_logs
+    WHERE user_id IN (SELECT id FROM users WHERE telegram_id > 991000000 AND telegram_id <= 991000000 + %(count)s)
+    GROUP BY user_id, log_date
+    ON CONFLICT (user_id, log_date) DO NOTHING
+"""
+
+_DELETE_FILLER_SQL = "DELETE FROM users WHERE telegram_id > 991000000 AND telegram_id <= 991000000 + %(count)s"
+
+_CHILD_INDEXES_SQL = """
+    SELECT c.relname FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.relname = %(index)s
+"""
+
+
+@pytest.fixture(scope="module")
+def telegram_id(db):
+    with db.get_conn() as conn:
+        conn.execute(_DELETE_FILLER_SQL, {"count": FILLER_USERS})
+        conn.execute(_SEED_FILLER_SQL, {"count": FILLER_USERS, "meals": FILLER_MEALS})
+        conn.execute(_SEED_FILLER_TOTALS_SQL, {"count": FILLER_USERS})
+    with seeded_user(meals=20000, days=60) as telegram_id:
+        db.save_profile(telegram_id, {
+            "name": "Тест", "age": 30, "sex": "male", "height_cm": 180, "weight_kg": 80, "goal": "maintain",
+            "activity_factor": 1.55, "food_restrictions": None,
+            "daily_calories": 2600, "daily_protein": 128, "daily_fat": 72, "daily_carbs": 350,
+        })
+        # VACUUM sets the visibility map, so index-only scans skip the heap as
+        # they do on a settled production table and the buffer counts are stable.
+        with db.get_conn() as conn:
+            for table in ("users", "user_profiles", "food_logs", "food_daily_totals"):
+                conn.execute(f"VACUUM ANALYZE {table}")
+        yield telegram_id
+    with db.get_conn() as conn:
+        conn.execute(_DELETE_FILLER_SQL, {"count": FILLER_USERS})
+
+
+def _plan(db, statement: str, params: dict) -> tuple[list[dict], int]:
+    """The plan nodes and the shared buffers the execution touched (hit + read)."""
+    with db.get_conn() as conn:
+        row = conn.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, params).fetchone()
+    root = row["QUERY PLAN"][0]["Plan"]
+    nodes, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get("Plans", ()))
+    # A node's buffer counts include its children's, so the root's are the
+    # sum over the whole plan. Planning buffers (catalog lookups) are left out.
+    return nodes, root["Shared Hit Blocks"] + root["Shared Read Blocks"]
+
+
+def _index_names(db, index: str) -> set[str]:
+    # A partitioned index shows up in plans under its per-partition names.
+    with db.get_conn() as conn:
+        return {index} | {row["relname"] for row in conn.execute(_CHILD_INDEXES_SQL, {"index": index})}
+
+
+def _assert_plan(db, statement: str, params: dict, index: str, max_blocks: int, sort: bool = False) -> None:
+    """Answered by index (or its partitions), no Seq Scan, no Sort unless allowed, within max_blocks buffers."""
+    nodes, blocks = _plan(db, statement, params)
+    types = [node["Node Type"] for node in nodes]
+    if not sort:
+        assert "Sort" not in types and "Incremental Sort" not in types, types
+    # Empty partitions (the months created ahead) are seq-scanned for free.
+    scans = [node for node in nodes if node["Node Type"] == "Seq Scan" and node["Shared Hit Blocks"] + node["Shared Read Blocks"]]
+    assert not scans, [node["Relation Name"] for node in scans]
+    names = _index_names(db, index)
+    assert any(
+        node["Node Type"] in ("Index Scan", "Index Only Scan", "Bitmap Index Scan") and node.get("Index Name") in names
+        for node in nodes
+    ), [(node["Node Type"], node.get("Index Name")) for node in nodes]
+    assert blocks <= max_blocks, f"{blocks} shared buffers, budget {max_blocks}"
+
+
+@pytest.mark.parametrize("direction", [None, "older", "newer"])
+def test_history_page(db, telegram_id, direction):
+    # A cursor deep in the window: next to the newest rows the planner may sort
+    # the few rows ahead of it, which costs nothing; deeper down a sort would
+    # mean reading the whole window for every page.
+    item = db.get_history(telegram_id, 30, limit=1000)["items"][-1]
+    cursor = (item["log_date"], item["eaten_at"], item["id"]) if direction else None
+    _assert_plan(
+        db, db._history_sql(cursor, direction), db._history_params(telegram_id, 30, 20, cursor),
+        "idx_food_logs_user_date_eaten", 40,
+    )
+
+
+def test_load_user_context(db, telegram_id):
+    # Runs on every update that misses the user cache.
+    _assert_plan(db, db._LOAD_USER_CONTEXT_SQL, db._ensure_user_params(telegram_id, None), "users_telegram_id_key", 30)
+
+
+def test_daily_totals(db, telegram_id):
+    _assert_plan(db, db._GET_DAILY_TOTALS_SQL, {"telegram_id": telegram_id}, "food_daily_totals_pkey", 20)
+
+
+def test_daily_series(db, telegram_id):
+    # At most `days` rows; depending on the statistics the planner reads them
+    # with a bitmap scan and sorts them, which the buffer budget still bounds.
+    params = {"telegram_id": telegram_id, "days": 30}
+    _assert_plan(db, db._GET_DAILY_SERIES_SQL, params, "food_daily_totals_pkey", 20, sort=True)
+
+
+def test_food_logs(db, telegram_id):
+    # Full rows for /today: one heap page per meal on top of the index, and the
+    # seeded user has about 330 meals a day.
+    _assert_plan(db, db._GET_FOOD_LOGS_SQL, db._food_logs_params(telegram_id, 1), "idx_food_logs_user_date_eaten", 700)
+
+
+def test_photo_count(db, telegram_id):
+    _assert_plan(db, db._COUNT_PHOTO_LOGS_TODAY_SQL, {"telegram_id": telegram_id}, "idx_food_logs_user_photo_date", 20)
+
+
+def test_find_plain(db, telegram_id):
+    # Ranked by match position, so the matches are sorted; the scan is still
+    # limited to this user's index entries.
+    params = db._find_params(telegram_id, "гречка", 10, 0)
+    _assert_plan(db, db._FIND_FOOD_LOGS_PLAIN_SQL, params, "idx_food_logs_user_date_eaten", 800, sort=True)
+
+
+def test_find_trigram(db, telegram_id):
+    with db.get_conn() as conn:
+        if not conn.execute(db._HAS_TRGM_SQL).fetchone()["installed"]:
+            pytest.skip("pg_trgm is not installed")
+    params = db._find_params(telegram_id, "гречка", 10, 0)
+    _assert_plan(db, db._FIND_FOOD_LOGS_TRGM_SQL, params, "idx_food_logs_user_dish_trgm", 800, sort=True)
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from scripts._bench import BENCH_TELEGRAM_ID, delete_user, seeded_user
+
+# /week and /month label the window the rollup query read: it ends on the
+# database's CURRENT_DATE, whatever the bot process's time zone says.
+
+
+def _database_today(db):
+    with db.get_conn() as conn:
+        return conn.execute("SELECT CURRENT_DATE AS today").fetchone()["today"]
+
+
+def test_window_ends_on_database_date(db):
+    with seeded_user(meals=200, days=60) as telegram_id:
+        series = db.get_daily_series(telegram_id, 7)
+    today = series["today"]
+    assert today == _database_today(db)
+    assert series["days"]
+    assert all(today - timedelta(days=7) < day["log_date"] <= today for day in series["days"])
+    assert [day["log_date"] for day in series["days"]] == sorted(day["log_date"] for day in series["days"])
+
+
+def test_window_without_meals(db):
+    telegram_id = BENCH_TELEGRAM_ID + 800
+    delete_user(telegram_id)
+    db.ensure_user(telegram_id)
+    try:
+        assert db.get_daily_series(telegram_id, 30) == {"today": _database_today(db), "days": []}
+    finally:
+        delete_user(telegram_id)
@@ -0,0 +1,106 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import psycopg
+import pytest
+from psycopg.rows import dict_row
+
+import user_cache
+from scripts._bench import BENCH_TELEGRAM_ID, delete_user
+
+# Every users_db operation below must cost one network round trip. The
+# connection is traced with libpq's protocol trace: a round trip is a run of
+# frontend (F) messages answered by backend (B) messages.
+
+TELEGRAM_ID = BENCH_TELEGRAM_ID + 500
+
+PROFILE = {
+    "name": "Тест", "age": 30, "sex": "female", "height_cm": 170, "weight_kg": 65, "goal": "maintain",
+    "activity_factor": 1.375, "food_restrictions": None,
+    "daily_calories": 2000, "daily_protein": 100, "daily_fat": 70, "daily_carbs": 250,
+}
+
+
+class Tracer:
+    def __init__(self):
+        self.conn = psycopg.connect(os.environ["DATABASE_URL"], autocommit=True, row_factory=dict_row)
+        self.round_trips = 0
+
+    @contextmanager
+    def connection(self, user_id=None):
+        yield self.conn
+
+    @contextmanager
+    def tracing(self):
+        with tempfile.TemporaryFile() as file:
+            self.conn.pgconn.trace(file.fileno())
+            self.conn.pgconn.set_trace_flags(psycopg.pq.Trace.SUPPRESS_TIMESTAMPS | psycopg.pq.Trace.REGRESS_MODE)
+            try:
+                yield
+            finally:
+                # untrace() flushes libpq's buffered trace output.
+                self.conn.pgconn.untrace()
+            file.seek(0)
+            self.round_trips = _count_round_trips(file.read().decode(errors="replace"))
+
+
+def _count_round_trips(trace: str) -> int:
+    trips, sending = 0, False
+    for line in trace.splitlines():
+        if line.startswith("F"):
+            sending = True
+        elif line.startswith("B") and sending:
+            trips += 1
+            sending = False
+    return trips
+
+
+@pytest.fixture
+def tracer(db, monkeypatch):
+    tracer = Tracer()
+    # Both pools resolve to the one traced connection; pool checkout health
+    # checks are not part of the operation being measured.
+    monkeypatch.setattr(db, "get_conn", tracer.connection)
+    monkeypatch.setattr(db, "get_read_conn", tracer.connection)
+    delete_user(TELEGRAM_ID)
+    db.save_profile(TELEGRAM_ID, PROFILE)
+    db.add_food_log(TELEGRAM_ID, "Гречка", 300, 10, 5, 50, "ответ", "text")
+    user_cache.contexts.clear()
+    yield tracer
+    delete_user(TELEGRAM_ID)
+    tracer.conn.close()
+
+
+def _payment(charge: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        telegram_payment_charge_id=charge, provider_payment_charge_id=None,
+        currency="XTR", total_amount=500, invoice_payload="pro_30",
+    )
+
+
+OPERATIONS = {
+    "load_user_context": lambda db: db.load_user_context(TELEGRAM_ID),
+    "save_profile": lambda db: db.save_profile(TELEGRAM_ID, PROFILE),
+    "update_user": lambda db: db.update_user(TELEGRAM_ID, "mode", "text"),
+    "add_food_log": lambda db: db.add_food_log(TELEGRAM_ID, "Суп", 200, 8, 6, 20, "ответ", "text"),
+    "add_food_logs": lambda db: db.add_food_logs([
+        {"user_id": TELEGRAM_ID, "dish_name": f"Блюдо {n}", "calories": 100, "protein": 1, "fat": 1, "carbs": 1,
+         "raw_ai_response": None, "source": "text"}
+        for n in range(5)
+    ]),
+    "get_daily_totals": lambda db: db.get_daily_totals(TELEGRAM_ID),
+    "get_history": lambda db: db.get_history(TELEGRAM_ID, days=30),
+    "consume_photo_quota": lambda db: db.consume_photo_quota(TELEGRAM_ID, 5),
+    "redeem_promo_code": lambda db: db.redeem_promo_code(TELEGRAM_ID, "KING30"),
+    "activate_paid_subscription": lambda db: db.activate_paid_subscription(TELEGRAM_ID, _payment(f"rt-{TELEGRAM_ID}")),
+    "rebuild_daily_totals": lambda db: db.rebuild_daily_totals(TELEGRAM_ID),
+}
+
+
+@pytest.mark.parametrize("operation", OPERATIONS)
+def test_one_round_trip(db, tracer, operation):
+    with tracer.tracing():
+        OPERATIONS[operation](db)
+    assert tracer.round_trips == 1
@@ -0,0 +1,69 @@
+import itertools
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from handlers.onboarding import ACTIVITY_MAP, GOAL_MAP, SEX_MAP
+from targets import GOAL_FACTORS, MIN_CALORIES, calculate_targets, calculate_targets_batch
+
+# calculate_targets_batch must give exactly what calculate_targets gives, for
+# every sex/goal/activity onboarding can store plus values it never stores.
+
+SEXES = sorted(set(SEX_MAP.values())) + ["other", None]
+GOALS = sorted(set(GOAL_MAP.values()) | set(GOAL_FACTORS)) + ["bulk", None]
+ACTIVITIES = sorted(set(ACTIVITY_MAP.values())) + [1.0, 1.9]
+COMBINATIONS = list(itertools.product(SEXES, GOALS, ACTIVITIES))
+
+KEYS = ("calories", "protein_g", "fat_g", "carbs_g")
+
+
+def _random_profiles(rng: np.random.Generator, count: int) -> list[dict]:
+    # Ages, heights and weights from implausible to extreme, so both the
+    # MIN_CALORIES floor and the zero-carbs clamp are hit.
+    return [
+        {
+            "age": int(rng.integers(10, 100)),
+            "sex": SEXES[rng.integers(len(SEXES))],
+            "height_cm": float(rng.uniform(100, 230)),
+            "weight_kg": float(rng.uniform(25, 250)),
+            "activity_factor": ACTIVITIES[rng.integers(len(ACTIVITIES))],
+            "goal": GOALS[rng.integers(len(GOALS))],
+        }
+        for _ in range(count)
+    ]
+
+
+def _assert_batch_matches(profiles: list[dict]) -> dict:
+    batch = calculate_targets_batch(
+        *([profile[key] for profile in profiles] for key in ("age", "sex", "height_cm", "weight_kg", "activity_factor", "goal"))
+    )
+    for i, profile in enumerate(profiles):
+        expected = calculate_targets(profile, profile["goal"])
+        assert {key: float(batch[key][i]) for key in KEYS} == expected, profile
+    return batch
+
+
+@pytest.mark.parametrize("sex, goal, activity", COMBINATIONS)
+def test_every_combination(sex, goal, activity):
+    profiles = _random_profiles(np.random.default_rng(COMBINATIONS.index((sex, goal, activity))), 50)
+    for profile in profiles:
+        profile.update(sex=sex, goal=goal, activity_factor=activity)
+    _assert_batch_matches(profiles)
+
+
+def test_random_profiles():
+    batch = _assert_batch_matches(_random_profiles(np.random.default_rng(20), 20_000))
+    # The clamps are exercised, not just the plain formula.
+    assert (batch["calories"] == MIN_CALORIES).any()
+    assert (batch["carbs_g"] == 0).any()
+
+
+def test_database_values():
+    # recompute_targets passes NUMERIC columns straight from Postgres.
+    profile = {"age": 34, "sex": "female", "height_cm": Decimal("167.5"), "weight_kg": Decimal("61.3"), "activity_factor": Decimal("1.375"), "goal": "lose"}
+    _assert_batch_matches([profile])
+
+
+def test_empty_batch():
+    assert all(len(values) == 0 for values in calculate_targets_batch([], [], [], [], [], []).values())
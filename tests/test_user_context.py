@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+import user_cache
+import users_db_async
+from records import Profile, User
+
+
+def _update(telegram_id: int, text: str):
+    async def reply_text(*args, **kwargs):
+        replies.append(args[0] if args else kwargs.get("text"))
+
+    replies = []
+    tg_user = SimpleNamespace(id=telegram_id, username=None, first_name=None, last_name=None)
+    message = SimpleNamespace(text=text, reply_text=reply_text)
+    return SimpleNamespace(effective_user=tg_user, effective_chat=SimpleNamespace(id=telegram_id), message=message), replies
+
+
+def test_one_user_round_trip_per_update(monkeypatch):
+    fetched = []
+
+    async def fetch_user_context(user_id, tg_user=None):
+        fetched.append(user_id)
+        user = User(id=1, telegram_id=user_id, mode="voice")
+        return {"id": 1, "user": user, "profile": Profile(user_id=1, onboarding_completed=True)}
+
+    async def generate_text(user_id, text):
+        return "ответ"
+
+    user_cache.contexts.clear()
+    monkeypatch.setattr(users_db_async, "_fetch_user_context", fetch_user_context)
+    monkeypatch.setattr(bot, "generate_text", generate_text)
+
+    async def run_update(telegram_id):
+        # PTB hands the same CallbackContext to every handler of one update.
+        update, replies = _update(telegram_id, "что съесть на ужин?")
+        context = SimpleNamespace(user_data={}, bot=None)
+        await bot.handle_message(update, context)  # command: loads the context
+        # smart_reply inside it has already checked access: voice mode needs PRO.
+        assert "PRO" in replies[0]
+        await bot.start(update, context)  # profile read
+        assert len(replies) == 2
+
+    asyncio.run(run_update(990001))
+    assert fetched == [990001]
+
+    # The next update gets a new CallbackContext and loads the user again
+    # (the process-wide cache is bypassed by the stub).
+    asyncio.run(run_update(990001))
+    assert fetched == [990001, 990001]
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    ``put`` takes the monotonic time the value was read at and an optional
+    version (e.g. the row's ``updated_at``). A read that started before the
+    last ``invalidate`` of its key, or that carries an older version than the
+    cached entry, is dropped, so a slow query cannot resurrect stale data.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Any, tuple[float, Any, Any]] = OrderedDict()
+        self._invalidated: OrderedDict[Any, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Any, value: Any, loaded_at: float, version: Any = None) -> None:
+        with self._lock:
+            if self._invalidated.get(key, float("-inf")) >= loaded_at:
+                return
+            current = self._data.get(key)
+            if current is not None and version is not None and current[1] is not None and current[1] > version:
+                return
+            self._data[key] = (loaded_at + self.ttl, version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data.pop(key, None)
+            self._invalidated[key] = now
+            self._invalidated.move_to_end(key)
+            # A marker only matters to reads that were in flight when it was set.
+            while self._invalidated and next(iter(self._invalidated.values())) < now - self.ttl:
+                self._invalidated.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._invalidated.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+def now() -> float:
+    return time.monotonic()
+
+
+# Keyed by telegram_id; values are load_user_context() results. Every write in
+# users_db invalidates its key. Other replicas only see our writes once their
+# entries expire, so the TTL bounds how long a stale entitlement can survive.
+contexts = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
+
+# Telegram ids that wrote recently; users_db routes their reads to the primary
+# until the replica has had time to catch up.
+recent_writes = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("REPLICA_STICKY_SECONDS", "10")),
+)
+
+
+def mark_written(key: Any, invalidate_context: bool = True) -> None:
+    if invalidate_context:
+        contexts.invalidate(key)
+    recent_writes.put(key, True, now())
+
+
+def wrote_recently(key: Any) -> bool:
+    return key is not None and recent_writes.get(key, False)
@@ -1,14 +1,19 @@
 import json
 import os
+import threading
+import zlib
 from contextlib import contextmanager
 from datetime import date, datetime, timedelta, timezone
 from typing import Any
 
-import psycopg
 from dotenv import load_dotenv
 from psycopg.conninfo import make_conninfo
 from psycopg.rows import dict_row
 from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
+
+import user_cache
+from records import Profile, User
 
 # Railway injects variables into the real process environment. Load a local
 # .env only as a development fallback and never override production env values.
@@ -120,359 +125,963 @@ def is_database_configured() -> bool:
     return database_config_error() is None
 
 
+def _env_int(name: str, default: int) -> int:
+    value = _env(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = _env(name)
+    return float(value) if value else default
+
+
+def _pool_settings() -> dict[str, Any]:
+    min_size = _env_int("DB_POOL_MIN_SIZE", 1)
+    return {
+        "min_size": min_size,
+        "max_size": max(_env_int("DB_POOL_MAX_SIZE", 10), min_size),
+        "max_idle": _env_float("DB_POOL_MAX_IDLE", 300.0),
+        "max_lifetime": _env_float("DB_POOL_MAX_LIFETIME", 3600.0),
+        "timeout": _env_float("DB_POOL_TIMEOUT", 10.0),
+    }
+
+
+_REPLICA_URL_ENV_NAMES = ("DATABASE_REPLICA_URL", "DATABASE_REPLICA_PRIVATE_URL", "DATABASE_REPLICA_PUBLIC_URL")
+
+
+def _replica_url() -> str | None:
+    for name in _REPLICA_URL_ENV_NAMES:
+        url = _env(name)
+        if url:
+            return url
+    return None
+
+
+_pool: ConnectionPool | None = None
+_replica_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def _open_pool(conninfo: str, name: str) -> ConnectionPool:
+    pool = ConnectionPool(
+        conninfo,
+        kwargs={"row_factory": dict_row, "autocommit": True},
+        check=ConnectionPool.check_connection,
+        name=name,
+        open=False,
+        **_pool_settings(),
+    )
+    pool.open()
+    return pool
+
+
+def get_pool() -> ConnectionPool:
+    # Opened lazily so the bot can still start in degraded mode without a DB.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _open_pool(_database_url(), "users_db")
+        return _pool
+
+
+def get_replica_pool() -> ConnectionPool | None:
+    """Pool for the read replica, or None when DATABASE_REPLICA_URL is not set."""
+    global _replica_pool
+    url = _replica_url()
+    if not url:
+        return None
+    with _pool_lock:
+        if _replica_pool is None:
+            _replica_pool = _open_pool(url, "users_db_replica")
+        return _replica_pool
+
+
+def close_pool() -> None:
+    global _pool, _replica_pool
+    with _pool_lock:
+        for pool in (_pool, _replica_pool):
+            if pool is not None:
+                pool.close()
+        _pool = _replica_pool = None
+
+
 @contextmanager
 def get_conn():
-    with psycopg.connect(_database_url(), row_factory=dict_row) as conn:
+    # Pool connections are in autocommit mode: a single statement is its own
+    # transaction and costs one round trip, where psycopg would otherwise send
+    # BEGIN and COMMIT separately. Multi-statement work that must be atomic runs
+    # in conn.pipeline() with cur.execute("BEGIN") ... cur.execute("COMMIT")
+    # queued like any other statement, so the whole transaction is still one
+    # round trip; conn.transaction() would wait for the server at each step.
+    with get_pool().connection() as conn:
+        yield conn
+
+
+@contextmanager
+def get_read_conn(user_id: int | None = None):
+    """Connection for read-only queries: the replica if configured, else the primary.
+
+    A user who wrote within REPLICA_STICKY_SECONDS reads from the primary, so
+    e.g. a meal saved a moment ago already shows up in /today.
+    """
+    pool = None if user_cache.wrote_recently(user_id) else get_replica_pool()
+    with (pool or get_pool()).connection() as conn:
         yield conn
 
 
 def init_db() -> None:
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    id BIGSERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    user_type TEXT NOT NULL DEFAULT 'free',
-                    trial_start TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    trial_used BOOLEAN NOT NULL DEFAULT FALSE,
-                    subscription_end TIMESTAMPTZ,
-                    mode TEXT NOT NULL DEFAULT 'text',
-                    used_promos TEXT[] NOT NULL DEFAULT ARRAY[]::TEXT[],
-                    photo_limit_date DATE,
-                    photo_count_today INTEGER NOT NULL DEFAULT 0,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS photo_limit_date DATE")
-            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS photo_count_today INTEGER NOT NULL DEFAULT 0")
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
-                    name TEXT,
-                    age INTEGER,
-                    sex TEXT,
-                    height_cm NUMERIC(6,2),
-                    weight_kg NUMERIC(6,2),
-                    goal TEXT,
-                    activity_factor NUMERIC(4,2),
-                    food_restrictions TEXT,
-                    daily_calories NUMERIC(8,2),
-                    daily_protein NUMERIC(8,2),
-                    daily_fat NUMERIC(8,2),
-                    daily_carbs NUMERIC(8,2),
-                    onboarding_completed BOOLEAN NOT NULL DEFAULT FALSE,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS food_logs (
-                    id BIGSERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    eaten_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    log_date DATE NOT NULL DEFAULT CURRENT_DATE,
-                    dish_name TEXT NOT NULL,
-                    calories NUMERIC(8,2) NOT NULL DEFAULT 0,
-                    protein NUMERIC(8,2) NOT NULL DEFAULT 0,
-                    fat NUMERIC(8,2) NOT NULL DEFAULT 0,
-                    carbs NUMERIC(8,2) NOT NULL DEFAULT 0,
-                    raw_ai_response TEXT,
-                    source TEXT NOT NULL CHECK (source IN ('photo', 'text', 'voice')),
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-            cur.execute(
-                "CREATE INDEX IF NOT EXISTS idx_food_logs_user_date ON food_logs(user_id, log_date DESC)"
-            )
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS payments (
-                    id BIGSERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    telegram_payment_charge_id TEXT,
-                    provider_payment_charge_id TEXT,
-                    currency TEXT NOT NULL,
-                    total_amount INTEGER NOT NULL,
-                    payload TEXT,
-                    status TEXT NOT NULL DEFAULT 'successful',
-                    raw_payment JSONB,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS subscriptions (
-                    id BIGSERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    payment_id BIGINT REFERENCES payments(id) ON DELETE SET NULL,
-                    starts_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    ends_at TIMESTAMPTZ NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'active',
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
+    # The schema lives in migrations.py; on an up-to-date database this is one
+    # cheap version check instead of replaying every CREATE/ALTER on boot.
+    from migrations import migrate
+    from partitions import ensure_partitions
+
+    migrate()
+    ensure_partitions()
+
+
+# SQL is shared with users_db_async so the sync and async APIs stay identical.
+# Names are refreshed only when Telegram reports a change, so a known user's
+# upsert is a plain index lookup instead of a row rewrite on every update.
+_ENSURE_USER_SQL = """
+    INSERT INTO users (telegram_id, username, first_name, last_name)
+    VALUES (%(telegram_id)s, %(username)s, %(first_name)s, %(last_name)s)
+    ON CONFLICT (telegram_id) DO UPDATE SET
+        username = COALESCE(EXCLUDED.username, users.username),
+        first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+        last_name = COALESCE(EXCLUDED.last_name, users.last_name),
+        updated_at = NOW()
+    WHERE COALESCE(EXCLUDED.username, users.username) IS DISTINCT FROM users.username
+       OR COALESCE(EXCLUDED.first_name, users.first_name) IS DISTINCT FROM users.first_name
+       OR COALESCE(EXCLUDED.last_name, users.last_name) IS DISTINCT FROM users.last_name
+"""
+
+# One round trip for everything a handler needs about the sender: the upsert
+# above, the users row and the profile (as JSON, NULL before onboarding).
+_LOAD_USER_CONTEXT_SQL = f"""
+    WITH upserted AS (
+        {_ENSURE_USER_SQL}
+        RETURNING *
+    ),
+    target AS (
+        SELECT * FROM upserted
+        UNION ALL
+        SELECT * FROM users
+        WHERE telegram_id = %(telegram_id)s AND NOT EXISTS (SELECT 1 FROM upserted)
+    )
+    SELECT target.*, to_jsonb(p) AS profile
+    FROM target
+    LEFT JOIN user_profiles p ON p.user_id = target.id
+"""
+
+# Prefix for writes that need the internal id: creates the users row if it is
+# missing and exposes its id as target_user, all inside the caller's statement.
+_TARGET_USER_CTE = """
+    WITH ensured AS (
+        INSERT INTO users (telegram_id) VALUES (%(telegram_id)s)
+        ON CONFLICT (telegram_id) DO NOTHING
+        RETURNING id
+    ),
+    target_user AS (
+        SELECT id FROM ensured
+        UNION ALL
+        SELECT id FROM users WHERE telegram_id = %(telegram_id)s
+    )
+"""
+
+_INTERNAL_ID_SUBQUERY = "(SELECT id FROM users WHERE telegram_id = %(telegram_id)s)"
+
+_GET_USER_SQL = "SELECT * FROM users WHERE telegram_id = %(telegram_id)s"
+
+_GET_INTERNAL_USER_ID_SQL = _TARGET_USER_CTE + "SELECT id FROM target_user LIMIT 1"
+
+_USER_FIELDS = {"user_type", "trial_start", "trial_used", "subscription_end", "mode", "used_promos"}
+
+_UPDATE_USER_SQL = """
+    INSERT INTO users (telegram_id, {key}) VALUES (%(telegram_id)s, %(value)s)
+    ON CONFLICT (telegram_id) DO UPDATE SET {key} = EXCLUDED.{key}, updated_at = NOW()
+"""
+
+_SAVE_PROFILE_SQL = _TARGET_USER_CTE + """
+    INSERT INTO user_profiles (
+        user_id, name, age, sex, height_cm, weight_kg, goal, activity_factor,
+        food_restrictions, daily_calories, daily_protein, daily_fat, daily_carbs,
+        onboarding_completed
+    )
+    SELECT id, %(name)s, %(age)s, %(sex)s, %(height_cm)s, %(weight_kg)s,
+        %(goal)s, %(activity_factor)s, %(food_restrictions)s, %(daily_calories)s,
+        %(daily_protein)s, %(daily_fat)s, %(daily_carbs)s, TRUE
+    FROM target_user LIMIT 1
+    ON CONFLICT (user_id) DO UPDATE SET
+        name = EXCLUDED.name,
+        age = EXCLUDED.age,
+        sex = EXCLUDED.sex,
+        height_cm = EXCLUDED.height_cm,
+        weight_kg = EXCLUDED.weight_kg,
+        goal = EXCLUDED.goal,
+        activity_factor = EXCLUDED.activity_factor,
+        food_restrictions = EXCLUDED.food_restrictions,
+        daily_calories = EXCLUDED.daily_calories,
+        daily_protein = EXCLUDED.daily_protein,
+        daily_fat = EXCLUDED.daily_fat,
+        daily_carbs = EXCLUDED.daily_carbs,
+        onboarding_completed = TRUE,
+        updated_at = NOW()
+"""
+
+_GET_PROFILE_SQL = f"SELECT * FROM user_profiles WHERE user_id = {_INTERNAL_ID_SUBQUERY}"
+
+_DAILY_TOTALS_UPSERT = """
+    INSERT INTO food_daily_totals AS t (user_id, log_date, calories, protein, fat, carbs, entries)
+    SELECT user_id, log_date, calories, protein, fat, carbs, 1 FROM inserted
+    ON CONFLICT (user_id, log_date) DO UPDATE SET
+        calories = t.calories + EXCLUDED.calories,
+        protein = t.protein + EXCLUDED.protein,
+        fat = t.fat + EXCLUDED.fat,
+        carbs = t.carbs + EXCLUDED.carbs,
+        entries = t.entries + 1
+"""
+
+# The food_daily_totals row is bumped by the same statement that inserts the
+# meal, so the rollup can never disagree with committed food_logs. The AI
+# transcript goes compressed to food_log_transcripts; food_logs.raw_ai_response
+# is only read for rows written before the side table existed. A meal with a
+# client_key (food_spool replays) that is already stored inserts nothing, so
+# the totals are not bumped twice, and its existing id is returned.
+_FOOD_LOG_DATE = "COALESCE(%(eaten_at)s::timestamptz::date, CURRENT_DATE)"
+
+_ADD_FOOD_LOG_SQL = _TARGET_USER_CTE + f"""
+    , inserted AS (
+        INSERT INTO food_logs (user_id, eaten_at, log_date, dish_name, calories, protein, fat, carbs, source, client_key)
+        SELECT id, COALESCE(%(eaten_at)s::timestamptz, NOW()), {_FOOD_LOG_DATE},
+            %(dish_name)s, %(calories)s, %(protein)s, %(fat)s, %(carbs)s, %(source)s, %(client_key)s::uuid
+        FROM target_user LIMIT 1
+        ON CONFLICT (client_key, log_date) WHERE client_key IS NOT NULL DO NOTHING
+        RETURNING id, user_id, log_date, calories, protein, fat, carbs
+    ),
+    transcript AS (
+        INSERT INTO food_log_transcripts (food_log_id, body)
+        SELECT id, %(transcript)s::bytea FROM inserted WHERE %(transcript)s::bytea IS NOT NULL
+    ),
+    totals AS ({_DAILY_TOTALS_UPSERT})
+    SELECT id FROM inserted
+    UNION ALL
+    SELECT id FROM food_logs
+    WHERE client_key = %(client_key)s::uuid AND log_date = {_FOOD_LOG_DATE} AND NOT EXISTS (SELECT 1 FROM inserted)
+"""
+
+_GET_FOOD_LOG_TRANSCRIPT_SQL = """
+    SELECT t.body, f.raw_ai_response
+    FROM food_logs f
+    LEFT JOIN food_log_transcripts t ON t.food_log_id = f.id
+    WHERE f.id = %(log_id)s
+"""
+
+# /find matches by substring and, where pg_trgm is installed (migration 8), by
+# trigram word similarity so typos still hit; both are served by
+# idx_food_logs_user_dish_trgm. Without the extension it is a plain ILIKE over
+# the user's rows.
+_FIND_FOOD_LOGS_SQL = f"""
+    SELECT id, eaten_at, log_date, dish_name, calories, protein, fat, carbs
+    FROM food_logs
+    WHERE user_id = {_INTERNAL_ID_SUBQUERY} AND {{match}}
+    ORDER BY {{rank}}, eaten_at DESC, id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+_FIND_FOOD_LOGS_TRGM_SQL = _FIND_FOOD_LOGS_SQL.format(
+    match="(dish_name ILIKE %(pattern)s OR %(query)s <%% dish_name)",
+    rank="word_similarity(%(query)s, dish_name) DESC",
+)
+
+_FIND_FOOD_LOGS_PLAIN_SQL = _FIND_FOOD_LOGS_SQL.format(
+    match="dish_name ILIKE %(pattern)s",
+    rank="strpos(lower(dish_name), lower(%(query)s))",
+)
+
+_HAS_TRGM_SQL = "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS installed"
+
+# Installed extensions as of the last check, with the time it was made.
+# migrate() clears this, and an answer is re-checked after
+# EXTENSION_RECHECK_SECONDS, so an extension created by another replica's
+# migration or by hand is picked up without a restart.
+EXTENSION_RECHECK_SECONDS = 600
+_extensions: dict[str, tuple[bool, float]] = {}
+
+# Keyset on id: cleared rows stay in the index until vacuum, so scanning from
+# the start every batch would make the whole move quadratic.
+_SELECT_LEGACY_TRANSCRIPTS_SQL = """
+    SELECT id, raw_ai_response FROM food_logs
+    WHERE id > %(after)s AND raw_ai_response IS NOT NULL
+    ORDER BY id
+    LIMIT %(limit)s
+    FOR UPDATE
+"""
+
+# Stores a batch of compressed bodies and clears the legacy column in one statement.
+_MOVE_LEGACY_TRANSCRIPTS_SQL = """
+    WITH moved AS (
+        INSERT INTO food_log_transcripts (food_log_id, body)
+        SELECT * FROM unnest(%(ids)s::bigint[], %(bodies)s::bytea[])
+        ON CONFLICT (food_log_id) DO NOTHING
+    )
+    UPDATE food_logs SET raw_ai_response = NULL WHERE id = ANY(%(ids)s)
+"""
+
+_MIGRATE_TRANSCRIPTS_JOB = "migrate_raw_ai_responses"
+
+_LOAD_CHECKPOINT_SQL = "SELECT position FROM maintenance_checkpoints WHERE job = %(job)s"
+
+_SAVE_CHECKPOINT_SQL = """
+    INSERT INTO maintenance_checkpoints (job, position) VALUES (%(job)s, %(position)s)
+    ON CONFLICT (job) DO UPDATE SET position = EXCLUDED.position, updated_at = NOW()
+"""
+
+_GET_DAILY_TOTALS_SQL = f"""
+    SELECT calories, protein, fat, carbs, entries FROM food_daily_totals
+    WHERE user_id = {_INTERNAL_ID_SUBQUERY} AND log_date = CURRENT_DATE
+"""
+
+# The per-day rollup rows behind /week and /month: at most %(days)s rows read
+# from the food_daily_totals primary key, never food_logs. The window ends on
+# the database's CURRENT_DATE, which every row carries as today (a single row
+# of NULLs when no day has meals), so the report labels the window it read.
+_GET_DAILY_SERIES_SQL = f"""
+    SELECT w.today, t.log_date, t.calories, t.protein, t.fat, t.carbs, t.entries
+    FROM (SELECT CURRENT_DATE AS today) w
+    LEFT JOIN food_daily_totals t
+        ON t.user_id = {_INTERNAL_ID_SUBQUERY} AND t.log_date > w.today - %(days)s::int AND t.log_date <= w.today
+    ORDER BY t.log_date
+"""
+
+# Everything a /history page renders, in one statement: window totals from the
+# daily rollup plus the display columns of one page of meals, keyset-paginated
+# over (log_date, eaten_at, id) newest first: the column order of
+# idx_food_logs_user_date_eaten, so a page is a bounded index-only range scan
+# with no sort. "older" continues after a cursor, "newer" walks back before it
+# (fetched in ascending order, then re-sorted). The exact window uses
+# CURRENT_DATE; the constant prune_from/prune_to bounds (a day wider on each
+# side, for clock skew between bot and server) let the planner drop the other
+# partitions at plan time. Without them it costs every partition and may sort
+# the page rather than read it in index order.
+_HISTORY_SQL = """
+    WITH target AS (SELECT id FROM users WHERE telegram_id = %(telegram_id)s)
+    SELECT
+        (
+            SELECT json_build_object(
+                'calories', COALESCE(SUM(calories), 0),
+                'protein', COALESCE(SUM(protein), 0),
+                'fat', COALESCE(SUM(fat), 0),
+                'carbs', COALESCE(SUM(carbs), 0),
+                'entries', COALESCE(SUM(entries), 0)
             )
-        conn.commit()
+            FROM food_daily_totals
+            WHERE user_id = (SELECT id FROM target) AND log_date > CURRENT_DATE - %(days)s::int
+        ) AS totals,
+        (
+            SELECT COALESCE(json_agg(item ORDER BY item.log_date {order}, item.eaten_at {order}, item.id {order}), '[]'::json)
+            FROM (
+                SELECT id, eaten_at, log_date, dish_name, calories, protein, fat, carbs
+                FROM food_logs
+                WHERE user_id = (SELECT id FROM target)
+                  AND log_date > CURRENT_DATE - %(days)s::int AND log_date <= CURRENT_DATE
+                  AND log_date BETWEEN %(prune_from)s AND %(prune_to)s
+                  AND {keyset}
+                ORDER BY log_date {order}, eaten_at {order}, id {order}
+                LIMIT %(limit)s
+            ) AS item
+        ) AS items
+"""
+
+_GET_HISTORY_SQL = {
+    None: _HISTORY_SQL.format(keyset="TRUE", order="DESC"),
+    "older": _HISTORY_SQL.format(keyset="(log_date, eaten_at, id) < (%(log_date)s, %(eaten_at)s, %(id)s)", order="DESC"),
+    "newer": _HISTORY_SQL.format(keyset="(log_date, eaten_at, id) > (%(log_date)s, %(eaten_at)s, %(id)s)", order="ASC"),
+}
+
+# {scope} is a trusted SQL predicate on food_logs: TRUE or a single user's id.
+_REBUILD_DAILY_TOTALS_SQL = """
+    INSERT INTO food_daily_totals (user_id, log_date, calories, protein, fat, carbs, entries)
+    SELECT user_id, log_date, SUM(calories), SUM(protein), SUM(fat), SUM(carbs), COUNT(*)
+    FROM food_logs
+    WHERE {scope}
+    GROUP BY user_id, log_date
+"""
+
+# prune_to is the constant upper bound for partition pruning, as in _HISTORY_SQL.
+_GET_FOOD_LOGS_SQL = f"""
+    SELECT id, user_id, eaten_at, log_date, dish_name, calories, protein, fat, carbs, source, created_at
+    FROM food_logs
+    WHERE user_id = {_INTERNAL_ID_SUBQUERY} AND log_date >= %(start_date)s AND log_date <= CURRENT_DATE
+      AND log_date <= %(prune_to)s
+    ORDER BY log_date DESC, eaten_at DESC, id DESC
+"""
+
+_CONSUME_PHOTO_QUOTA_SQL = """
+    INSERT INTO users (telegram_id, photo_limit_date, photo_count_today)
+    VALUES (%(telegram_id)s, CURRENT_DATE, 1)
+    ON CONFLICT (telegram_id) DO UPDATE
+    SET photo_limit_date = CURRENT_DATE,
+        photo_count_today = CASE
+            WHEN users.photo_limit_date = CURRENT_DATE THEN users.photo_count_today + 1
+            ELSE 1
+        END,
+        updated_at = NOW()
+    WHERE users.photo_limit_date IS DISTINCT FROM CURRENT_DATE OR users.photo_count_today < %(limit)s
+    RETURNING photo_count_today
+"""
+
+_COUNT_PHOTO_LOGS_TODAY_SQL = f"""
+    SELECT COUNT(*) AS cnt FROM food_logs
+    WHERE user_id = {_INTERNAL_ID_SUBQUERY} AND log_date = CURRENT_DATE AND source = 'photo'
+"""
+
+# Records a payment and extends the subscription in one statement. The user
+# row is locked first, so concurrent payments of one user serialize and each
+# extends the end written by the previous one. A replayed
+# telegram_payment_charge_id hits the unique index and changes nothing; the
+# caller gets the current subscription end back instead. user_id is NULL when
+# the users row does not exist yet.
+_ACTIVATE_PAYMENT_SQL = """
+    WITH locked AS (
+        SELECT id, subscription_end FROM users
+        WHERE telegram_id = %(telegram_id)s
+        FOR UPDATE
+    ),
+    payment AS (
+        INSERT INTO payments (
+            user_id, telegram_payment_charge_id, provider_payment_charge_id,
+            currency, total_amount, payload, status, raw_payment
+        )
+        SELECT id, %(telegram_payment_charge_id)s, %(provider_payment_charge_id)s,
+            %(currency)s, %(total_amount)s, %(payload)s, %(status)s, %(raw_payment)s::jsonb
+        FROM locked
+        ON CONFLICT (telegram_payment_charge_id) DO NOTHING
+        RETURNING id
+    ),
+    activated AS (
+        UPDATE users
+        SET subscription_end = GREATEST(locked.subscription_end, NOW()) + make_interval(days => %(days)s),
+            trial_used = TRUE,
+            user_type = 'pro',
+            updated_at = NOW()
+        FROM locked, payment
+        WHERE users.id = locked.id
+        RETURNING users.id, GREATEST(locked.subscription_end, NOW()) AS starts_at, users.subscription_end AS ends_at
+    ),
+    subscription AS (
+        INSERT INTO subscriptions (user_id, payment_id, starts_at, ends_at, status)
+        SELECT activated.id, payment.id, activated.starts_at, activated.ends_at, 'active'
+        FROM activated, payment
+    )
+    SELECT
+        (SELECT id FROM locked) AS user_id,
+        (SELECT id FROM payment) AS payment_id,
+        COALESCE((SELECT ends_at FROM activated), (SELECT subscription_end FROM locked)) AS ends_at
+"""
+
+# Redeems a promo code in one statement. The sender's row is locked first, so
+# two taps from the same user serialize and the second sees the code in
+# used_promos; the promo_codes row lock then serializes the usage cap. The
+# last SELECT also reports why nothing was redeemed.
+_REDEEM_PROMO_SQL = """
+    WITH locked AS (
+        SELECT id, used_promos, subscription_end FROM users
+        WHERE telegram_id = %(telegram_id)s
+        FOR UPDATE
+    ),
+    promo AS (
+        UPDATE promo_codes SET uses = uses + 1
+        WHERE code = %(code)s
+          AND (expires_at IS NULL OR expires_at > NOW())
+          AND (max_uses IS NULL OR uses < max_uses)
+          AND EXISTS (SELECT 1 FROM locked WHERE NOT (%(code)s = ANY(used_promos)))
+        RETURNING days
+    ),
+    redeemed AS (
+        UPDATE users
+        SET used_promos = array_append(users.used_promos, %(code)s),
+            subscription_end = GREATEST(locked.subscription_end, NOW()) + make_interval(days => promo.days),
+            trial_used = TRUE,
+            user_type = 'pro',
+            updated_at = NOW()
+        FROM locked, promo
+        WHERE users.id = locked.id
+        RETURNING users.id, GREATEST(locked.subscription_end, NOW()) AS starts_at, users.subscription_end AS ends_at
+    ),
+    subscription AS (
+        INSERT INTO subscriptions (user_id, starts_at, ends_at, status)
+        SELECT id, starts_at, ends_at, 'active' FROM redeemed
+    )
+    SELECT
+        (SELECT ends_at FROM redeemed) AS ends_at,
+        p.days,
+        COALESCE((SELECT %(code)s = ANY(used_promos) FROM locked), FALSE) AS already_used,
+        p.expires_at IS NOT NULL AND p.expires_at <= NOW() AS expired
+    FROM (SELECT 1) AS one
+    LEFT JOIN promo_codes p ON p.code = %(code)s
+"""
 
 
 def ensure_user(user_id: int, tg_user: Any | None = None) -> None:
-    username = getattr(tg_user, "username", None) if tg_user else None
-    first_name = getattr(tg_user, "first_name", None) if tg_user else None
-    last_name = getattr(tg_user, "last_name", None) if tg_user else None
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO users (telegram_id, username, first_name, last_name)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (telegram_id) DO UPDATE SET
-                    username = COALESCE(EXCLUDED.username, users.username),
-                    first_name = COALESCE(EXCLUDED.first_name, users.first_name),
-                    last_name = COALESCE(EXCLUDED.last_name, users.last_name),
-                    updated_at = NOW()
-                """,
-                (user_id, username, first_name, last_name),
-            )
-        conn.commit()
+            cur.execute(_ENSURE_USER_SQL, _ensure_user_params(user_id, tg_user))
+    user_cache.mark_written(user_id)
+
 
+def load_user_context(user_id: int, tg_user: Any | None = None) -> dict:
+    cached = _cached_context(user_id, tg_user)
+    if cached is not None:
+        return cached
+    return _fetch_user_context(user_id, tg_user)
 
-def get_user(user_id: int) -> dict | None:
+
+def _fetch_user_context(user_id: int, tg_user: Any | None = None) -> dict:
+    loaded_at = user_cache.now()
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE telegram_id = %s", (user_id,))
+            row = None
+            # A first-ever update racing another one for the same user can miss
+            # the concurrently inserted row in its snapshot; a retry sees it.
+            for _ in range(2):
+                cur.execute(_LOAD_USER_CONTEXT_SQL, _ensure_user_params(user_id, tg_user))
+                row = cur.fetchone()
+                if row:
+                    break
+    return _remember_context(user_id, _user_context_from_row(row), loaded_at)
+
+
+def get_user(user_id: int) -> User | None:
+    cached = user_cache.contexts.get(user_id)
+    if cached is not None:
+        return cached["user"]
+    with get_read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute(_GET_USER_SQL, {"telegram_id": user_id})
             user = cur.fetchone()
     if not user:
         return None
-    return _normalize_user(user)
+    return User.from_row(user)
 
 
 def get_internal_user_id(user_id: int) -> int:
-    ensure_user(user_id)
-    user = get_user(user_id)
-    return int(user["id"])
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_GET_INTERNAL_USER_ID_SQL, {"telegram_id": user_id})
+            row = cur.fetchone()
+    return int(row["id"])
 
 
 def update_user(user_id: int, key: str, value: Any) -> None:
-    allowed = {"user_type", "trial_start", "trial_used", "subscription_end", "mode", "used_promos"}
-    if key not in allowed:
-        raise ValueError(f"Unsupported users field: {key}")
-    ensure_user(user_id)
+    _check_user_field(key)
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(f"UPDATE users SET {key} = %s, updated_at = NOW() WHERE telegram_id = %s", (value, user_id))
-        conn.commit()
+            cur.execute(_UPDATE_USER_SQL.format(key=key), {"telegram_id": user_id, "value": value})
+    user_cache.mark_written(user_id)
 
 
 def save_profile(user_id: int, profile: dict) -> None:
-    internal_id = get_internal_user_id(user_id)
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO user_profiles (
-                    user_id, name, age, sex, height_cm, weight_kg, goal, activity_factor,
-                    food_restrictions, daily_calories, daily_protein, daily_fat, daily_carbs,
-                    onboarding_completed
-                ) VALUES (%(user_id)s, %(name)s, %(age)s, %(sex)s, %(height_cm)s, %(weight_kg)s,
-                    %(goal)s, %(activity_factor)s, %(food_restrictions)s, %(daily_calories)s,
-                    %(daily_protein)s, %(daily_fat)s, %(daily_carbs)s, TRUE)
-                ON CONFLICT (user_id) DO UPDATE SET
-                    name = EXCLUDED.name,
-                    age = EXCLUDED.age,
-                    sex = EXCLUDED.sex,
-                    height_cm = EXCLUDED.height_cm,
-                    weight_kg = EXCLUDED.weight_kg,
-                    goal = EXCLUDED.goal,
-                    activity_factor = EXCLUDED.activity_factor,
-                    food_restrictions = EXCLUDED.food_restrictions,
-                    daily_calories = EXCLUDED.daily_calories,
-                    daily_protein = EXCLUDED.daily_protein,
-                    daily_fat = EXCLUDED.daily_fat,
-                    daily_carbs = EXCLUDED.daily_carbs,
-                    onboarding_completed = TRUE,
-                    updated_at = NOW()
-                """,
-                {"user_id": internal_id, **profile},
-            )
-        conn.commit()
+            cur.execute(_SAVE_PROFILE_SQL, {"telegram_id": user_id, **profile})
+    user_cache.mark_written(user_id)
 
 
-def get_profile(user_id: int) -> dict | None:
-    internal_id = get_internal_user_id(user_id)
-    with get_conn() as conn:
+def get_profile(user_id: int) -> Profile | None:
+    cached = user_cache.contexts.get(user_id)
+    if cached is not None:
+        return cached["profile"]
+    with get_read_conn(user_id) as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT * FROM user_profiles WHERE user_id = %s", (internal_id,))
-            return cur.fetchone()
+            cur.execute(_GET_PROFILE_SQL, {"telegram_id": user_id})
+            return Profile.from_row(cur.fetchone())
 
 
-def add_food_log(user_id: int, dish_name: str, calories: float, protein: float, fat: float, carbs: float, raw_ai_response: str, source: str) -> int:
-    internal_id = get_internal_user_id(user_id)
+def add_food_log(
+    user_id: int, dish_name: str, calories: float, protein: float, fat: float, carbs: float, raw_ai_response: str, source: str, eaten_at: datetime | None = None, client_key: str | None = None
+) -> int:
+    params = _food_log_params(user_id, dish_name, calories, protein, fat, carbs, raw_ai_response, source, eaten_at, client_key)
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO food_logs (user_id, dish_name, calories, protein, fat, carbs, raw_ai_response, source)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-                """,
-                (internal_id, dish_name, calories, protein, fat, carbs, raw_ai_response, source),
-            )
+            cur.execute(_ADD_FOOD_LOG_SQL, params)
             row = cur.fetchone()
-        conn.commit()
+    user_cache.mark_written(user_id, invalidate_context=False)
     return int(row["id"])
 
 
-def get_food_logs(user_id: int, days: int = 1) -> list[dict]:
-    internal_id = get_internal_user_id(user_id)
-    start_date = date.today() - timedelta(days=max(days, 1) - 1)
+def add_food_logs(entries: list[dict]) -> list[int]:
+    """Insert several meals, each given as add_food_log keyword arguments.
+
+    All rows go in one transaction and one round trip; returns their ids in order.
+    A meal whose client_key is already stored is skipped and keeps its id.
+    """
+    if not entries:
+        return []
     with get_conn() as conn:
+        # A cursor per row: executemany(returning=True) would flush the pipeline
+        # and wait for the inserts before COMMIT is even queued.
+        with conn.pipeline():
+            conn.execute("BEGIN")
+            cursors = [conn.execute(_ADD_FOOD_LOG_SQL, _food_log_params(**entry)) for entry in entries]
+            conn.execute("COMMIT")
+        ids = [int(cur.fetchone()["id"]) for cur in cursors]
+    for user_id in {entry["user_id"] for entry in entries}:
+        user_cache.mark_written(user_id, invalidate_context=False)
+    return ids
+
+
+def get_food_logs(user_id: int, days: int = 1) -> list[dict]:
+    with get_read_conn(user_id) as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT * FROM food_logs
-                WHERE user_id = %s AND log_date >= %s
-                ORDER BY eaten_at DESC, id DESC
-                """,
-                (internal_id, start_date),
-            )
+            cur.execute(_GET_FOOD_LOGS_SQL, _food_logs_params(user_id, days))
             return cur.fetchall()
 
 
+def get_food_log_transcript(log_id: int) -> str | None:
+    with get_read_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_GET_FOOD_LOG_TRANSCRIPT_SQL, {"log_id": log_id})
+            return _transcript_from_row(cur.fetchone())
+
+
+def find_food_logs(user_id: int, text: str, limit: int = 10, offset: int = 0) -> dict:
+    """Meals whose dish name matches text, best match first: {"items", "has_more"}."""
+    with get_read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            if _extension_check_due("pg_trgm"):
+                cur.execute(_HAS_TRGM_SQL)
+                _remember_extension("pg_trgm", cur.fetchone()["installed"])
+            cur.execute(_find_sql(), _find_params(user_id, text, limit, offset))
+            return _find_result(cur.fetchall(), limit)
+
+
+def migrate_raw_ai_responses(batch_size: int = 500, restart: bool = False) -> int:
+    """Move legacy food_logs.raw_ai_response values into food_log_transcripts.
+
+    Each batch is its own short transaction holding row locks on at most
+    batch_size rows, so the bot keeps writing while this runs. The last moved
+    id is committed with each batch in maintenance_checkpoints, so a re-run
+    resumes there (restart=True starts from the first row). Returns the
+    number of rows moved.
+    """
+    params = {"job": _MIGRATE_TRANSCRIPTS_JOB}
+    with get_conn() as conn:
+        row = None if restart else conn.execute(_LOAD_CHECKPOINT_SQL, params).fetchone()
+    after = int(row["position"]) if row else 0
+    moved = 0
+    while True:
+        with get_conn() as conn, conn.pipeline(), conn.cursor() as cur:
+            cur.execute("BEGIN")
+            cur.execute(_SELECT_LEGACY_TRANSCRIPTS_SQL, {"after": after, "limit": batch_size})
+            rows = cur.fetchall()
+            if rows:
+                ids = [row["id"] for row in rows]
+                bodies = [_compress_transcript(row["raw_ai_response"]) for row in rows]
+                cur.execute(_MOVE_LEGACY_TRANSCRIPTS_SQL, {"ids": ids, "bodies": bodies})
+                cur.execute(_SAVE_CHECKPOINT_SQL, {**params, "position": ids[-1]})
+            cur.execute("COMMIT")
+        if not rows:
+            return moved
+        moved += len(rows)
+        after = ids[-1]
+
+
+def get_daily_totals(user_id: int) -> dict:
+    with get_read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute(_GET_DAILY_TOTALS_SQL, {"telegram_id": user_id})
+            return _daily_totals(cur.fetchone())
+
+
+def get_daily_series(user_id: int, days: int) -> dict:
+    """Daily totals for the last days days up to the database's today: {"today", "days"}.
+
+    "days" is oldest first; days without meals are absent.
+    """
+    with get_read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute(_GET_DAILY_SERIES_SQL, {"telegram_id": user_id, "days": max(days, 1)})
+            return _daily_series(cur.fetchall())
+
+
+def get_history(
+    user_id: int, days: int, limit: int = 20, cursor: tuple[date, datetime, int] | None = None, direction: str | None = None
+) -> dict:
+    """One page of the user's meals, newest first: {"totals", "items", "has_older", "has_newer"}.
+
+    cursor is the (log_date, eaten_at, id) of the first or last item of the current
+    page and direction is "older" or "newer"; without them, the first page.
+    """
+    with get_read_conn(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute(_history_sql(cursor, direction), _history_params(user_id, days, limit, cursor))
+            return _history(cur.fetchone(), limit, direction)
+
+
+def rebuild_daily_totals(user_id: int | None = None) -> None:
+    """Recompute food_daily_totals from food_logs, for one user or everyone.
+
+    Also serves as the backfill. The table lock makes concurrent add_food_log
+    calls wait and apply their increment on top of the rebuilt rows.
+    """
+    scope = f"user_id = {_INTERNAL_ID_SUBQUERY}" if user_id is not None else "TRUE"
+    params = {"telegram_id": user_id}
+    with get_conn() as conn:
+        # One round trip; the pool rolls back if any statement fails.
+        with conn.pipeline(), conn.cursor() as cur:
+            cur.execute("BEGIN")
+            cur.execute("LOCK TABLE food_daily_totals IN EXCLUSIVE MODE")
+            cur.execute(f"DELETE FROM food_daily_totals WHERE {scope}", params)
+            cur.execute(_REBUILD_DAILY_TOTALS_SQL.format(scope=scope), params)
+            cur.execute("COMMIT")
+
+
 def consume_photo_quota(user_id: int, limit: int) -> tuple[bool, int]:
-    ensure_user(user_id)
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                UPDATE users
-                SET photo_limit_date = CURRENT_DATE,
-                    photo_count_today = CASE
-                        WHEN photo_limit_date = CURRENT_DATE THEN photo_count_today + 1
-                        ELSE 1
-                    END,
-                    updated_at = NOW()
-                WHERE telegram_id = %s
-                  AND (photo_limit_date IS DISTINCT FROM CURRENT_DATE OR photo_count_today < %s)
-                RETURNING photo_count_today
-                """,
-                (user_id, limit),
-            )
+            cur.execute(_CONSUME_PHOTO_QUOTA_SQL, {"telegram_id": user_id, "limit": limit})
             row = cur.fetchone()
-        conn.commit()
-    if not row:
-        return False, limit
-    return True, int(row["photo_count_today"])
+    user_cache.mark_written(user_id)
+    return _photo_quota_result(row, limit)
 
 
 def count_photo_logs_today(user_id: int) -> int:
-    internal_id = get_internal_user_id(user_id)
-    with get_conn() as conn:
+    with get_read_conn(user_id) as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT COUNT(*) AS cnt FROM food_logs WHERE user_id = %s AND log_date = CURRENT_DATE AND source = 'photo'",
-                (internal_id,),
-            )
+            cur.execute(_COUNT_PHOTO_LOGS_TODAY_SQL, {"telegram_id": user_id})
             row = cur.fetchone()
     return int(row["cnt"])
 
 
-def record_payment(user_id: int, payment: Any, status: str = "successful") -> int:
-    internal_id = get_internal_user_id(user_id)
-    raw = payment.to_dict() if hasattr(payment, "to_dict") else {}
-    raw_json = json.loads(json.dumps(raw, default=str))
+def activate_paid_subscription(user_id: int, payment: Any, days: int = 30) -> dict:
+    """Record a successful payment and extend PRO by days, atomically and at most once.
+
+    Returns {"payment_id", "ends_at", "duplicate"}; a replayed delivery of the
+    same charge gives duplicate=True, payment_id=None and the current end.
+    """
+    params = _payment_params(user_id, payment, "successful", days)
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO payments (
-                    user_id, telegram_payment_charge_id, provider_payment_charge_id,
-                    currency, total_amount, payload, status, raw_payment
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb)
-                RETURNING id
-                """,
-                (
-                    internal_id,
-                    getattr(payment, "telegram_payment_charge_id", None),
-                    getattr(payment, "provider_payment_charge_id", None),
-                    getattr(payment, "currency", "RUB"),
-                    getattr(payment, "total_amount", 0),
-                    getattr(payment, "invoice_payload", None),
-                    status,
-                    Jsonb(raw_json),
-                ),
-            )
+            cur.execute(_ACTIVATE_PAYMENT_SQL, params)
             row = cur.fetchone()
-        conn.commit()
-    return int(row["id"])
+            if row["user_id"] is None:
+                with conn.pipeline():
+                    cur.execute(_ENSURE_USER_SQL, _ensure_user_params(user_id, None))
+                    cur.execute(_ACTIVATE_PAYMENT_SQL, params)
+                row = cur.fetchone()
+    user_cache.mark_written(user_id)
+    return _payment_result(row)
 
 
-def activate_subscription(user_id: int, days: int = 30, payment_id: int | None = None) -> datetime:
-    internal_id = get_internal_user_id(user_id)
-    now = datetime.now(timezone.utc)
-    user = get_user(user_id)
-    current_end = _parse_dt(user.get("subscription_end")) if user else None
-    starts_at = current_end if current_end and current_end > now else now
-    ends_at = starts_at + timedelta(days=days)
+def redeem_promo_code(user_id: int, code: str) -> dict:
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO subscriptions (user_id, payment_id, starts_at, ends_at, status)
-                VALUES (%s, %s, %s, %s, 'active')
-                """,
-                (internal_id, payment_id, starts_at, ends_at),
-            )
-            cur.execute(
-                """
-                UPDATE users
-                SET subscription_end = %s, trial_used = TRUE, user_type = 'pro', updated_at = NOW()
-                WHERE telegram_id = %s
-                """,
-                (ends_at, user_id),
-            )
-        conn.commit()
-    return ends_at
+            cur.execute(_REDEEM_PROMO_SQL, {"telegram_id": user_id, "code": code})
+            row = cur.fetchone()
+    user_cache.mark_written(user_id)
+    return _promo_result(row)
 
 
-def is_trial_active(user: dict) -> bool:
-    if not user or user.get("trial_used"):
-        return False
-    start = _parse_dt(user.get("trial_start"))
-    return bool(start and datetime.now(timezone.utc) - start < timedelta(days=3))
+def _ensure_user_params(user_id: int, tg_user: Any | None) -> dict:
+    return {
+        "telegram_id": user_id,
+        "username": getattr(tg_user, "username", None) if tg_user else None,
+        "first_name": getattr(tg_user, "first_name", None) if tg_user else None,
+        "last_name": getattr(tg_user, "last_name", None) if tg_user else None,
+    }
 
 
-def is_subscription_active(user: dict) -> bool:
-    if not user:
-        return False
-    end = _parse_dt(user.get("subscription_end"))
-    return bool(end and datetime.now(timezone.utc) < end)
+def _user_context_from_row(row: dict) -> dict:
+    user = dict(row)
+    profile = user.pop("profile", None)
+    return {"id": int(user["id"]), "user": User.from_row(user), "profile": Profile.from_row(profile)}
 
 
-def _parse_dt(value: Any) -> datetime | None:
-    if not value:
+def _cached_context(user_id: int, tg_user: Any | None) -> dict | None:
+    cached = user_cache.contexts.get(user_id)
+    if cached is None:
         return None
-    if isinstance(value, datetime):
-        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
-    parsed = datetime.fromisoformat(str(value))
-    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
-
-
-def _normalize_user(user: dict) -> dict:
-    result = dict(user)
-    for key in ("trial_start", "subscription_end", "created_at", "updated_at"):
-        if result.get(key) is not None and isinstance(result[key], datetime):
-            result[key] = result[key].isoformat()
-    result["used_promos"] = result.get("used_promos") or []
-    return result
+    # Fall through to the upsert when Telegram reports a new name to store.
+    for key, value in _ensure_user_params(user_id, tg_user).items():
+        if value is not None and getattr(cached["user"], key) != value:
+            return None
+    return cached
+
+
+# Stands in for a missing updated_at so cache versions stay comparable.
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _remember_context(user_id: int, context: dict, loaded_at: float) -> dict:
+    profile = context["profile"]
+    version = (context["user"].updated_at or _EPOCH, profile and profile.updated_at or _EPOCH)
+    user_cache.contexts.put(user_id, context, loaded_at, version)
+    return context
+
+
+def _check_user_field(key: str) -> None:
+    if key not in _USER_FIELDS:
+        raise ValueError(f"Unsupported users field: {key}")
+
+
+def _start_date(days: int) -> date:
+    return date.today() - timedelta(days=max(days, 1) - 1)
+
+
+def _food_logs_params(user_id: int, days: int) -> dict:
+    return {"telegram_id": user_id, "start_date": _start_date(days), "prune_to": date.today() + timedelta(days=1)}
+
+
+def _food_log_params(
+    user_id: int, dish_name: str, calories: float, protein: float, fat: float, carbs: float, raw_ai_response: str, source: str, eaten_at: datetime | None = None, client_key: str | None = None
+) -> dict:
+    return {
+        "telegram_id": user_id,
+        "eaten_at": eaten_at,
+        "client_key": client_key,
+        "dish_name": dish_name,
+        "calories": calories,
+        "protein": protein,
+        "fat": fat,
+        "carbs": carbs,
+        "transcript": _compress_transcript(raw_ai_response),
+        "source": source,
+    }
+
+
+def _compress_transcript(text: str | None) -> bytes | None:
+    if not text:
+        return None
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _transcript_from_row(row: dict | None) -> str | None:
+    if not row:
+        return None
+    if row["body"] is not None:
+        return zlib.decompress(row["body"]).decode("utf-8")
+    return row["raw_ai_response"]
+
+
+def _daily_totals(row: dict | None) -> dict:
+    row = row or {}
+    totals = {key: float(row.get(key) or 0) for key in ("calories", "protein", "fat", "carbs")}
+    totals["entries"] = int(row.get("entries") or 0)
+    return totals
+
+
+def _daily_series(rows: list[dict]) -> dict:
+    days = [{"log_date": row["log_date"], **_daily_totals(row)} for row in rows if row["log_date"] is not None]
+    return {"today": rows[0]["today"], "days": days}
+
+
+def _history_sql(cursor: tuple[date, datetime, int] | None, direction: str | None) -> str:
+    if cursor is None or direction not in ("older", "newer"):
+        return _GET_HISTORY_SQL[None]
+    return _GET_HISTORY_SQL[direction]
+
+
+def _history_params(user_id: int, days: int, limit: int, cursor: tuple[date, datetime, int] | None = None) -> dict:
+    log_date, eaten_at, log_id = cursor or (None, None, None)
+    return {
+        "telegram_id": user_id, "days": max(days, 1), "limit": limit + 1,
+        "log_date": log_date, "eaten_at": eaten_at, "id": log_id,
+        "prune_from": _start_date(days) - timedelta(days=1), "prune_to": date.today() + timedelta(days=1),
+    }
+
+
+def _history(row: dict, limit: int, direction: str | None = None) -> dict:
+    items = [
+        {
+            **item,
+            "log_date": date.fromisoformat(item["log_date"]),
+            "eaten_at": datetime.fromisoformat(item["eaten_at"]),
+            **{key: float(item[key] or 0) for key in ("calories", "protein", "fat", "carbs")},
+        }
+        for item in row["items"]
+    ]
+    more = len(items) > limit
+    items = items[:limit]
+    if direction == "newer":
+        # Fetched oldest first so that LIMIT keeps the rows next to the cursor.
+        items.reverse()
+        return {"totals": _daily_totals(row["totals"]), "items": items, "has_older": True, "has_newer": more}
+    return {"totals": _daily_totals(row["totals"]), "items": items, "has_older": more, "has_newer": direction == "older"}
+
+
+def _extension_check_due(name: str) -> bool:
+    checked = _extensions.get(name)
+    return checked is None or user_cache.now() - checked[1] >= EXTENSION_RECHECK_SECONDS
+
+
+def _remember_extension(name: str, installed: bool) -> None:
+    _extensions[name] = (installed, user_cache.now())
+
+
+def _find_sql() -> str:
+    installed, _ = _extensions.get("pg_trgm", (False, 0.0))
+    return _FIND_FOOD_LOGS_TRGM_SQL if installed else _FIND_FOOD_LOGS_PLAIN_SQL
+
+
+def _find_params(user_id: int, text: str, limit: int, offset: int) -> dict:
+    query = text.strip()
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    # One extra row tells the caller whether there is a next page.
+    return {"telegram_id": user_id, "query": query, "pattern": f"%{escaped}%", "limit": limit + 1, "offset": max(offset, 0)}
+
+
+def _find_result(rows: list[dict], limit: int) -> dict:
+    items = [
+        {**row, **{key: float(row[key] or 0) for key in ("calories", "protein", "fat", "carbs")}}
+        for row in rows[:limit]
+    ]
+    return {"items": items, "has_more": len(rows) > limit}
+
+
+def _photo_quota_result(row: dict | None, limit: int) -> tuple[bool, int]:
+    if not row:
+        return False, limit
+    return True, int(row["photo_count_today"])
+
+
+def _promo_result(row: dict) -> dict:
+    """{"status": "ok" | "used" | "unknown" | "expired" | "exhausted", "days", "ends_at"}."""
+    if row["ends_at"] is not None:
+        status = "ok"
+    elif row["already_used"]:
+        status = "used"
+    elif row["days"] is None:
+        status = "unknown"
+    elif row["expired"]:
+        status = "expired"
+    else:
+        status = "exhausted"
+    return {"status": status, "days": row["days"], "ends_at": row["ends_at"]}
+
+
+def _payment_params(user_id: int, payment: Any, status: str, days: int) -> dict:
+    raw = payment.to_dict() if hasattr(payment, "to_dict") else {}
+    raw_json = json.loads(json.dumps(raw, default=str))
+    return {
+        "telegram_id": user_id,
+        "telegram_payment_charge_id": getattr(payment, "telegram_payment_charge_id", None),
+        "provider_payment_charge_id": getattr(payment, "provider_payment_charge_id", None),
+        "currency": getattr(payment, "currency", "RUB"),
+        "total_amount": getattr(payment, "total_amount", 0),
+        "payload": getattr(payment, "invoice_payload", None),
+        "status": status,
+        "raw_payment": Jsonb(raw_json),
+        "days": days,
+    }
+
+
+def _payment_result(row: dict) -> dict:
+    return {"payment_id": row["payment_id"], "ends_at": row["ends_at"], "duplicate": row["payment_id"] is None}
+
+
+def is_trial_active(user: User | None) -> bool:
+    return bool(user) and user.trial_active
+
+
+def is_subscription_active(user: User | None) -> bool:
+    return bool(user) and user.subscription_active
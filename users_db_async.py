@@ -0,0 +1,290 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Any
+
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+import user_cache
+from records import Profile, User
+from users_db import (
+    _ACTIVATE_PAYMENT_SQL,
+    _ADD_FOOD_LOG_SQL,
+    _CONSUME_PHOTO_QUOTA_SQL,
+    _COUNT_PHOTO_LOGS_TODAY_SQL,
+    _ENSURE_USER_SQL,
+    _GET_DAILY_SERIES_SQL,
+    _GET_DAILY_TOTALS_SQL,
+    _GET_FOOD_LOGS_SQL,
+    _GET_FOOD_LOG_TRANSCRIPT_SQL,
+    _GET_INTERNAL_USER_ID_SQL,
+    _GET_PROFILE_SQL,
+    _GET_USER_SQL,
+    _HAS_TRGM_SQL,
+    _LOAD_USER_CONTEXT_SQL,
+    _REDEEM_PROMO_SQL,
+    _SAVE_PROFILE_SQL,
+    _UPDATE_USER_SQL,
+    _cached_context,
+    _check_user_field,
+    _daily_series,
+    _daily_totals,
+    _database_url,
+    _ensure_user_params,
+    _extension_check_due,
+    _find_params,
+    _find_result,
+    _find_sql,
+    _history,
+    _history_params,
+    _history_sql,
+    _food_log_params,
+    _food_logs_params,
+    _payment_params,
+    _payment_result,
+    _photo_quota_result,
+    _promo_result,
+    _pool_settings,
+    _remember_context,
+    _remember_extension,
+    _replica_url,
+    _transcript_from_row,
+    _user_context_from_row,
+)
+
+# Async twin of users_db for the PTB handlers: same SQL and return values, but
+# queries await on an AsyncConnectionPool so a slow query only stalls its own update.
+
+_pool: AsyncConnectionPool | None = None
+_replica_pool: AsyncConnectionPool | None = None
+_pool_lock = asyncio.Lock()
+
+
+async def _open_pool(conninfo: str, name: str) -> AsyncConnectionPool:
+    pool = AsyncConnectionPool(
+        conninfo,
+        kwargs={"row_factory": dict_row, "autocommit": True},
+        check=AsyncConnectionPool.check_connection,
+        name=name,
+        open=False,
+        **_pool_settings(),
+    )
+    await pool.open()
+    return pool
+
+
+async def get_pool() -> AsyncConnectionPool:
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await _open_pool(_database_url(), "users_db_async")
+        return _pool
+
+
+async def get_replica_pool() -> AsyncConnectionPool | None:
+    global _replica_pool
+    url = _replica_url()
+    if not url:
+        return None
+    async with _pool_lock:
+        if _replica_pool is None:
+            _replica_pool = await _open_pool(url, "users_db_async_replica")
+        return _replica_pool
+
+
+async def close_pool() -> None:
+    global _pool, _replica_pool
+    async with _pool_lock:
+        for pool in (_pool, _replica_pool):
+            if pool is not None:
+                await pool.close()
+        _pool = _replica_pool = None
+
+
+@asynccontextmanager
+async def get_conn():
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def get_read_conn(user_id: int | None = None):
+    # Same routing as users_db.get_read_conn.
+    pool = None if user_cache.wrote_recently(user_id) else await get_replica_pool()
+    async with (pool or await get_pool()).connection() as conn:
+        yield conn
+
+
+async def ensure_user(user_id: int, tg_user: Any | None = None) -> None:
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_ENSURE_USER_SQL, _ensure_user_params(user_id, tg_user))
+    user_cache.mark_written(user_id)
+
+
+async def load_user_context(user_id: int, tg_user: Any | None = None) -> dict:
+    cached = _cached_context(user_id, tg_user)
+    if cached is not None:
+        return cached
+    return await _fetch_user_context(user_id, tg_user)
+
+
+async def _fetch_user_context(user_id: int, tg_user: Any | None = None) -> dict:
+    loaded_at = user_cache.now()
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            row = None
+            for _ in range(2):
+                await cur.execute(_LOAD_USER_CONTEXT_SQL, _ensure_user_params(user_id, tg_user))
+                row = await cur.fetchone()
+                if row:
+                    break
+    return _remember_context(user_id, _user_context_from_row(row), loaded_at)
+
+
+async def get_user(user_id: int) -> User | None:
+    cached = user_cache.contexts.get(user_id)
+    if cached is not None:
+        return cached["user"]
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_GET_USER_SQL, {"telegram_id": user_id})
+            user = await cur.fetchone()
+    if not user:
+        return None
+    return User.from_row(user)
+
+
+async def get_internal_user_id(user_id: int) -> int:
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_GET_INTERNAL_USER_ID_SQL, {"telegram_id": user_id})
+            row = await cur.fetchone()
+    return int(row["id"])
+
+
+async def update_user(user_id: int, key: str, value: Any) -> None:
+    _check_user_field(key)
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_UPDATE_USER_SQL.format(key=key), {"telegram_id": user_id, "value": value})
+    user_cache.mark_written(user_id)
+
+
+async def save_profile(user_id: int, profile: dict) -> None:
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_SAVE_PROFILE_SQL, {"telegram_id": user_id, **profile})
+    user_cache.mark_written(user_id)
+
+
+async def get_profile(user_id: int) -> Profile | None:
+    cached = user_cache.contexts.get(user_id)
+    if cached is not None:
+        return cached["profile"]
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_GET_PROFILE_SQL, {"telegram_id": user_id})
+            return Profile.from_row(await cur.fetchone())
+
+
+async def add_food_log(
+    user_id: int, dish_name: str, calories: float, protein: float, fat: float, carbs: float, raw_ai_response: str, source: str, eaten_at: datetime | None = None, client_key: str | None = None
+) -> int:
+    params = _food_log_params(user_id, dish_name, calories, protein, fat, carbs, raw_ai_response, source, eaten_at, client_key)
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_ADD_FOOD_LOG_SQL, params)
+            row = await cur.fetchone()
+    user_cache.mark_written(user_id, invalidate_context=False)
+    return int(row["id"])
+
+
+async def get_food_logs(user_id: int, days: int = 1) -> list[dict]:
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_GET_FOOD_LOGS_SQL, _food_logs_params(user_id, days))
+            return await cur.fetchall()
+
+
+async def get_food_log_transcript(log_id: int) -> str | None:
+    async with get_read_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_GET_FOOD_LOG_TRANSCRIPT_SQL, {"log_id": log_id})
+            return _transcript_from_row(await cur.fetchone())
+
+
+async def find_food_logs(user_id: int, text: str, limit: int = 10, offset: int = 0) -> dict:
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            if _extension_check_due("pg_trgm"):
+                await cur.execute(_HAS_TRGM_SQL)
+                _remember_extension("pg_trgm", (await cur.fetchone())["installed"])
+            await cur.execute(_find_sql(), _find_params(user_id, text, limit, offset))
+            return _find_result(await cur.fetchall(), limit)
+
+
+async def get_daily_totals(user_id: int) -> dict:
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_GET_DAILY_TOTALS_SQL, {"telegram_id": user_id})
+            return _daily_totals(await cur.fetchone())
+
+
+async def get_daily_series(user_id: int, days: int) -> dict:
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_GET_DAILY_SERIES_SQL, {"telegram_id": user_id, "days": max(days, 1)})
+            return _daily_series(await cur.fetchall())
+
+
+async def get_history(
+    user_id: int, days: int, limit: int = 20, cursor: tuple[date, datetime, int] | None = None, direction: str | None = None
+) -> dict:
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_history_sql(cursor, direction), _history_params(user_id, days, limit, cursor))
+            return _history(await cur.fetchone(), limit, direction)
+
+
+async def consume_photo_quota(user_id: int, limit: int) -> tuple[bool, int]:
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_CONSUME_PHOTO_QUOTA_SQL, {"telegram_id": user_id, "limit": limit})
+            row = await cur.fetchone()
+    user_cache.mark_written(user_id)
+    return _photo_quota_result(row, limit)
+
+
+async def count_photo_logs_today(user_id: int) -> int:
+    async with get_read_conn(user_id) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_COUNT_PHOTO_LOGS_TODAY_SQL, {"telegram_id": user_id})
+            row = await cur.fetchone()
+    return int(row["cnt"])
+
+
+async def activate_paid_subscription(user_id: int, payment: Any, days: int = 30) -> dict:
+    params = _payment_params(user_id, payment, "successful", days)
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_ACTIVATE_PAYMENT_SQL, params)
+            row = await cur.fetchone()
+            if row["user_id"] is None:
+                async with conn.pipeline():
+                    await cur.execute(_ENSURE_USER_SQL, _ensure_user_params(user_id, None))
+                    await cur.execute(_ACTIVATE_PAYMENT_SQL, params)
+                row = await cur.fetchone()
+    user_cache.mark_written(user_id)
+    return _payment_result(row)
+
+
+async def redeem_promo_code(user_id: int, code: str) -> dict:
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_REDEEM_PROMO_SQL, {"telegram_id": user_id, "code": code})
+            row = await cur.fetchone()
+    user_cache.mark_written(user_id)
+    return _promo_result(row)
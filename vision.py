@@ -1,17 +1,15 @@
 import base64
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from services.ai_gateway import call, client
 
-def analyze_food(image_path):
+async def analyze_food(image_path):
 
     with open(image_path, "rb") as img:
         b64_image = base64.b64encode(img.read()).decode("utf-8")
 
-    response = client.responses.create(
+    response = await call(
+        "vision",
+        client.responses.create,
         model="gpt-4.1-mini",
         input=[
             {
@@ -1,16 +1,18 @@
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from services.ai_gateway import call, client
 
-def transcribe_voice(file_path):
+async def transcribe_voice(file_path):
 
+    # Байты, а не открытый файл: при повторе запроса файл был бы уже прочитан.
     with open(file_path, "rb") as audio_file:
-        transcript = client.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe",
-            file=audio_file
-        )
+        audio = audio_file.read()
+
+    transcript = await call(
+        "transcribe",
+        client.audio.transcriptions.create,
+        model="gpt-4o-mini-transcribe",
+        file=(os.path.basename(file_path), audio)
+    )
 
     return transcript.text
\ No newline at end of file